@@ -12,6 +12,7 @@ from esphome.const import CONF_BAUD_RATE, CONF_BROKER, CONF_LOGGER, CONF_OTA, \
     CONF_PASSWORD, CONF_PORT, CONF_ESPHOME, CONF_PLATFORMIO_OPTIONS
 from esphome.core import CORE, EsphomeError, coroutine, coroutine_with_priority
 from esphome.helpers import color, indent
+from esphome.profiler import Profiler, profile_phase
 from esphome.util import run_external_command, run_external_process, safe_print, list_yaml_files, \
     get_serial_ports
 
@@ -102,15 +103,19 @@ def run_miniterm(config, port):
                 config, line, backtrace_state=backtrace_state)
 
 
-def wrap_to_code(name, comp):
+def wrap_to_code(name, comp, dumps=None):
+    """Wrap the to_code of comp to add its config as a comment before its code.
+
+    dumps is the yaml_util.DumpCache shared by the components of the config, if any.
+    """
     coro = coroutine(comp.to_code)
 
     @functools.wraps(comp.to_code)
     @coroutine_with_priority(coro.priority)
     def wrapped(conf):
         cg.add(cg.LineComment(f"{name}:"))
-        if comp.config_schema is not None:
-            conf_str = yaml_util.dump(conf)
+        if comp.config_schema is not None and CORE.config_comments:
+            conf_str = yaml_util.dump(conf) if dumps is None else dumps.dump(conf)
             conf_str = conf_str.replace('//', '')
             cg.add(cg.LineComment(indent(conf_str)))
         yield coro(conf)
@@ -123,22 +128,55 @@ def write_cpp(config):
     return write_cpp_file()
 
 
+def _run_to_code(cache):
+    dumps_path = None
+    if CORE.yaml_cache and CORE.config_comments:
+        dumps_path = CORE.relative_config_path('.esphome', f'{CORE.config_filename}.dumps.bin')
+    dumps = yaml_util.DumpCache(dumps_path)
+    for name, component, conf in iter_components(CORE.config):
+        if component.to_code is not None:
+            coro = wrap_to_code(name, component, dumps)
+            if cache is None:
+                task = CORE.add_job(coro, conf)
+            else:
+                task = cache.add_job(name, component, conf, coro)
+            if CORE.profiler is not None:
+                CORE.profiler.add_task(task, name)
+
+    with profile_phase('flush_tasks'):
+        CORE.flush_tasks()
+    dumps.save()
+
+
 def generate_cpp_contents(config):
     _LOGGER.info("Generating C++ source...")
 
-    for name, component, conf in iter_components(CORE.config):
-        if component.to_code is not None:
-            coro = wrap_to_code(name, component)
-            CORE.add_job(coro, conf)
+    if not CORE.codegen_cache:
+        _run_to_code(None)
+        return
 
-    CORE.flush_tasks()
+    from esphome.codegen_cache import CodegenCache, CodegenCacheMismatch
+
+    cache = CodegenCache(CORE.relative_config_path('.esphome', 'codegen_cache'))
+    component_ids = set(CORE.component_ids)
+    try:
+        _run_to_code(cache)
+    except CodegenCacheMismatch as err:
+        _LOGGER.info("%s, generating the code of all components again.", err)
+        CORE.reset_codegen(component_ids)
+        cache.regenerate()
+        _run_to_code(cache)
+    _LOGGER.debug("Codegen cache: %s hits, %s misses", cache.hits, cache.misses)
+    cache.store()
+    cache.prune()
 
 
 def write_cpp_file():
-    writer.write_platformio_project()
+    with profile_phase('write_platformio_project'):
+        writer.write_platformio_project()
 
-    code_s = indent(CORE.cpp_main_section)
-    writer.write_cpp(code_s)
+    with profile_phase('write_cpp'):
+        writer.write_cpp()
     return 0
 
 
@@ -146,7 +184,8 @@ def compile_program(args, config):
     from esphome import platformio_api
 
     _LOGGER.info("Compiling app...")
-    return platformio_api.run_compile(config, CORE.verbose)
+    with profile_phase('platformio_compile', external=True):
+        return platformio_api.run_compile(config, CORE.verbose)
 
 
 def upload_using_esptool(config, port):
@@ -293,7 +332,8 @@ def command_compile(args, config):
 def command_upload(args, config):
     port = choose_upload_log_host(default=args.upload_port, check_default=None,
                                   show_ota=True, show_mqtt=False, show_api=False)
-    exit_code = upload_program(config, args, port)
+    with profile_phase('upload', external=True):
+        exit_code = upload_program(config, args, port)
     if exit_code != 0:
         return exit_code
     _LOGGER.info("Successfully uploaded program.")
@@ -303,7 +343,8 @@ def command_upload(args, config):
 def command_logs(args, config):
     port = choose_upload_log_host(default=args.serial_port, check_default=None,
                                   show_ota=False, show_mqtt=True, show_api=True)
-    return show_logs(config, args, port)
+    with profile_phase('logs', external=True):
+        return show_logs(config, args, port)
 
 
 def command_run(args, config):
@@ -316,7 +357,8 @@ def command_run(args, config):
     _LOGGER.info("Successfully compiled program.")
     port = choose_upload_log_host(default=args.upload_port, check_default=None,
                                   show_ota=True, show_mqtt=False, show_api=True)
-    exit_code = upload_program(config, args, port)
+    with profile_phase('upload', external=True):
+        exit_code = upload_program(config, args, port)
     if exit_code != 0:
         return exit_code
     _LOGGER.info("Successfully uploaded program.")
@@ -324,7 +366,8 @@ def command_run(args, config):
         return 0
     port = choose_upload_log_host(default=args.upload_port, check_default=port,
                                   show_ota=False, show_mqtt=True, show_api=True)
-    return show_logs(config, args, port)
+    with profile_phase('logs', external=True):
+        return show_logs(config, args, port)
 
 
 def command_clean_mqtt(args, config):
@@ -342,6 +385,31 @@ def command_version(args):
     return 0
 
 
+def command_size(args, config):
+    from esphome import firmware_size
+
+    if args.max_increase is not None and not args.diff:
+        _LOGGER.error("--max-increase needs --diff with the report of the build to compare with.")
+        return 1
+    report = firmware_size.size_report(CORE.firmware_elf, CORE.firmware_map,
+                                       CORE.loaded_integrations)
+    if args.json:
+        firmware_size.write_report(args.json, report)
+    if not args.diff:
+        safe_print(firmware_size.format_report(report))
+        return 0
+    diff = firmware_size.diff_reports(firmware_size.read_report(args.diff), report)
+    safe_print(firmware_size.format_diff(diff))
+    if args.max_increase is not None:
+        grown = {region: size for region, size in diff['regions'].items()
+                 if size > args.max_increase}
+        if grown:
+            _LOGGER.error("The firmware grew by more than %s bytes: %s", args.max_increase,
+                          ', '.join(f'{region} +{size}' for region, size in grown.items()))
+            return 1
+    return 0
+
+
 def command_clean(args, config):
     try:
         writer.clean_build()
@@ -416,6 +484,7 @@ POST_CONFIG_ACTIONS = {
     'clean-mqtt': command_clean_mqtt,
     'mqtt-fingerprint': command_mqtt_fingerprint,
     'clean': command_clean,
+    'size': command_size,
 }
 
 
@@ -426,6 +495,29 @@ def parse_args(argv):
     parser.add_argument('-q', '--quiet', help="Disable all esphome logs.",
                         action='store_true')
     parser.add_argument('--dashboard', help=argparse.SUPPRESS, action='store_true')
+    parser.add_argument('--no-yaml-cache', help="Do not cache parsed YAML files and dumped "
+                                                "configs in the .esphome directory.",
+                        action='store_true')
+    parser.add_argument('--compact-locations', help="Keep track of YAML source locations in a "
+                                                    "compact table instead of on the loaded "
+                                                    "values, uses less memory.",
+                        action='store_true')
+    parser.add_argument('--codegen-cache', help="Cache the code generated by components in "
+                                                "the .esphome directory (experimental).",
+                        action='store_true')
+    parser.add_argument('--no-config-comments', help="Do not add the config of every component "
+                                                     "as a comment to the generated main.cpp.",
+                        action='store_true')
+    parser.add_argument('--reproducible', help="Replace the compilation time in the firmware "
+                                               "with a hash of the generated sources, so the "
+                                               "same config generates the same sources.",
+                        action='store_true')
+    parser.add_argument('--profile', help="Write the wall and CPU time of every phase and "
+                                          "component to the .esphome directory.",
+                        action='store_true')
+    parser.add_argument('--profile-python', help="Like --profile, and also write a cProfile "
+                                                 "dump of the Python code.",
+                        action='store_true')
     parser.add_argument('-s', '--substitution', nargs=2, action='append',
                         help='Add a substitution', metavar=('key', 'value'))
     parser.add_argument('configuration', help='Your YAML configuration file.', nargs='*')
@@ -481,6 +573,15 @@ def parse_args(argv):
 
     subparsers.add_parser('clean', help="Delete all temporary build files.")
 
+    parser_size = subparsers.add_parser('size', help="Show the flash and RAM every component "
+                                                     "uses in the compiled firmware.")
+    parser_size.add_argument('--json', help="Also write the report as JSON to this file.")
+    parser_size.add_argument('--diff', help="Show the change from the JSON report of another "
+                                            "build.")
+    parser_size.add_argument('--max-increase', type=int, metavar='BYTES',
+                             help="With --diff, fail if a memory region grew by more than "
+                                  "this many bytes.")
+
     dashboard = subparsers.add_parser('dashboard',
                                       help="Create a simple web server for a dashboard.")
     dashboard.add_argument("--port", help="The HTTP port to open connections on. Defaults to 6052.",
@@ -510,6 +611,11 @@ def parse_args(argv):
 def run_esphome(argv):
     args = parse_args(argv)
     CORE.dashboard = args.dashboard
+    CORE.yaml_cache = not args.no_yaml_cache
+    CORE.compact_locations = args.compact_locations
+    CORE.codegen_cache = args.codegen_cache
+    CORE.config_comments = not args.no_config_comments
+    CORE.reproducible = args.reproducible
 
     setup_log(args.verbose, args.quiet)
     if args.command != 'version' and not args.configuration:
@@ -532,19 +638,15 @@ def run_esphome(argv):
         CORE.config_path = conf_path
         CORE.dashboard = args.dashboard
 
-        config = read_config(dict(args.substitution) if args.substitution else {})
-        if config is None:
-            return 1
-        CORE.config = config
-
-        if args.command not in POST_CONFIG_ACTIONS:
-            safe_print(f"Unknown command {args.command}")
-
+        if args.profile or args.profile_python:
+            CORE.profiler = Profiler(args.command, python=args.profile_python)
+        rc = 1
         try:
-            rc = POST_CONFIG_ACTIONS[args.command](args, config)
-        except EsphomeError as e:
-            _LOGGER.error(e)
-            return 1
+            rc = _run_config_command(args)
+        finally:
+            if CORE.profiler is not None:
+                CORE.profiler.save(rc)
+                CORE.profiler = None
         if rc != 0:
             return rc
 
@@ -552,6 +654,24 @@ def run_esphome(argv):
     return 0
 
 
+def _run_config_command(args):
+    with profile_phase('read_config'):
+        config = read_config(dict(args.substitution) if args.substitution else {})
+    if config is None:
+        return 1
+    CORE.config = config
+
+    if args.command not in POST_CONFIG_ACTIONS:
+        safe_print(f"Unknown command {args.command}")
+
+    try:
+        with profile_phase(args.command):
+            return POST_CONFIG_ACTIONS[args.command](args, config)
+    except EsphomeError as e:
+        _LOGGER.error(e)
+        return 1
+
+
 def main():
     try:
         return run_esphome(sys.argv)
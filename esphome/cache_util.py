@@ -0,0 +1,147 @@
+"""Helpers shared by the caches in the .esphome directory."""
+import functools
+import hashlib
+import marshal
+import os
+import time
+
+from esphome import const
+from esphome.core import DocumentRange, Lambda
+
+# pylint: disable=unused-import, wrong-import-order
+from typing import Any  # noqa
+
+# Entries that haven't been used for this long are removed
+MAX_ENTRY_AGE = 30 * 24 * 60 * 60
+
+# Builtin types of values, values may be instances of subclasses like EStr
+_SCALAR_TYPES = (bool, int, float, str, bytes, type(None))
+# Py_TPFLAGS_HEAPTYPE, set for all classes defined in python
+_HEAPTYPE_FLAG = 1 << 9
+
+
+class Uncacheable(Exception):
+    """Raised when a value contains values a cache can't store or fingerprint."""
+
+
+def code_dirs():
+    """Return the directories with the python code of ESPHome and custom components."""
+    from esphome import config
+
+    dirs = [os.path.dirname(os.path.abspath(const.__file__))]
+    # pylint: disable=protected-access
+    if config.CUSTOM_COMPONENTS_PATH not in (None, config._UNDEF):
+        dirs.append(config.CUSTOM_COMPONENTS_PATH)
+    return dirs
+
+
+@functools.lru_cache(maxsize=None)
+def code_fingerprint(*directories):
+    """Return a hash of the python files in directories, using their mtime and size."""
+    hasher = hashlib.sha256()
+    for directory in directories:
+        for dirpath, dirnames, filenames in os.walk(directory):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if not filename.endswith('.py'):
+                    continue
+                stat = os.stat(os.path.join(dirpath, filename))
+                hasher.update(f'{dirpath}/{filename} {stat.st_mtime_ns} {stat.st_size}\n'
+                              .encode('utf-8'))
+    return hasher.hexdigest()
+
+
+def digest(*parts):
+    """Return the hash of the strings and bytes in parts."""
+    hasher = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        hasher.update(b'%d:' % len(part))
+        hasher.update(part)
+    return hasher.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def _type_info(cls):
+    """Return the name and the slot names of cls."""
+    # Classes created by add_class_to_obj are named like their base, so include the whole MRO
+    name = ' '.join(f'{klass.__module__}.{klass.__qualname__}' for klass in cls.__mro__[:-1])
+    slots = []
+    for klass in cls.__mro__:
+        names = klass.__dict__.get('__slots__', ())
+        if isinstance(names, str):
+            names = (names,)
+        slots.extend(x for x in names if x not in ('__dict__', '__weakref__'))
+    return name, tuple(sorted(slots))
+
+
+def _get_state(value, slots):
+    """Return the attributes of value, bypassing __getattr__ of MockObj."""
+    state = {}
+    for name in slots:
+        try:
+            state[name] = object.__getattribute__(value, name)
+        except AttributeError:
+            # Slot not set
+            pass
+    try:
+        state.update(object.__getattribute__(value, '__dict__'))
+    except AttributeError:
+        pass
+    return state
+
+
+def _plain(value):
+    """Return value as nested tuples of builtin scalars, independent of object identity."""
+    cls = type(value)
+    if cls in _SCALAR_TYPES:
+        return value
+    if cls is DocumentRange:
+        # Where a value is in the YAML files doesn't change it
+        return None
+    name, slots = _type_info(cls)
+    if isinstance(value, Lambda):
+        # The parts of lambdas are computed when first used
+        return name, _plain(value.value)
+    if isinstance(value, dict):
+        return name, tuple((_plain(k), _plain(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return name, tuple(_plain(x) for x in value)
+    if isinstance(value, (set, frozenset)):
+        return name, tuple(sorted(repr(_plain(x)) for x in value))
+    if not cls.__flags__ & _HEAPTYPE_FLAG:
+        raise Uncacheable(f"values of type {cls.__name__} are not supported")
+    scalar = next((type_(value) for type_ in _SCALAR_TYPES[:-1] if isinstance(value, type_)),
+                  None)
+    state = _get_state(value, slots) or {}
+    return name, scalar, tuple((k, _plain(state[k])) for k in sorted(state))
+
+
+def fingerprint(value):  # type: (Any) -> bytes
+    """Encode value for hashing, equal configs give the same bytes.
+
+    The codegen cache keys its entries on the fingerprints of the component config and the
+    esphome section, the dump cache on the fingerprint of the dumped config. Unlike pickle,
+    the encoding doesn't depend on which values are the same objects, so a reloaded config
+    gets the same keys. The positions of values in the YAML files are left out, moving a
+    component around doesn't change its key.
+    """
+    try:
+        # Later versions mark interned strings and share references
+        return marshal.dumps(_plain(value), 0)
+    except (RecursionError, ValueError) as err:
+        raise Uncacheable(str(err)) from err
+
+
+def prune(directory):
+    """Remove the cache entries in directory that haven't been used for MAX_ENTRY_AGE."""
+    if not os.path.isdir(directory):
+        return
+    limit = time.time() - MAX_ENTRY_AGE
+    for entry in os.scandir(directory):
+        try:
+            if entry.name.endswith('.bin') and entry.stat().st_mtime < limit:
+                os.remove(entry.path)
+        except OSError:
+            pass
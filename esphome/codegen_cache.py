@@ -0,0 +1,330 @@
+"""Opt-in cache of the code generated by the to_code of components.
+
+The code a component generates depends on its validated config, the code of ESPHome and custom
+components, the esphome: section and the variables of other components it reads. The first run
+records what the to_code task of every component does in each of its steps in flush_tasks:
+the statements, globals, defines, build flags and libraries it adds, the variables it registers
+and the variables and IDs of other components it looks up. Later runs replay the recording of
+components with the same config instead of running their to_code. A replayed task takes the
+same steps as the to_code task, so the tasks run in the same order and generate the same code.
+
+Replaying checks that the variables and IDs a component looks up are the same as when it was
+recorded. If they aren't, the code of all components is generated again without the cache.
+Components whose to_code starts other jobs or registers variables not declared in its config
+aren't cached, nor are components that set CODEGEN_CACHE = False because their to_code reads
+state the recording can't check.
+"""
+import logging
+import marshal
+import os
+import sys
+
+from esphome import const
+from esphome.cache_util import Uncacheable, code_dirs, code_fingerprint, digest, fingerprint, \
+    prune
+from esphome.config import iter_ids
+from esphome.const import CONF_ESPHOME
+from esphome.core import CORE, ID, Define, EsphomeError, Library, _WaitForID
+from esphome.cpp_generator import MockObj, MockObjClass, RawExpression, RawStatement, \
+    TemplateArguments
+from esphome.helpers import file_hash, write_file
+
+# pylint: disable=unused-import, wrong-import-order
+from typing import Any, Dict, List, Optional, Tuple  # noqa
+
+_LOGGER = logging.getLogger(__name__)
+
+# Bump this when the format of cache entries changes
+CODEGEN_CACHE_VERSION = 1
+# Builtin types of the values in entries, values may be instances of subclasses like EStr
+_VALUE_TYPES = (bool, int, float, str, type(None))
+
+
+class CodegenCacheMismatch(EsphomeError):
+    """Raised when a replayed component looks up a variable or ID that changed."""
+
+
+def _plain(value):
+    """Return value as an instance of its builtin type, which marshal can store."""
+    for type_ in _VALUE_TYPES:
+        if isinstance(value, type_):
+            return type_(value) if value is not None else None
+    raise Uncacheable(f"values of type {type(value).__name__} are not supported")
+
+
+def _variable_fingerprint(name, full_id):
+    """Return what the code of a component may depend on of the registered variable name."""
+    id_, obj = CORE.variable_ids[name]
+    op = obj.op if isinstance(obj, MockObj) else None
+    result = (type(obj).__name__, str(obj), op)
+    if full_id:
+        result += (str(id_.type),)
+    return result
+
+
+def _declared_ids(conf):
+    return {id_.id: id_ for id_, _ in iter_ids(conf) if id_.is_declaration}
+
+
+def _template_args(id_, declared_type):
+    """Return the template arguments to_code added to the declared type of an ID.
+
+    new_Pvariable registers a copy of the ID with the templated type, Pvariable may change the
+    type of the ID itself.
+    """
+    if id_.type is declared_type:
+        return None
+    if isinstance(id_.type, MockObjClass) and isinstance(declared_type, MockObjClass):
+        prefix = f'{declared_type}<'
+        type_ = str(id_.type)
+        # pylint: disable=protected-access
+        if type_.startswith(prefix) and any(x is declared_type for x in id_.type._parents):
+            return type_[len(prefix):-1]
+    raise Uncacheable(f"variable {id_} has type {id_.type} instead of {declared_type}")
+
+
+def _job(func, priority):
+    """Make a job for CORE.add_job that runs the generator function func as it is.
+
+    Tasks of coroutines take an extra step when they finish, the recorded and replayed tasks
+    must take exactly the steps of the tasks they stand in for.
+    """
+    func._esphome_coroutine = True  # pylint: disable=protected-access
+    func.priority = priority
+    return func
+
+
+class _Recording:
+    """What the to_code task of one component does, called by CORE while the task runs.
+
+    events has an event for everything the task does in order, and ('yield',) where a step of
+    the task ends. Waiting for a variable isn't recorded, replaying a lookup waits if needed.
+    """
+
+    def __init__(self, name, key, conf):
+        self.name = name
+        self.key = key
+        self.conf = conf
+        # to_code may change the types of the IDs in conf
+        self._declared_types = {name: id_.type for name, id_ in _declared_ids(conf).items()}
+        self.events = []  # type: List[tuple]
+        self.files = []  # type: List[str]
+        # Why the recording can't be stored, if it can't
+        self.uncacheable = None  # type: Optional[str]
+
+    def add(self, expression):
+        self.events.append(('add', expression))
+
+    def add_global(self, expression):
+        self.events.append(('add_global', expression))
+
+    def add_library(self, library):
+        self.events.append(('add_library', library.name, library.version))
+
+    def add_build_flag(self, build_flag):
+        self.events.append(('add_build_flag', build_flag))
+
+    def add_define(self, define):
+        self.events.append(('add_define', define.name, define.value))
+
+    def get_variable(self, id_, full_id):
+        self.events.append(('get_variable', id_.id, full_id))
+
+    def has_id(self, id_, result):
+        self.events.append(('has_id', id_.id, result))
+
+    def register_variable(self, id_, obj):
+        # pylint: disable=unidiomatic-typecheck
+        if type(obj) is not MockObj or obj.base is not id_:
+            self.uncacheable = f"variable {id_} is not a MockObj of its ID"
+        elif id_.id not in self._declared_types or not id_.is_declaration:
+            self.uncacheable = f"variable {id_} is not declared in the config"
+        else:
+            try:
+                template_args = _template_args(id_, self._declared_types[id_.id])
+            except Uncacheable as err:
+                self.uncacheable = str(err)
+            else:
+                self.events.append(('register_variable', id_.id, obj.op, template_args))
+
+    def register_component(self, id_):
+        self.events.append(('register_component', id_))
+
+    def read_file(self, path):
+        self.files.append(path)
+
+    def add_job(self):
+        self.uncacheable = "to_code starts other jobs"
+
+    def run(self, task):
+        """Run task, recording each of its steps."""
+        while True:
+            CORE.codegen_recorder = self
+            try:
+                result = next(task)
+            except StopIteration:
+                return
+            finally:
+                CORE.codegen_recorder = None
+            if not isinstance(result, _WaitForID):
+                self.events.append(('yield',))
+            yield result
+
+    def entry(self):
+        """Return the cache entry of the recording, once all code is generated."""
+        if self.uncacheable is not None:
+            raise Uncacheable(self.uncacheable)
+        events = []
+        for event in self.events:
+            kind = event[0]
+            if kind in ('add', 'add_global'):
+                # Rendered once all code is generated, like the other statements
+                event = (kind, str(event[1]))
+            elif kind == 'get_variable':
+                event += (_variable_fingerprint(event[1], event[2]),)
+            events.append(tuple(_plain(x) if not isinstance(x, tuple) else tuple(map(_plain, x))
+                                for x in event))
+        files = []
+        for path in self.files:
+            if not os.path.isfile(path):
+                raise Uncacheable(f"to_code reads {path}, which is not a file")
+            files.append((path, file_hash(path)))
+        return {'version': CODEGEN_CACHE_VERSION, 'files': files, 'events': events}
+
+
+def _replay(name, events, conf):
+    """Do what the recorded to_code task did, step by step."""
+    declared = _declared_ids(conf)
+    for event in events:
+        kind = event[0]
+        if kind == 'yield':
+            yield None
+        elif kind == 'add':
+            CORE.add(RawStatement(event[1]))
+        elif kind == 'add_global':
+            CORE.add_global(RawStatement(event[1]))
+        elif kind == 'add_library':
+            CORE.add_library(Library(event[1], event[2]))
+        elif kind == 'add_build_flag':
+            CORE.add_build_flag(event[1])
+        elif kind == 'add_define':
+            CORE.add_define(Define(event[1], event[2]))
+        elif kind == 'get_variable':
+            _, id_name, full_id, recorded = event
+            while id_name not in CORE.variable_ids:
+                yield _WaitForID(ID(id_name))
+            if _variable_fingerprint(id_name, full_id) != tuple(recorded):
+                raise CodegenCacheMismatch(f"Variable {id_name} used by {name} changed")
+        elif kind == 'has_id':
+            if CORE.has_id(ID(event[1])) != event[2]:
+                raise CodegenCacheMismatch(f"ID {event[1]} used by {name} changed")
+        elif kind == 'register_variable':
+            _, id_name, op, template_args = event
+            id_ = declared[id_name]
+            if template_args is not None:
+                id_ = id_.copy()
+                id_.type = id_.type.template(TemplateArguments(RawExpression(template_args)))
+            CORE.register_variable(id_, MockObj(id_, op))
+        elif kind == 'register_component':
+            if event[1] not in CORE.component_ids:
+                raise CodegenCacheMismatch(f"Component {event[1]} of {name} changed")
+            CORE.component_ids.remove(event[1])
+
+
+class CodegenCache:
+    """Persistent cache of the code generated by the to_code of components."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        # Whether to replay cached components, or only record all of them
+        self.replay = True
+        self.hits = 0
+        self.misses = 0
+        self._recordings = []  # type: List[_Recording]
+        self._context = None
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, f'{key}.bin')
+
+    def _get_context(self):
+        """Return everything besides the component config to_code may depend on."""
+        if self._context is None:
+            self._context = digest(
+                repr((CODEGEN_CACHE_VERSION, sys.hexversion, const.__version__,
+                      code_fingerprint(*code_dirs()), CORE.name, CORE.esp_platform,
+                      CORE.board, CORE.config_comments, CORE.reproducible)),
+                fingerprint(CORE.config[CONF_ESPHOME]),
+            )
+        return self._context
+
+    def _key(self, name, comp, conf):
+        if not comp.codegen_cache:
+            return None
+        try:
+            return digest(self._get_context(), name, comp.module.__name__, fingerprint(conf))
+        except Uncacheable as err:
+            _LOGGER.debug("Not caching the code of %s: %s", name, err)
+            return None
+
+    def add_job(self, name, comp, conf, func):
+        """Add the to_code task func of component comp to CORE, replayed if it is cached.
+
+        Return the task like CORE.add_job.
+        """
+        key = self._key(name, comp, conf)
+        if key is None:
+            self.misses += 1
+            return CORE.add_job(func, conf)
+
+        events = self._load(key) if self.replay else None
+        if events is not None:
+            self.hits += 1
+            return CORE.add_job(_job(lambda conf_: _replay(name, events, conf_), func.priority),
+                                conf)
+
+        self.misses += 1
+        recording = _Recording(name, key, conf)
+        self._recordings.append(recording)
+        return CORE.add_job(_job(lambda conf_: recording.run(func(conf_)), func.priority), conf)
+
+    def regenerate(self):
+        """Discard the recordings, to generate the code of all components again."""
+        self.replay = False
+        self.hits = self.misses = 0
+        self._recordings = []
+
+    def _load(self, key):
+        path = self.entry_path(key)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path, 'rb') as f_handle:
+                entry = marshal.loads(f_handle.read())
+            if entry['version'] != CODEGEN_CACHE_VERSION:
+                return None
+            for file_path, file_digest in entry['files']:
+                if not os.path.isfile(file_path) or file_hash(file_path) != file_digest:
+                    return None
+            os.utime(path)
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.debug("Ignoring corrupt codegen cache entry %s", path, exc_info=True)
+            return None
+        return entry['events']
+
+    def store(self):
+        """Write the recordings to the cache, once all code is generated."""
+        for recording in self._recordings:
+            try:
+                entry = recording.entry()
+            except Uncacheable as err:
+                _LOGGER.debug("Not caching the code of %s: %s", recording.name, err)
+                continue
+            try:
+                write_file(self.entry_path(recording.key), marshal.dumps(entry))
+            except EsphomeError as err:
+                _LOGGER.debug("Could not write codegen cache entry: %s", err)
+        self._recordings = []
+
+    def prune(self):
+        """Remove entries that haven't been used for cache_util.MAX_ENTRY_AGE."""
+        prune(self.directory)
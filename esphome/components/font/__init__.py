@@ -5,7 +5,7 @@ from esphome.components import display
 import esphome.config_validation as cv
 import esphome.codegen as cg
 from esphome.const import CONF_FILE, CONF_GLYPHS, CONF_ID, CONF_SIZE
-from esphome.core import CORE, HexInt
+from esphome.core import CORE
 
 DEPENDENCIES = ['display']
 MULTI_CONF = True
@@ -89,13 +89,13 @@ def to_code(config):
     ascent, descent = font.getmetrics()
 
     glyph_args = {}
-    data = []
+    data = bytearray()
     for glyph in config[CONF_GLYPHS]:
         mask = font.getmask(glyph, mode='1')
         _, (offset_x, offset_y) = font.font.getsize(glyph)
         width, height = mask.size
         width8 = ((width + 7) // 8) * 8
-        glyph_data = [0 for _ in range(height * width8 // 8)]  # noqa: F812
+        glyph_data = bytearray(height * width8 // 8)
         for y in range(height):
             for x in range(width):
                 if not mask.getpixel((x, y)):
@@ -105,8 +105,7 @@ def to_code(config):
         glyph_args[glyph] = (len(data), offset_x, offset_y, width, height)
         data += glyph_data
 
-    rhs = [HexInt(x) for x in data]
-    prog_arr = cg.progmem_array(config[CONF_RAW_DATA_ID], rhs)
+    prog_arr = cg.progmem_array(config[CONF_RAW_DATA_ID], data)
 
     glyphs = []
     for glyph in config[CONF_GLYPHS]:
@@ -5,7 +5,7 @@ from esphome.components import display, font
 import esphome.config_validation as cv
 import esphome.codegen as cg
 from esphome.const import CONF_FILE, CONF_ID, CONF_TYPE, CONF_RESIZE, CONF_DITHER
-from esphome.core import CORE, HexInt
+from esphome.core import CORE
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -57,30 +57,16 @@ def to_code(config):
     dither = Image.NONE if config[CONF_DITHER] == 'NONE' else Image.FLOYDSTEINBERG
     if config[CONF_TYPE] == 'GRAYSCALE':
         image = image.convert('L', dither=dither)
-        pixels = list(image.getdata())
-        data = [0 for _ in range(height * width)]
-        pos = 0
-        for pix in pixels:
-            data[pos] = pix
-            pos += 1
+        data = image.tobytes()
 
     elif config[CONF_TYPE] == 'RGB24':
         image = image.convert('RGB')
-        pixels = list(image.getdata())
-        data = [0 for _ in range(height * width * 3)]
-        pos = 0
-        for pix in pixels:
-            data[pos] = pix[0]
-            pos += 1
-            data[pos] = pix[1]
-            pos += 1
-            data[pos] = pix[2]
-            pos += 1
+        data = image.tobytes()
 
     elif config[CONF_TYPE] == 'BINARY':
         image = image.convert('1', dither=dither)
         width8 = ((width + 7) // 8) * 8
-        data = [0 for _ in range(height * width8 // 8)]
+        data = bytearray(height * width8 // 8)
         for y in range(height):
             for x in range(width):
                 if image.getpixel((x, y)):
@@ -88,7 +74,6 @@ def to_code(config):
                 pos = x + y * width8
                 data[pos // 8] |= 0x80 >> (pos % 8)
 
-    rhs = [HexInt(x) for x in data]
-    prog_arr = cg.progmem_array(config[CONF_RAW_DATA_ID], rhs)
+    prog_arr = cg.progmem_array(config[CONF_RAW_DATA_ID], data)
     cg.new_Pvariable(config[CONF_ID], prog_arr, width, height,
                      IMAGE_TYPE[config[CONF_TYPE]])
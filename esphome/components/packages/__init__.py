@@ -1,3 +1,5 @@
+import itertools
+
 import esphome.config_validation as cv
 
 from esphome.const import CONF_PACKAGES
@@ -24,6 +26,46 @@ def _merge_package(full_old, full_new):
     return merge(full_old, full_new)
 
 
+def _merge_layers(layers):
+    """Merge the values of one node in several configs, from the lowest to the highest priority.
+
+    Gives the same result as _merge_package(layers[0], _merge_package(layers[1], ...)), but
+    merges every node only once, however many layers it is in: dicts are merged key by key
+    with the dicts of the other layers, lists are concatenated, and anything else replaces
+    the values of lower layers. Values that only appear in a single layer are shared with
+    that layer instead of being copied.
+    """
+    new = layers[-1]
+    if isinstance(new, dict):
+        kind = dict
+    elif isinstance(new, list):
+        kind = list
+    else:
+        return new
+    # Lower layers of another kind are replaced by the higher layers, without affecting the
+    # merge of the remaining layers
+    matching = [layer for layer in layers if isinstance(layer, kind)]
+    if len(matching) == 1:
+        return new
+    if len(matching) == 2:
+        # Cheaper than grouping the keys of all layers
+        return _merge_package(*matching)
+    if kind is list:
+        return list(itertools.chain.from_iterable(matching))
+
+    key_layers = {}
+    for layer in matching:
+        for key, value in layer.items():
+            key_layers.setdefault(key, []).append(value)
+    res = matching[0].copy()
+    for key, values in key_layers.items():
+        value = values[-1]
+        if len(values) > 1 and isinstance(value, (dict, list)):
+            value = _merge_layers(values)
+        res[key] = value
+    return res
+
+
 def do_packages_pass(config: dict):
     if CONF_PACKAGES not in config:
         return config
@@ -33,12 +75,16 @@ def do_packages_pass(config: dict):
             raise cv.Invalid("Packages must be a key to value mapping, got {} instead"
                              "".format(type(packages)))
 
+        layers = []
         for package_name, package_config in packages.items():
             with cv.prepend_path(package_name):
-                recursive_package = package_config
                 if isinstance(package_config, dict):
-                    recursive_package = do_packages_pass(package_config)
-                config = _merge_package(recursive_package, config)
+                    package_config = do_packages_pass(package_config)
+                layers.append(package_config)
+        # Every package is merged below the config and the packages before it
+        layers.reverse()
+        layers.append(config)
+        config = _merge_layers(layers)
 
         del config[CONF_PACKAGES]
     return config
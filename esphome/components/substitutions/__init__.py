@@ -3,6 +3,7 @@ import re
 
 import esphome.config_validation as cv
 from esphome import core
+from esphome.config_walker import ConfigWalker
 from esphome.const import CONF_SUBSTITUTIONS
 
 CODEOWNERS = ['@esphome/core']
@@ -71,37 +72,34 @@ def _expand_substitutions(substitutions, value, path):
     return value
 
 
-def _substitute_item(substitutions, item, path):
-    if isinstance(item, list):
-        for i, it in enumerate(item):
-            sub = _substitute_item(substitutions, it, path + [i])
-            if sub is not None:
-                item[i] = sub
-    elif isinstance(item, dict):
-        replace_keys = []
-        for k, v in item.items():
-            if path or k != CONF_SUBSTITUTIONS:
-                sub = _substitute_item(substitutions, k, path + [k])
-                if sub is not None:
-                    replace_keys.append((k, sub))
-            sub = _substitute_item(substitutions, v, path + [k])
-            if sub is not None:
-                item[k] = sub
-        for old, new in replace_keys:
-            item[new] = item[old]
-            del item[old]
-    elif isinstance(item, str):
-        sub = _expand_substitutions(substitutions, item, path)
-        if sub != item:
-            return sub
-    elif isinstance(item, core.Lambda):
-        sub = _expand_substitutions(substitutions, item.value, path)
-        if sub != item:
-            item.value = sub
-    return None
-
-
-def do_substitution_pass(config, command_line_substitutions):
+class _Substituter:
+    """ConfigWalker visitors that expand substitutions in strings, lambdas and dict keys."""
+
+    def __init__(self, substitutions):
+        self._substitutions = substitutions
+
+    def value(self, walker, value):
+        if isinstance(value, core.Lambda):
+            if '$' in value.value:
+                value.value = _expand_substitutions(self._substitutions, value.value,
+                                                    walker.path)
+            return value
+        if '$' not in value:
+            return value
+        return _expand_substitutions(self._substitutions, value, walker.path)
+
+    def key(self, walker, key):
+        if walker.depth == 1 and key == CONF_SUBSTITUTIONS:
+            return key
+        return self.value(walker, key)
+
+
+def do_substitution_pass(config, command_line_substitutions, walker=None):
+    """Validate the substitutions and expand them in config.
+
+    If walker is given, the substitutions are only registered on it and expanded when the
+    caller walks config, so that other passes can share the walk.
+    """
     if CONF_SUBSTITUTIONS not in config and not command_line_substitutions:
         return
 
@@ -127,4 +125,11 @@ def do_substitution_pass(config, command_line_substitutions):
             del substitutions[old]
 
     config[CONF_SUBSTITUTIONS] = substitutions
-    _substitute_item(substitutions, config, [])
+    substituter = _Substituter(substitutions)
+    walk = walker is None
+    if walk:
+        walker = ConfigWalker()
+    walker.add_key_visitor(str, substituter.key)
+    walker.add_visitor((str, core.Lambda), substituter.value)
+    if walk:
+        walker.walk(config)
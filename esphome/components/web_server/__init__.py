@@ -8,6 +8,8 @@ from esphome.const import (
 from esphome.core import coroutine_with_priority
 
 AUTO_LOAD = ['json', 'web_server_base']
+# to_code reads the css_include and js_include files
+CODEGEN_CACHE = False
 
 web_server_ns = cg.esphome_ns.namespace('web_server')
 WebServer = web_server_ns.class_('WebServer', cg.Component, cg.Controller)
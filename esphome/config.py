@@ -1,5 +1,7 @@
 import collections
+import difflib
 import importlib
+import json
 import logging
 import re
 import os.path
@@ -11,15 +13,17 @@ from contextlib import contextmanager
 import voluptuous as vol
 
 from esphome import core, core_config, yaml_util
+from esphome.config_walker import ConfigWalker
 from esphome.const import CONF_ESPHOME, CONF_PLATFORM, ESP_PLATFORMS, CONF_PACKAGES, \
     CONF_SUBSTITUTIONS
 from esphome.core import CORE, EsphomeError  # noqa
 from esphome.helpers import color, indent
+from esphome.profiler import profile_component, profile_phase
 from esphome.util import safe_print, OrderedDict
 
-from typing import List, Optional, Tuple, Union  # noqa
-from esphome.core import ConfigType  # noqa
-from esphome.yaml_util import is_secret, ESPHomeDataBase, ESPForceValue
+from typing import Dict, List, Optional, Set, Tuple, Union  # noqa
+from esphome.core import ConfigType, DocumentRange  # noqa
+from esphome.yaml_util import is_secret, ESPForceValue, get_document_range
 from esphome.voluptuous_schema import ExtraKeysInvalid
 
 _LOGGER = logging.getLogger(__name__)
@@ -29,11 +33,15 @@ _COMPONENT_CACHE = {}
 
 class ComponentManifest:
     def __init__(self, module, base_components_path, is_core=False, is_platform=False):
-        self.module = module
+        self._module = module
         self._is_core = is_core
         self.is_platform = is_platform
         self.base_components_path = base_components_path
 
+    @property
+    def module(self):
+        return self._module
+
     @property
     def is_platform_component(self):
         return getattr(self.module, 'IS_PLATFORM_COMPONENT', False)
@@ -50,6 +58,12 @@ class ComponentManifest:
     def to_code(self):
         return getattr(self.module, 'to_code', None)
 
+    @property
+    def codegen_cache(self):
+        # False for components whose to_code reads state the codegen cache can't check,
+        # like files it opens itself
+        return getattr(self.module, 'CODEGEN_CACHE', True)
+
     @property
     def esp_platforms(self):
         return getattr(self.module, 'ESP_PLATFORMS', ESP_PLATFORMS)
@@ -106,9 +120,91 @@ class ComponentManifest:
         return ret
 
 
+class IndexedComponentManifest(ComponentManifest):
+    """Manifest of a core component that answers metadata from the manifest index.
+
+    The component module is only imported once something else than this metadata is needed,
+    like the schema or to_code. get_component therefore can't return None for a component in
+    the index whose module fails to import, accessing the module raises an EsphomeError instead.
+    """
+
+    def __init__(self, domain, metadata, is_platform=False):
+        super().__init__(None, CORE_COMPONENTS_PATH, is_platform=is_platform)
+        self.domain = domain
+        self._metadata = metadata
+
+    @property
+    def module(self):
+        if self._module is None:
+            try:
+                self._module = importlib.import_module(f'esphome.components.{self.domain}')
+            except Exception as err:  # pylint: disable=broad-except
+                _LOGGER.debug("Unable to load component %s:", self.domain, exc_info=True)
+                raise EsphomeError(f"Unable to load component {self.domain}: {err}") from err
+        return self._module
+
+    @property
+    def is_platform_component(self):
+        return self._metadata.get('is_platform_component', False)
+
+    @property
+    def config_schema(self):
+        if not self._metadata.get('config_schema', False):
+            return None
+        return super().config_schema
+
+    @property
+    def is_multi_conf(self):
+        return self._metadata.get('multi_conf', False)
+
+    @property
+    def esp_platforms(self):
+        return self._metadata.get('esp_platforms', ESP_PLATFORMS)
+
+    @property
+    def dependencies(self):
+        return self._metadata.get('dependencies', [])
+
+    @property
+    def conflicts_with(self):
+        return self._metadata.get('conflicts_with', [])
+
+    @property
+    def auto_load(self):
+        return self._metadata.get('auto_load', [])
+
+
 CORE_COMPONENTS_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), 'components'))
+# Metadata of all core components, generated by script/build_manifest_index.py
+MANIFEST_INDEX_FILE = 'manifest_index.json'
 _UNDEF = object()
 CUSTOM_COMPONENTS_PATH = _UNDEF
+_MANIFEST_INDEX = None  # type: Optional[Dict[str, dict]]
+
+
+def get_manifest_index():
+    # type: () -> Dict[str, dict]
+    """Return the metadata of all core components and platforms, by module name.
+
+    Empty if the index file is missing, components are then looked up by importing them.
+    """
+    global _MANIFEST_INDEX
+    if _MANIFEST_INDEX is None:
+        try:
+            with open(os.path.join(CORE_COMPONENTS_PATH, MANIFEST_INDEX_FILE),
+                      encoding='utf-8') as f_handle:
+                _MANIFEST_INDEX = json.load(f_handle)['components']
+        except (OSError, ValueError, KeyError) as err:
+            _LOGGER.debug("Not using the manifest index: %s", err)
+            _MANIFEST_INDEX = {}
+    return _MANIFEST_INDEX
+
+
+def _did_you_mean(name, candidates):
+    matches = difflib.get_close_matches(name, candidates, n=1)
+    if not matches:
+        return ''
+    return f" Did you mean '{matches[0]}'?"
 
 
 def _mount_config_dir():
@@ -146,6 +242,12 @@ def _lookup_module(domain, is_platform):
         _COMPONENT_CACHE[domain] = manif
         return manif
 
+    metadata = get_manifest_index().get(domain)
+    if metadata is not None:
+        manif = IndexedComponentManifest(domain, metadata, is_platform=is_platform)
+        _COMPONENT_CACHE[domain] = manif
+        return manif
+
     try:
         module = importlib.import_module(f'esphome.components.{domain}')
     except ImportError as e:
@@ -209,6 +311,9 @@ class Config(OrderedDict):
         # The values will be the paths to all "domain", for example (['logger'], 'logger')
         # or (['sensor', 'ultrasonic'], 'sensor.ultrasonic')
         self.output_paths = []  # type: List[Tuple[ConfigPath, str]]
+        # Lazily built (error path prefixes, deepest error path -> first error),
+        # see _get_error_index
+        self._error_index = None
 
     def add_error(self, error):
         # type: (vol.Invalid) -> None
@@ -217,6 +322,7 @@ class Config(OrderedDict):
                 self.add_error(err)
             return
         self.errors.append(error)
+        self._error_index = None
 
     @contextmanager
     def catch_error(self, path=None):
@@ -239,40 +345,61 @@ class Config(OrderedDict):
         # type: (ConfigPath, str) -> None
         self.output_paths.remove((path, domain))
 
+    def _get_error_index(self):
+        # type: () -> Tuple[Set[tuple], Dict[tuple, vol.Invalid]]
+        """Index all errors by path, so that printing the config can look them up in O(1).
+
+        The index is dropped when errors are added or the config is changed with
+        set_by_path. Other changes to the config after the first lookup aren't picked up.
+        """
+        if self._error_index is None:
+            prefixes = set()
+            by_deepest_path = {}
+            for err in self.errors:
+                path = tuple(err.path)
+                for i in range(len(path) + 1):
+                    prefixes.add(path[:i])
+                by_deepest_path.setdefault(tuple(self.get_deepest_path(err.path)), err)
+            self._error_index = prefixes, by_deepest_path
+        return self._error_index
+
     def is_in_error_path(self, path):
         # type: (ConfigPath) -> bool
-        for err in self.errors:
-            if _path_begins_with(err.path, path):
-                return True
-        return False
+        return tuple(path) in self._get_error_index()[0]
 
     def set_by_path(self, path, value):
         conf = self
         for key in path[:-1]:
             conf = conf[key]
         conf[path[-1]] = value
+        self._error_index = None
 
     def get_error_for_path(self, path):
         # type: (ConfigPath) -> Optional[vol.Invalid]
-        for err in self.errors:
-            if self.get_deepest_path(err.path) == path:
-                return err
-        return None
+        return self._get_error_index()[1].get(tuple(path))
 
     def get_deepest_document_range_for_path(self, path):
-        # type: (ConfigPath) -> Optional[ESPHomeDataBase]
+        # type: (ConfigPath) -> Optional[DocumentRange]
         data = self
         doc_range = None
         for item_index in path:
             try:
-                data = data[item_index]
+                item = data[item_index]
             except (KeyError, IndexError, TypeError):
                 return doc_range
-            if isinstance(data, ESPHomeDataBase) and data.esp_range is not None:
-                doc_range = data.esp_range
+            item_range = get_document_range(data, item_index)
+            if item_range is not None:
+                doc_range = item_range
+            data = item
 
         return doc_range
 
+    def get_document_range_for_path(self, path):
+        # type: (ConfigPath) -> Optional[DocumentRange]
+        if not path:
+            return None
+        return get_document_range(self.get_nested_item(path[:-1]), path[-1])
+
     def get_nested_item(self, path):
         # type: (ConfigPath) -> ConfigType
         data = self
@@ -297,62 +424,126 @@ class Config(OrderedDict):
         return part
 
 
-def iter_ids(config, path=None):
-    path = path or []
-    if isinstance(config, core.ID):
-        yield config, path
-    elif isinstance(config, core.Lambda):
-        for id in config.requires_ids:
-            yield id, path
-    elif isinstance(config, list):
-        for i, item in enumerate(config):
-            yield from iter_ids(item, path + [i])
-    elif isinstance(config, dict):
-        for key, value in config.items():
-            yield from iter_ids(value, path + [key])
+def iter_ids(config):
+    # type: (ConfigType) -> List[Tuple[core.ID, ConfigPath]]
+    """Return the IDs in config and the IDs its lambdas require, with their paths."""
+    ids = []
+
+    def visit_id(walker, value):
+        ids.append((value, walker.path))
+        return value
+
+    def visit_lambda(walker, value):
+        if value.requires_ids:
+            path = walker.path
+            ids.extend((id, path) for id in value.requires_ids)
+        return value
+
+    walker = ConfigWalker()
+    walker.add_visitor(core.ID, visit_id)
+    walker.add_visitor(core.Lambda, visit_lambda)
+    walker.walk(config)
+    return ids
+
+
+class IDIndex:
+    """Index of the IDs declared in a configuration.
+
+    Declarations are indexed by name and by every type they inherit from, so that
+    resolving all IDs of a configuration takes linear time.
+    """
+
+    def __init__(self):
+        # All declarations, in the order they appear in the configuration
+        self.declarations = []  # type: List[Tuple[core.ID, ConfigPath]]
+        # ID name -> (ID, path) of its declaration
+        self.by_name = {}  # type: Dict[str, Tuple[core.ID, ConfigPath]]
+        # MockObjClass -> first declared ID whose type inherits from it
+        self.by_type = {}  # type: Dict[MockObjClass, core.ID]
+        # Default ID name -> next suffix to try for it
+        self._suffixes = {}  # type: Dict[str, int]
+
+    def declare(self, id, path):
+        # type: (core.ID, ConfigPath) -> Optional[ConfigPath]
+        """Add a declaration, return the path of the previous declaration if it is a duplicate."""
+        if id.id is not None:
+            match = self.by_name.get(id.id)
+            if match is not None:
+                return match[1]
+            self.by_name[id.id] = (id, path)
+        self.declarations.append((id, path))
+        return None
+
+    def resolve_default_ids(self):
+        """Assign a unique name to all declared IDs without a manual name."""
+        from esphome.config_validation import RESERVED_IDS
+
+        used = set(self.by_name) | set(RESERVED_IDS)
+        for id, path in self.declarations:
+            if id.id is not None:
+                continue
+            name = id.default_id
+            # Same naming scheme as ensure_unique_string, without retrying taken suffixes
+            tries = self._suffixes.get(name, 1)
+            test_string = name if tries == 1 else f"{name}_{tries}"
+            while test_string in used:
+                tries += 1
+                test_string = f"{name}_{tries}"
+            self._suffixes[name] = tries
+            used.add(test_string)
+            id.id = test_string
+            self.by_name[test_string] = (id, path)
+
+    def build_type_index(self):
+        from esphome.cpp_generator import MockObjClass
+
+        for id, _ in self.declarations:
+            if not isinstance(id.type, MockObjClass):
+                continue
+            self.by_type.setdefault(id.type, id)
+            for parent in id.type._parents:  # pylint: disable=protected-access
+                self.by_type.setdefault(parent, id)
 
 
 def do_id_pass(result):  # type: (Config) -> None
     from esphome.cpp_generator import MockObjClass
     from esphome.cpp_types import Component
 
-    declare_ids = []  # type: List[Tuple[core.ID, ConfigPath]]
+    index = IDIndex()
     searching_ids = []  # type: List[Tuple[core.ID, ConfigPath]]
     for id, path in iter_ids(result):
         if id.is_declaration:
-            if id.id is not None:
-                # Look for duplicate definitions
-                match = next((v for v in declare_ids if v[0].id == id.id), None)
-                if match is not None:
-                    opath = '->'.join(str(v) for v in match[1])
-                    result.add_str_error(f"ID {id.id} redefined! Check {opath}", path)
-                    continue
-            declare_ids.append((id, path))
+            # Look for duplicate definitions
+            match_path = index.declare(id, path)
+            if match_path is not None:
+                opath = '->'.join(str(v) for v in match_path)
+                result.add_str_error(f"ID {id.id} redefined! Check {opath}", path)
         else:
             searching_ids.append((id, path))
     # Resolve default ids after manual IDs
-    for id, _ in declare_ids:
-        id.resolve([v[0].id for v in declare_ids])
+    index.resolve_default_ids()
+    for id, _ in index.declarations:
         if isinstance(id.type, MockObjClass) and id.type.inherits_from(Component):
             CORE.component_ids.add(id.id)
+    index.build_type_index()
 
     # Check searched IDs
     for id, path in searching_ids:
         if id.id is not None:
             # manually declared
-            match = next((v[0] for v in declare_ids if v[0].id == id.id), None)
+            match = index.by_name.get(id.id)
             if match is None:
                 # No declared ID with this name
-                import difflib
                 error = ("Couldn't find ID '{}'. Please check you have defined "
                          "an ID with that name in your configuration.".format(id.id))
                 # Find candidates
-                matches = difflib.get_close_matches(id.id, [v[0].id for v in declare_ids])
+                matches = difflib.get_close_matches(id.id, list(index.by_name))
                 if matches:
                     matches_s = ', '.join(f'"{x}"' for x in matches)
                     error += f" These IDs look similar: {matches_s}."
                 result.add_str_error(error, path)
                 continue
+            match = match[0]
             if not isinstance(match.type, MockObjClass) or not isinstance(id.type, MockObjClass):
                 continue
             if not match.type.inherits_from(id.type):
@@ -361,32 +552,21 @@ def do_id_pass(result):  # type: (Config) -> None
                                      "".format(id.id, match.type, id.type), path)
 
         if id.id is None and id.type is not None:
-            for v in declare_ids:
-                if v[0] is None or not isinstance(v[0].type, MockObjClass):
-                    continue
-                inherits = v[0].type.inherits_from(id.type)
-                if inherits:
-                    id.id = v[0].id
-                    break
+            match = index.by_type.get(id.type)
+            if match is not None:
+                id.id = match.id
             else:
                 result.add_str_error(f"Couldn't resolve ID for type '{id.type}'", path)
 
 
-def recursive_check_replaceme(value):
-    import esphome.config_validation as cv
-
-    if isinstance(value, list):
-        return cv.Schema([recursive_check_replaceme])(value)
-    if isinstance(value, dict):
-        return cv.Schema({cv.valid: recursive_check_replaceme})(value)
-    if isinstance(value, ESPForceValue):
-        pass
-    if isinstance(value, str) and value == 'REPLACEME':
-        raise cv.Invalid("Found 'REPLACEME' in configuration, this is most likely an error. "
-                         "Please make sure you have replaced all fields from the sample "
-                         "configuration.\n"
-                         "If you want to use the literal REPLACEME string, "
-                         "please use \"!force REPLACEME\"")
+def check_replaceme(walker, value):  # pylint: disable=unused-argument
+    """ConfigWalker visitor for strings that were copied from sample configs unchanged."""
+    if value == 'REPLACEME' and not isinstance(value, ESPForceValue):
+        raise vol.Invalid("Found 'REPLACEME' in configuration, this is most likely an error. "
+                          "Please make sure you have replaced all fields from the sample "
+                          "configuration.\n"
+                          "If you want to use the literal REPLACEME string, "
+                          "please use \"!force REPLACEME\"")
     return value
 
 
@@ -398,27 +578,30 @@ def validate_config(config, command_line_substitutions):
         from esphome.components.packages import do_packages_pass
         result.add_output_path([CONF_PACKAGES], CONF_PACKAGES)
         try:
-            config = do_packages_pass(config)
+            with profile_phase('packages'):
+                config = do_packages_pass(config)
         except vol.Invalid as err:
             result.update(config)
             result.add_error(err)
             return result
 
     # 1. Load substitutions
+    walker = ConfigWalker()
     if CONF_SUBSTITUTIONS in config:
         from esphome.components import substitutions
         result[CONF_SUBSTITUTIONS] = {**config[CONF_SUBSTITUTIONS], **command_line_substitutions}
         result.add_output_path([CONF_SUBSTITUTIONS], CONF_SUBSTITUTIONS)
         try:
-            substitutions.do_substitution_pass(config, command_line_substitutions)
+            substitutions.do_substitution_pass(config, command_line_substitutions, walker)
         except vol.Invalid as err:
             result.add_error(err)
             return result
 
-    # 1.1. Check for REPLACEME special value
-    try:
-        recursive_check_replaceme(config)
-    except vol.Invalid as err:
+    # 1.1. Check for REPLACEME special value, in the same walk that expands substitutions
+    walker.add_visitor(str, check_replaceme)
+    with profile_phase('substitutions'):
+        walker.walk(config)
+    for err in walker.errors:
         result.add_error(err)
 
     if 'esphomeyaml' in config:
@@ -468,7 +651,9 @@ def validate_config(config, command_line_substitutions):
         component = get_component(domain)
         path = [domain]
         if component is None:
-            result.add_str_error(f"Component not found: {domain}", path)
+            components = [name for name in get_manifest_index() if '.' not in name]
+            result.add_str_error(f"Component not found: {domain}."
+                                 f"{_did_you_mean(domain, components)}", path)
             continue
         CORE.loaded_integrations.add(domain)
 
@@ -513,7 +698,10 @@ def validate_config(config, command_line_substitutions):
             # Try Load platform
             platform = get_platform(domain, p_name)
             if platform is None:
-                result.add_str_error(f"Platform not found: '{p_domain}'", path)
+                platforms = [name.split('.')[0] for name in get_manifest_index()
+                             if name.endswith(f'.{domain}')]
+                result.add_str_error(f"Platform not found: '{p_domain}'."
+                                     f"{_did_you_mean(str(p_name), platforms)}", path)
                 continue
             CORE.loaded_integrations.add(p_name)
 
@@ -533,7 +721,7 @@ def validate_config(config, command_line_substitutions):
     # - Supported ESP Platform
 
     # List of items to proceed to next stage
-    validate_queue = []  # type: List[Tuple[ConfigPath, ConfigType, ComponentManifest]]
+    validate_queue = []  # type: List[Tuple[ConfigPath, str, ConfigType, ComponentManifest]]
     for path, domain, conf, comp in check_queue:
         if conf is None:
             result[domain] = conf = {}
@@ -572,36 +760,43 @@ def validate_config(config, command_line_substitutions):
             if not isinstance(conf, list):
                 result[domain] = conf = [conf]
             for i, part_conf in enumerate(conf):
-                validate_queue.append((path + [i], part_conf, comp))
+                validate_queue.append((path + [i], domain, part_conf, comp))
             continue
 
-        validate_queue.append((path, conf, comp))
+        validate_queue.append((path, domain, conf, comp))
 
     # 5. Validate configuration schema
-    for path, conf, comp in validate_queue:
+    for path, domain, conf, comp in validate_queue:
         if comp.config_schema is None:
             continue
-        with result.catch_error(path):
-            if comp.is_platform:
-                # Remove 'platform' key for validation
-                input_conf = OrderedDict(conf)
-                platform_val = input_conf.pop('platform')
-                validated = comp.config_schema(input_conf)
-                # Ensure result is OrderedDict so we can call move_to_end
-                if not isinstance(validated, OrderedDict):
-                    validated = OrderedDict(validated)
-                validated['platform'] = platform_val
-                validated.move_to_end('platform', last=False)
-                result.set_by_path(path, validated)
-            else:
-                validated = comp.config_schema(conf)
-                result.set_by_path(path, validated)
+        with profile_component('validation', domain):
+            with result.catch_error(path):
+                if comp.is_platform:
+                    # Remove 'platform' key for validation
+                    input_conf = OrderedDict(conf)
+                    platform_val = input_conf.pop('platform')
+                    validated = comp.config_schema(input_conf)
+                    # Ensure result is OrderedDict so we can call move_to_end
+                    if not isinstance(validated, OrderedDict):
+                        validated = OrderedDict(validated)
+                    validated['platform'] = platform_val
+                    validated.move_to_end('platform', last=False)
+                    yaml_util.copy_locations(conf, validated)
+                    result.set_by_path(path, validated)
+                else:
+                    validated = comp.config_schema(conf)
+                    yaml_util.copy_locations(conf, validated)
+                    result.set_by_path(path, validated)
+
+    # The sections of result replace those of config
+    yaml_util.copy_locations(config, result)
 
     # 6. If no validation errors, check IDs
     if not result.errors:
         # Only parse IDs if no validation error. Otherwise
         # user gets confusing messages
-        do_id_pass(result)
+        with profile_phase('do_id_pass'):
+            do_id_pass(result)
     return result
 
 
@@ -620,7 +815,7 @@ def humanize_error(config, validation_error):
     if m is not None:
         validation_error = m.group(1)
     validation_error = validation_error.strip()
-    if not validation_error.endswith('.'):
+    if not validation_error.endswith(('.', '?')):
         validation_error += '.'
     return validation_error
 
@@ -672,14 +867,20 @@ class InvalidYAMLError(EsphomeError):
 
 
 def _load_config(command_line_substitutions):
+    cache_dir = None
+    if CORE.yaml_cache and not CORE.vscode:
+        cache_dir = CORE.relative_config_path('.esphome', 'yaml_cache')
     try:
-        config = yaml_util.load_yaml(CORE.config_path)
+        with profile_phase('load_yaml'):
+            config = yaml_util.load_yaml(CORE.config_path, cache_dir=cache_dir,
+                                         compact_locations=CORE.compact_locations)
     except EsphomeError as e:
         raise InvalidYAMLError(e) from e
     CORE.raw_config = config
 
     try:
-        result = validate_config(config, command_line_substitutions)
+        with profile_phase('validate_config'):
+            result = validate_config(config, command_line_substitutions)
     except EsphomeError:
         raise
     except Exception:
@@ -696,12 +897,13 @@ def load_config(command_line_substitutions):
         raise EsphomeError(f"Error while parsing config: {err}") from err
 
 
-def line_info(obj, highlight=True):
+def line_info(config, path, highlight=True):
     """Display line config source."""
     if not highlight:
         return None
-    if isinstance(obj, ESPHomeDataBase) and obj.esp_range is not None:
-        mark = obj.esp_range.start_mark
+    doc_range = config.get_document_range_for_path(path)
+    if doc_range is not None:
+        mark = doc_range.start_mark
         source = "[source {}:{}]".format(mark.document, mark.line + 1)
         return color('cyan', source)
     return None
@@ -745,7 +947,7 @@ def dump_dict(config, path, at_root=True):
                 sep = color('red', sep)
             msg, _ = dump_dict(config, path_, at_root=False)
             msg = indent(msg)
-            inf = line_info(config.get_nested_item(path_), highlight=config.is_in_error_path(path_))
+            inf = line_info(config, path_, highlight=config.is_in_error_path(path_))
             if inf is not None:
                 msg = inf + '\n' + msg
             elif msg:
@@ -768,7 +970,7 @@ def dump_dict(config, path, at_root=True):
                 st = color('red', st)
             msg, m = dump_dict(config, path_, at_root=False)
 
-            inf = line_info(config.get_nested_item(path_), highlight=config.is_in_error_path(path_))
+            inf = line_info(config, path_, highlight=config.is_in_error_path(path_))
             if m:
                 msg = '\n' + indent(msg)
 
@@ -846,7 +1048,7 @@ def read_config(command_line_substitutions):
                 continue
 
             safe_print(color('bold_red', f'{domain}:') + ' ' +
-                       (line_info(res.get_nested_item(path)) or ''))
+                       (line_info(res, path) or ''))
             safe_print(indent(dump_dict(res, path)[0]))
         return None
     return OrderedDict(res)
@@ -0,0 +1,138 @@
+"""Single pass traversal of config trees.
+
+Several passes over the raw and validated config (substitutions, REPLACEME checks, collecting
+IDs) only look at some types of values. Instead of each recursing through the whole tree and
+copying the path at every level, they register visitors on a ConfigWalker, which walks the tree
+once and only builds the path of a value when a visitor asks for it.
+"""
+import voluptuous as vol
+
+# pylint: disable=unused-import, wrong-import-order
+from typing import Any, Callable, Dict, List, Tuple, Type, Union  # noqa
+
+ConfigPath = List[Union[str, int]]
+Visitor = Callable[['ConfigWalker', Any], Any]
+
+
+class ConfigWalker:
+    """Walk a config tree depth first, calling the registered visitors for every value.
+
+    Visitors are called with the walker and the value, and return the value to replace it
+    with (or the value itself). Key visitors are called the same way for the keys of dicts;
+    renamed keys are moved to the end of their dict once all of its items were visited.
+    The replaced values are walked, so visitors registered later see the replaced value.
+
+    vol.Invalid errors raised by visitors are collected in errors with the path of the value.
+    """
+
+    def __init__(self):
+        self._visitors = []  # type: List[Tuple[Tuple[Type, ...], Visitor]]
+        self._key_visitors = []  # type: List[Tuple[Tuple[Type, ...], Visitor]]
+        # Exact type -> visitors for values of that type
+        self._dispatch = {}  # type: Dict[Type, List[Visitor]]
+        self._key_dispatch = {}  # type: Dict[Type, List[Visitor]]
+        self._keys = []  # type: ConfigPath
+        self.errors = []  # type: List[vol.Invalid]
+
+    def add_visitor(self, types, visitor):
+        # type: (Union[Type, Tuple[Type, ...]], Visitor) -> None
+        """Call visitor for all values that are instances of types."""
+        self._visitors.append((types, visitor))
+        self._dispatch.clear()
+
+    def add_key_visitor(self, types, visitor):
+        # type: (Union[Type, Tuple[Type, ...]], Visitor) -> None
+        """Call visitor for all dict keys that are instances of types."""
+        self._key_visitors.append((types, visitor))
+        self._key_dispatch.clear()
+
+    @property
+    def path(self):
+        # type: () -> ConfigPath
+        """The path of the value currently visited."""
+        return list(self._keys)
+
+    @property
+    def depth(self):
+        # type: () -> int
+        """The length of path, without building it."""
+        return len(self._keys)
+
+    def _call(self, visitors, value):
+        for visitor in visitors:
+            try:
+                value = visitor(self, value)
+            except vol.Invalid as err:
+                err.prepend(self.path)
+                self.errors.append(err)
+        return value
+
+    def _visitors_for(self, type_):
+        visitors = [v for types, v in self._visitors if issubclass(type_, types)]
+        self._dispatch[type_] = visitors
+        return visitors
+
+    def _key_visitors_for(self, type_):
+        visitors = [v for types, v in self._key_visitors if issubclass(type_, types)]
+        self._key_dispatch[type_] = visitors
+        return visitors
+
+    @staticmethod
+    def _enter(container, stack):
+        if isinstance(container, dict):
+            stack.append((container, iter(container.items()), []))
+        else:
+            stack.append((container, enumerate(container), None))
+
+    def walk(self, config):
+        """Visit config and all values in it, return the (possibly replaced) config."""
+        keys = self._keys
+        dispatch = self._dispatch
+        key_dispatch = self._key_dispatch if self._key_visitors else None
+        visitors = dispatch.get(type(config))
+        if visitors is None:
+            visitors = self._visitors_for(type(config))
+        if visitors:
+            config = self._call(visitors, config)
+        if not isinstance(config, (list, dict)):
+            return config
+        stack = []
+        self._enter(config, stack)
+        while stack:
+            container, items, renamed = stack[-1]
+            # Continue with the items of the innermost unfinished container
+            for key, value in items:
+                if renamed is not None and key_dispatch is not None:
+                    visitors = key_dispatch.get(type(key))
+                    if visitors is None:
+                        visitors = self._key_visitors_for(type(key))
+                    if visitors:
+                        keys.append(key)
+                        new_key = self._call(visitors, key)
+                        keys.pop()
+                        if new_key is not key:
+                            renamed.append((key, new_key))
+
+                visitors = dispatch.get(type(value))
+                if visitors is None:
+                    visitors = self._visitors_for(type(value))
+                if visitors:
+                    keys.append(key)
+                    new_value = self._call(visitors, value)
+                    keys.pop()
+                    if new_value is not value:
+                        container[key] = new_value
+                        value = new_value
+
+                if isinstance(value, (list, dict)):
+                    # The key is removed again once the container is done
+                    keys.append(key)
+                    self._enter(value, stack)
+                    break
+            else:
+                stack.pop()
+                for old, new in renamed or ():
+                    container[new] = container.pop(old)
+                if stack:
+                    keys.pop()
+        return config
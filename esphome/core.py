@@ -8,7 +8,7 @@ import os
 import re
 
 # pylint: disable=unused-import, wrong-import-order
-from typing import Any, Dict, List, Optional, Set, TYPE_CHECKING  # noqa
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple, TYPE_CHECKING  # noqa
 
 from esphome.const import CONF_ARDUINO_VERSION, SOURCE_FILE_EXTENSIONS, \
     CONF_COMMENT, CONF_ESPHOME, CONF_USE_ADDRESS, CONF_WIFI
@@ -288,14 +288,18 @@ class ID:
         self.is_declaration = is_declaration
         self.type: Optional['MockObjClass'] = type
 
+    @property
+    def default_id(self):
+        """The name used for this ID if it isn't given one manually, before making it unique."""
+        base = str(self.type).replace('::', '_').lower()
+        return ''.join(c for c in base if c.isalnum() or c == '_')
+
     def resolve(self, registered_ids):
         from esphome.config_validation import RESERVED_IDS
 
         if self.id is None:
-            base = str(self.type).replace('::', '_').lower()
-            name = ''.join(c for c in base if c.isalnum() or c == '_')
             used = set(registered_ids) | set(RESERVED_IDS)
-            self.id = ensure_unique_string(name, used)
+            self.id = ensure_unique_string(self.default_id, used)
         return self.id
 
     def __str__(self):
@@ -408,6 +412,19 @@ class Library:
         return NotImplemented
 
 
+class _WaitForID:
+    """Yielded by tasks waiting for an ID to be registered, flush_tasks parks them until then."""
+    __slots__ = ('id',)
+
+    def __init__(self, id):
+        self.id = id
+
+
+def _new_variable_stats():
+    # lookups and full_id_lookups count calls, waits how many of them waited for the ID
+    return {'registered': 0, 'lookups': 0, 'full_id_lookups': 0, 'waits': 0}
+
+
 def coroutine(func):
     return coroutine_with_priority(0.0)(func)
 
@@ -436,7 +453,8 @@ def coroutine_with_priority(priority):
                         # Yielded generator, equivalent to 'yield from'
                         x = None
                         for x in var:
-                            yield None
+                            # Waits for IDs are passed up to flush_tasks
+                            yield x if isinstance(x, _WaitForID) else None
                         # Last yield value is the result
                         var = x
                     else:
@@ -505,8 +523,17 @@ class EsphomeCore:
         self.pending_tasks = []
         # Task counter for pending tasks
         self.task_counter = 0
+        # Tasks waiting for an ID to be registered, for each ID the task queue items to push
+        # when it is
+        self.waiting_tasks: Dict['ID', List[tuple]] = {}
+        # The arguments of the tasks in the task queue, to find dependency cycles
+        self.task_args: Dict[Any, tuple] = {}
         # The variable cache, for each ID this holds a MockObj of the variable obj
         self.variables: Dict[str, 'MockObj'] = {}
+        # The registered IDs by name with their variable, to look up the full ID of an ID
+        self.variable_ids: Dict[str, Tuple['ID', 'MockObj']] = {}
+        # Counts of registered variables and lookups, shown by script/benchmark.py
+        self.variable_stats = _new_variable_stats()
         # A list of statements that go in the main setup() block
         self.main_statements: List['Statement'] = []
         # A list of statements to insert in the global block (includes and global variables)
@@ -526,6 +553,21 @@ class EsphomeCore:
         self.component_ids = set()
         # Whether ESPHome was started in verbose mode
         self.verbose = False
+        # Whether parsed YAML files may be cached in the .esphome directory of the config
+        self.yaml_cache = False
+        # Whether YAML source locations are kept in a side table instead of on the values
+        self.compact_locations = False
+        # The Profiler timing the current command, if --profile was given
+        self.profiler = None
+        # Whether the code generated by components may be cached in the .esphome directory
+        self.codegen_cache = False
+        # The recording of the component task flush_tasks is running, if the codegen cache
+        # records it
+        self.codegen_recorder = None
+        # Whether the config of every component is added as a comment to main.cpp
+        self.config_comments = True
+        # Whether the compilation time in the firmware is replaced with a hash of the sources
+        self.reproducible = False
 
     def reset(self):
         self.dashboard = False
@@ -536,17 +578,29 @@ class EsphomeCore:
         self.board = None
         self.raw_config = None
         self.config = None
+        self.loaded_integrations = set()
+        self.reset_codegen()
+
+    def reset_codegen(self, component_ids=()):
+        """Discard all generated code, to generate it again for the same config.
+
+        component_ids are the IDs of the components declared in the config.
+        """
         self.pending_tasks = []
         self.task_counter = 0
+        self.waiting_tasks = {}
+        self.task_args = {}
         self.variables = {}
+        self.variable_ids = {}
+        self.variable_stats = _new_variable_stats()
         self.main_statements = []
         self.global_statements = []
         self.libraries = []
         self.build_flags = set()
         self.defines = set()
         self.active_coroutines = {}
-        self.loaded_integrations = set()
-        self.component_ids = set()
+        self.component_ids = set(component_ids)
+        self.codegen_recorder = None
 
     @property
     def address(self) -> Optional[str]:
@@ -595,7 +649,10 @@ class EsphomeCore:
     def relative_config_path(self, *path):
         # pylint: disable=no-value-for-parameter
         path_ = os.path.expanduser(os.path.join(*path))
-        return os.path.join(self.config_dir, path_)
+        path_ = os.path.join(self.config_dir, path_)
+        if self.codegen_recorder is not None:
+            self.codegen_recorder.read_file(path_)
+        return path_
 
     def relative_build_path(self, *path):
         # pylint: disable=no-value-for-parameter
@@ -619,6 +676,14 @@ class EsphomeCore:
     def firmware_bin(self):
         return self.relative_pioenvs_path(self.name, 'firmware.bin')
 
+    @property
+    def firmware_elf(self):
+        return self.relative_pioenvs_path(self.name, 'firmware.elf')
+
+    @property
+    def firmware_map(self):
+        return self.relative_pioenvs_path(self.name, 'firmware.map')
+
     @property
     def is_esp8266(self):
         if self.esp_platform is None:
@@ -634,13 +699,17 @@ class EsphomeCore:
     def add_job(self, func, *args, **kwargs):
         coro = coroutine(func)
         task = coro(*args, **kwargs)
+        if self.codegen_recorder is not None:
+            self.codegen_recorder.add_job()
         item = (-coro.priority, self.task_counter, task)
         self.task_counter += 1
         heapq.heappush(self.pending_tasks, item)
+        self.task_args[task] = args
         return task
 
     def flush_tasks(self):
         i = 0
+        parked = 0
         while self.pending_tasks:
             i += 1
             if i > 1000000:
@@ -650,15 +719,27 @@ class EsphomeCore:
             priority = -inv_priority
             _LOGGER.debug("Running %s (num %s)", task, num)
             try:
-                next(task)
-                # Decrease priority over time, so that if this task is blocked
-                # due to a dependency others will clear the dependency
-                # This could be improved with a less naive approach
+                if self.profiler is None:
+                    result = next(task)
+                else:
+                    result = self.profiler.run_task(task)
+                # Decrease priority over time, so that tasks that take several steps let
+                # the others with the same priority run in between
                 priority -= 1
                 item = (-priority, num, task)
+                if isinstance(result, _WaitForID) and result.id not in self.variables:
+                    # Instead of polling, register_variable pushes the task again
+                    self.waiting_tasks.setdefault(result.id, []).append(item)
+                    parked += 1
+                    continue
                 heapq.heappush(self.pending_tasks, item)
             except StopIteration:
                 _LOGGER.debug(" -> finished")
+                self.task_args.pop(task, None)
+        _LOGGER.debug("Ran %s task steps, parked %s tasks waiting for IDs", i, parked)
+
+        if self.waiting_tasks:
+            raise self._dependency_error()
 
         # Print not-awaited coroutines
         for obj in self.active_coroutines.values():
@@ -674,6 +755,38 @@ class EsphomeCore:
             raise EsphomeError()
         self.active_coroutines.clear()
 
+    def _dependency_error(self):
+        """Describe why the tasks in waiting_tasks can't continue."""
+        from esphome.config import iter_ids
+
+        waiting_for = {}
+        for id_, items in self.waiting_tasks.items():
+            for _, _, task in items:
+                waiting_for[task] = id_
+        # The waiting task that generates the code of each declared ID
+        declared_by = {}
+        for task in waiting_for:
+            for id_, _ in iter_ids(list(self.task_args.get(task, ()))):
+                if id_.is_declaration:
+                    declared_by.setdefault(id_, task)
+
+        for start, waiting_id in waiting_for.items():
+            chain = [start]
+            task = declared_by.get(waiting_id)
+            while task is not None and task not in chain:
+                chain.append(task)
+                task = declared_by.get(waiting_for[task])
+            if task is None:
+                continue
+            # Each task in the cycle waits for the ID declared by the next one
+            ids = [waiting_for[task_] for task_ in chain[chain.index(task):]]
+            ids.insert(0, ids[-1])
+            requires = ', '.join(f"'{a}' requires '{b}'" for a, b in zip(ids, ids[1:]))
+            return EsphomeError(f"Circular dependency detected! {requires}.")
+        ids = ', '.join(sorted(f"'{id_}'" for id_ in self.waiting_tasks))
+        return EsphomeError(f"Code generation is waiting for IDs that are never registered: "
+                            f"{ids}.")
+
     def add(self, expression):
         from esphome.cpp_generator import Expression, Statement, statement
 
@@ -685,6 +798,8 @@ class EsphomeCore:
 
         self.main_statements.append(expression)
         _LOGGER.debug("Adding: %s", expression)
+        if self.codegen_recorder is not None:
+            self.codegen_recorder.add(expression)
         return expression
 
     def add_global(self, expression):
@@ -697,6 +812,8 @@ class EsphomeCore:
                              "".format(expression, type(expression)))
         self.global_statements.append(expression)
         _LOGGER.debug("Adding global: %s", expression)
+        if self.codegen_recorder is not None:
+            self.codegen_recorder.add_global(expression)
         return expression
 
     def add_library(self, library):
@@ -704,6 +821,8 @@ class EsphomeCore:
             raise ValueError("Library {} must be instance of Library, not {}"
                              "".format(library, type(library)))
         _LOGGER.debug("Adding library: %s", library)
+        if self.codegen_recorder is not None:
+            self.codegen_recorder.add_library(library)
         for other in self.libraries[:]:
             if other.name != library.name:
                 continue
@@ -727,6 +846,8 @@ class EsphomeCore:
     def add_build_flag(self, build_flag):
         self.build_flags.add(build_flag)
         _LOGGER.debug("Adding build flag: %s", build_flag)
+        if self.codegen_recorder is not None:
+            self.codegen_recorder.add_build_flag(build_flag)
         return build_flag
 
     def add_define(self, define):
@@ -739,58 +860,81 @@ class EsphomeCore:
                              "".format(define, type(define)))
         self.defines.add(define)
         _LOGGER.debug("Adding define: %s", define)
+        if self.codegen_recorder is not None:
+            self.codegen_recorder.add_define(define)
         return define
 
     def get_variable(self, id):
         if not isinstance(id, ID):
             raise ValueError(f"ID {id!r} must be of type ID!")
+        self.variable_stats['lookups'] += 1
+        if self.codegen_recorder is not None:
+            self.codegen_recorder.get_variable(id, full_id=False)
+        if id not in self.variables:
+            self.variable_stats['waits'] += 1
         while True:
             if id in self.variables:
                 yield self.variables[id]
                 return
             _LOGGER.debug("Waiting for variable %s (%r)", id, id)
-            yield None
+            yield _WaitForID(id)
 
     def get_variable_with_full_id(self, id):
+        self.variable_stats['full_id_lookups'] += 1
+        if self.codegen_recorder is not None:
+            self.codegen_recorder.get_variable(id, full_id=True)
+        if id.id not in self.variable_ids:
+            self.variable_stats['waits'] += 1
         while True:
-            if id in self.variables:
-                for k, v in self.variables.items():
-                    if k == id:
-                        yield (k, v)
-                        return
+            if id.id in self.variable_ids:
+                yield self.variable_ids[id.id]
+                return
             _LOGGER.debug("Waiting for variable %s", id)
-            yield None, None
+            yield _WaitForID(id)
 
     def register_variable(self, id, obj):
         if id in self.variables:
             raise EsphomeError(f"ID {id} is already registered")
         _LOGGER.debug("Registered variable %s of type %s", id.id, id.type)
         self.variables[id] = obj
+        self.variable_ids[id.id] = (id, obj)
+        self.variable_stats['registered'] += 1
+        if self.codegen_recorder is not None:
+            self.codegen_recorder.register_variable(id, obj)
+        for item in self.waiting_tasks.pop(id, ()):
+            heapq.heappush(self.pending_tasks, item)
 
     def has_id(self, id):
-        return id in self.variables
+        result = id in self.variables
+        if self.codegen_recorder is not None:
+            self.codegen_recorder.has_id(id, result)
+        return result
 
-    @property
-    def cpp_main_section(self):
+    @staticmethod
+    def _iter_statements(statements):
         from esphome.cpp_generator import statement
 
-        main_code = []
-        for exp in self.main_statements:
-            text = str(statement(exp))
-            text = text.rstrip()
-            main_code.append(text)
-        return '\n'.join(main_code) + '\n\n'
+        for exp in statements:
+            yield str(statement(exp)).rstrip()
+
+    def iter_cpp_main_section(self):  # type: () -> Iterator[str]
+        """The C++ code of the main statements, one statement at a time.
+
+        Joined with newlines, this is cpp_main_section without the trailing blank line.
+        """
+        return self._iter_statements(self.main_statements)
+
+    def iter_cpp_global_section(self):  # type: () -> Iterator[str]
+        """The C++ code of the global statements, one statement at a time."""
+        return self._iter_statements(self.global_statements)
 
     @property
-    def cpp_global_section(self):
-        from esphome.cpp_generator import statement
+    def cpp_main_section(self):
+        return '\n'.join(self.iter_cpp_main_section()) + '\n\n'
 
-        global_code = []
-        for exp in self.global_statements:
-            text = str(statement(exp))
-            text = text.rstrip()
-            global_code.append(text)
-        return '\n'.join(global_code) + '\n'
+    @property
+    def cpp_global_section(self):
+        return '\n'.join(self.iter_cpp_global_section()) + '\n'
 
 
 class AutoLoad(OrderedDict):
@@ -83,6 +83,9 @@ def default_build_path():
     return CORE.name
 
 
+# The macro of the build ID that replaces the compilation time with --reproducible
+BUILD_ID_MACRO = 'ESPHOME_BUILD_ID'
+
 VALID_INCLUDE_EXTS = {'.h', '.hpp', '.tcc', '.ino', '.cpp', '.c'}
 
 
@@ -212,7 +215,12 @@ def _esp8266_add_lwip_type():
 @coroutine_with_priority(100.0)
 def to_code(config):
     cg.add_global(cg.global_ns.namespace('esphome').using)
-    cg.add(cg.App.pre_setup(config[CONF_NAME], cg.RawExpression('__DATE__ ", " __TIME__')))
+    if CORE.reproducible:
+        # Defined by writer.write_cpp once all sources are generated
+        compilation_time = cg.RawExpression(BUILD_ID_MACRO)
+    else:
+        compilation_time = cg.RawExpression('__DATE__ ", " __TIME__')
+    cg.add(cg.App.pre_setup(config[CONF_NAME], compilation_time))
 
     for conf in config.get(CONF_ON_BOOT, []):
         trigger = cg.new_Pvariable(conf[CONF_TRIGGER_ID], conf.get(CONF_PRIORITY))
@@ -252,6 +260,8 @@ def to_code(config):
     cg.add_build_flag('-Wno-unused-variable')
     cg.add_build_flag('-Wno-unused-but-set-variable')
     cg.add_build_flag('-Wno-sign-compare')
+    # The linker map of the firmware, for esphome size
+    cg.add_build_flag('-Wl,-Map,$BUILD_DIR/firmware.map')
     if config.get(CONF_ESP8266_RESTORE_FROM_FLASH, False):
         cg.add_define('USE_ESP8266_PREFERENCES_FLASH')
 
@@ -24,7 +24,8 @@ class Expression(abc.ABC):
 
 
 SafeExpType = Union[Expression, bool, str, str, int, float, TimePeriod,
-                    Type[bool], Type[int], Type[float], Sequence[Any]]
+                    Type[bool], Type[int], Type[float], Sequence[Any], bytes, bytearray,
+                    memoryview]
 
 
 class RawExpression(Expression):
@@ -162,6 +163,30 @@ class ArrayInitializer(Expression):
         return cpp
 
 
+class ByteArrayInitializer(Expression):
+    """An array initializer for binary data like images and fonts, with one line per
+    BYTES_PER_LINE bytes.
+
+    Formats the whole buffer at once, instead of creating and formatting a HexIntLiteral for
+    every byte like ArrayInitializer.
+    """
+    __slots__ = ("data", )
+
+    BYTES_PER_LINE = 16
+    _HEX_BYTES = tuple(str(HexInt(i)) for i in range(256))
+
+    def __init__(self, data: Union[bytes, bytearray, memoryview]):
+        self.data = bytes(data)
+
+    def __str__(self):
+        if not self.data:
+            return '{}'
+        data, step = self.data, self.BYTES_PER_LINE
+        hex_bytes = self._HEX_BYTES.__getitem__
+        lines = [', '.join(map(hex_bytes, data[i:i + step])) for i in range(0, len(data), step)]
+        return '{\n  ' + ',\n  '.join(lines) + ',\n}'
+
+
 class ParameterExpression(Expression):
     __slots__ = ("type", "id")
 
@@ -308,6 +333,8 @@ def safe_exp(obj: SafeExpType) -> Expression:
         return IntLiteral(int(obj.total_minutes))
     if isinstance(obj, (tuple, list)):
         return ArrayInitializer(*[safe_exp(o) for o in obj])
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return ByteArrayInitializer(obj)
     if obj is bool:
         return bool_
     if obj is int:
@@ -376,6 +403,10 @@ class ProgmemAssignmentExpression(AssignmentExpression):
 
 
 def progmem_array(id_, rhs) -> "MockObj":
+    if isinstance(rhs, list) and rhs and \
+            all(isinstance(x, HexInt) and 0 <= x <= 0xFF for x in rhs):
+        # Data built as a list of HexInt bytes, format it as a ByteArrayInitializer
+        rhs = bytes(rhs)
     rhs = safe_exp(rhs)
     obj = MockObj(id_, '.')
     assignment = ProgmemAssignmentExpression(id_.type, id_, rhs, obj)
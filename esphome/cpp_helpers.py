@@ -42,6 +42,8 @@ def register_component(var, config):
                          "or was registered twice. Please create a bug report with your "
                          "configuration.".format(id_))
     CORE.component_ids.remove(id_)
+    if CORE.codegen_recorder is not None:
+        CORE.codegen_recorder.register_component(id_)
     if CONF_SETUP_PRIORITY in config:
         add(var.set_setup_priority(config[CONF_SETUP_PRIORITY]))
     if CONF_UPDATE_INTERVAL in config:
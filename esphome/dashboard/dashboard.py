@@ -27,6 +27,7 @@ import tornado.websocket
 
 from esphome import const, util
 from esphome.helpers import mkdir_p, get_bool_env, run_system_command
+from esphome.profiler import ext_profile_path, load_profile
 from esphome.storage_json import EsphomeStorageJSON, StorageJSON, \
     esphome_storage_path, ext_storage_path, trash_storage_path
 from esphome.util import shlex_quote, get_serial_ports
@@ -67,6 +68,10 @@ class DashboardSettings:
     def status_use_ping(self):
         return get_bool_env('ESPHOME_DASHBOARD_USE_PING')
 
+    @property
+    def profile_builds(self):
+        return get_bool_env('ESPHOME_DASHBOARD_PROFILE')
+
     @property
     def using_hassio_auth(self):
         if not self.on_hassio:
@@ -265,17 +270,22 @@ class EsphomeLogsHandler(EsphomeCommandWebSocket):
                 json_message["port"]]
 
 
+def _profile_args():
+    """Return the arguments to time builds, if enabled with ESPHOME_DASHBOARD_PROFILE."""
+    return ["--profile"] if settings.profile_builds else []
+
+
 class EsphomeUploadHandler(EsphomeCommandWebSocket):
     def build_command(self, json_message):
         config_file = settings.rel_path(json_message['configuration'])
-        return ["esphome", "--dashboard", config_file, "run", '--upload-port',
-                json_message["port"]]
+        return ["esphome", "--dashboard", *_profile_args(), config_file, "run",
+                '--upload-port', json_message["port"]]
 
 
 class EsphomeCompileHandler(EsphomeCommandWebSocket):
     def build_command(self, json_message):
         config_file = settings.rel_path(json_message['configuration'])
-        return ["esphome", "--dashboard", config_file, "compile"]
+        return ["esphome", "--dashboard", *_profile_args(), config_file, "compile"]
 
 
 class EsphomeValidateHandler(EsphomeCommandWebSocket):
@@ -368,6 +378,23 @@ class DownloadBinaryRequestHandler(BaseHandler):
         self.finish()
 
 
+class ProfileRequestHandler(BaseHandler):
+    @authenticated
+    @bind_config
+    def get(self, configuration=None):
+        if not settings.profile_builds:
+            # Don't show the report of an older build
+            self.send_error(404)
+            return
+        # pylint: disable=no-value-for-parameter
+        report = load_profile(ext_profile_path(settings.config_dir, configuration))
+        if report is None:
+            self.send_error(404)
+            return
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps(report))
+
+
 def _list_dashboard_entries():
     files = settings.list_yaml_files()
     return [DashboardEntry(file) for file in files]
@@ -715,6 +742,7 @@ def make_app(debug=False):
         (rel + "update-all", EsphomeUpdateAllHandler),
         (rel + "edit", EditRequestHandler),
         (rel + "download.bin", DownloadBinaryRequestHandler),
+        (rel + "profile", ProfileRequestHandler),
         (rel + "serial-ports", SerialPortRequestHandler),
         (rel + "ping", PingRequestHandler),
         (rel + "delete", DeleteRequestHandler),
@@ -565,6 +565,40 @@ const validateModal = new LogModal({
 
 validateModal.setup();
 
+// Append the build time breakdown written by `esphome --profile` to a log area, the dashboard
+// only profiles builds if ESPHOME_DASHBOARD_PROFILE is set
+const showBuildProfile = (logElement, filename) => {
+  fetch(`./profile?configuration=${encodeURIComponent(filename)}`, { credentials: "same-origin" })
+    .then(res => res.ok ? res.json() : null)
+    .then(report => {
+      if (report === null) {
+        return;
+      }
+      const seconds = (timing) => `${timing.wall.toFixed(2)}s (CPU ${timing.cpu.toFixed(2)}s)`;
+      let lines = ["", `Build time breakdown: ${seconds(report)}`];
+      const addPhases = (phases, depth) => {
+        for (const phase of phases) {
+          lines.push(`${"  ".repeat(depth)}${phase.name}: ${seconds(phase)}`);
+          addPhases(phase.phases || [], depth + 1);
+        }
+      };
+      addPhases(report.phases, 1);
+
+      const total = (kinds) => Object.values(kinds).reduce((sum, timing) => sum + timing.wall, 0);
+      const components = Object.entries(report.components)
+        .sort(([, a], [, b]) => total(b) - total(a))
+        .slice(0, 10);
+      if (components.length !== 0) {
+        lines.push("Slowest components:");
+      }
+      for (const [name, kinds] of components) {
+        const parts = Object.entries(kinds).map(([kind, timing]) => `${kind} ${seconds(timing)}`);
+        lines.push(`  ${name}: ${parts.join(", ")}`);
+      }
+      logElement.appendChild(document.createTextNode(lines.join("\n") + "\n"));
+    });
+};
+
 // Compile Modal
 const compileModal = new LogModal({
   name: 'compile',
@@ -585,6 +619,7 @@ const compileModal = new LogModal({
         displayLength: 10000,
       });
     }
+    showBuildProfile(compileModal.logElement, compileModal.activeFilename);
     modalElement.querySelector("#js-compile-modal [data-action='stop-logs']").innerHTML = "Close";
   },
   onSocketClose: (modalElement) => {
@@ -0,0 +1,176 @@
+"""Pure Python reader of the symbol table of firmware ELF files.
+
+Resolves addresses to function+offset without the toolchain, for example to decode stack traces
+on hosts that only have the firmware.elf of a node. Only the section headers, .symtab and its
+string table are read.
+"""
+from bisect import bisect_right
+from collections import namedtuple
+import os
+import struct
+
+from esphome.core import EsphomeError
+from esphome.helpers import file_hash
+
+# pylint: disable=unused-import, wrong-import-order
+from typing import Dict, List, Optional, Tuple  # noqa
+
+ELF_MAGIC = b'\x7fELF'
+SHT_SYMTAB = 2
+SHF_ALLOC = 0x2
+SHN_UNDEF = 0
+# Special section indices like SHN_ABS and SHN_COMMON start here
+SHN_LORESERVE = 0xff00
+STT_FUNC = 2
+
+Symbol = namedtuple('Symbol', ['address', 'size', 'name', 'section'])
+Section = namedtuple('Section', ['name', 'type', 'flags', 'address', 'size'])
+
+# Class (32 or 64 bit) -> (offset of e_shoff, format of e_shoff, format of the section header,
+# format of a symbol and the order of address, size, name, info and section index in it)
+_LAYOUTS = {
+    1: (0x20, 'I', 'IIIIIIIIII', 'IIIBBH', (1, 2, 0, 3, 5)),
+    2: (0x28, 'Q', 'IIQQQQIIQQ', 'IBBHQQ', (4, 5, 0, 1, 3)),
+}
+
+
+class _Section:
+    def __init__(self, fields):
+        self.name_offset, self.type, self.flags, self.addr, self.offset, self.size, self.link, \
+            _, _, self.entsize = fields
+        self.name = None
+
+
+class SymbolIndex:
+    """The symbols of an ELF file sorted by address."""
+
+    def __init__(self, symbols):  # type: (List[Symbol]) -> None
+        self.symbols = sorted(symbols, key=lambda x: (x.address, -x.size, x.name))
+        self._addresses = [symbol.address for symbol in self.symbols]
+
+    @classmethod
+    def from_file(cls, path, functions_only=True):
+        """Read the symbols of the ELF file at path, only functions if functions_only."""
+        return cls(_read_elf(path, lambda f_handle: _read_symbols(f_handle, functions_only)))
+
+    def lookup(self, address):  # type: (int) -> Optional[Tuple[Symbol, int]]
+        """Return the symbol containing address and the offset of address in it."""
+        i = bisect_right(self._addresses, address) - 1
+        if i < 0:
+            return None
+        symbol = self.symbols[i]
+        offset = address - symbol.address
+        # Symbols without size (like assembler labels) contain everything up to the next one
+        if symbol.size and offset >= symbol.size:
+            return None
+        return symbol, offset
+
+    def resolve(self, address):  # type: (int) -> Optional[str]
+        """Return address as function+offset, None if no function contains it."""
+        found = self.lookup(address)
+        if found is None:
+            return None
+        symbol, offset = found
+        return f'{symbol.name}+0x{offset:x}'
+
+
+def read_sections(path):  # type: (str) -> List[Section]
+    """Read the section table of the ELF file at path."""
+    def read(f_handle):
+        return [Section(section.name, section.type, section.flags, section.addr, section.size)
+                for section in _read_section_headers(f_handle)[1]]
+
+    return _read_elf(path, read)
+
+
+def _read_elf(path, func):
+    try:
+        with open(path, 'rb') as f_handle:
+            return func(f_handle)
+    except OSError as err:
+        raise EsphomeError(f"Error reading ELF file {path}: {err}") from err
+    except struct.error as err:
+        raise EsphomeError(f"{path} is not a valid ELF file: {err}") from err
+
+
+def _read_section(f_handle, section):
+    f_handle.seek(section.offset)
+    return f_handle.read(section.size)
+
+
+def _read_section_headers(f_handle):
+    """Return the format of symbols and the sections with their names."""
+    ident = f_handle.read(16)
+    if len(ident) < 16 or ident[:4] != ELF_MAGIC or ident[4] not in _LAYOUTS or \
+            ident[5] not in (1, 2):
+        raise struct.error("no ELF header")
+    shoff_pos, shoff_format, section_format, symbol_format, order = _LAYOUTS[ident[4]]
+    endian = '<' if ident[5] == 1 else '>'
+
+    header = ident + f_handle.read(shoff_pos + 0x20 - 16)
+    shoff, = struct.unpack_from(endian + shoff_format, header, shoff_pos)
+    # e_shentsize, e_shnum and e_shstrndx are the last fields of the header
+    shentsize, shnum, shstrndx = struct.unpack_from(
+        endian + 'HHH', header, shoff_pos + struct.calcsize(shoff_format) + 10)
+    section_struct = struct.Struct(endian + section_format)
+    if shnum == 0 or shentsize < section_struct.size:
+        raise struct.error("no section headers")
+    f_handle.seek(shoff)
+    data = f_handle.read(shentsize * shnum)
+    sections = [_Section(section_struct.unpack_from(data, i * shentsize))
+                for i in range(shnum)]
+
+    if shstrndx < shnum:
+        names = _read_section(f_handle, sections[shstrndx])
+        for section in sections:
+            section.name = _string(names, section.name_offset)
+    return (struct.Struct(endian + symbol_format), order), sections
+
+
+def _read_symbols(f_handle, functions_only):
+    (symbol_struct, order), sections = _read_section_headers(f_handle)
+    shnum = len(sections)
+    symbols = []
+    address_i, size_i, name_i, info_i, shndx_i = order
+    for symtab in sections:
+        if symtab.type != SHT_SYMTAB or symtab.link >= shnum:
+            continue
+        strings = _read_section(f_handle, sections[symtab.link])
+        data = _read_section(f_handle, symtab)
+        data = data[:len(data) - len(data) % symbol_struct.size]
+        for fields in symbol_struct.iter_unpack(data):
+            shndx = fields[shndx_i]
+            if shndx == SHN_UNDEF or (functions_only and fields[info_i] & 0xf != STT_FUNC):
+                continue
+            name = _string(strings, fields[name_i])
+            if not name:
+                continue
+            section = sections[shndx].name if shndx < min(shnum, SHN_LORESERVE) else None
+            symbols.append(Symbol(fields[address_i], fields[size_i], name, section))
+    return symbols
+
+
+def _string(table, offset):  # type: (bytes, int) -> str
+    end = table.find(b'\0', offset)
+    return table[offset:end if end >= 0 else len(table)].decode('utf-8', 'replace')
+
+
+# ELF hash -> its function index, and (path, size, mtime) -> ELF hash
+_INDEXES = {}  # type: Dict[bytes, SymbolIndex]
+_HASHES = {}  # type: Dict[Tuple[str, int, int], bytes]
+
+
+def symbol_index(path):  # type: (str) -> SymbolIndex
+    """Return the function index of the ELF file at path, memoised by the hash of the file."""
+    try:
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        digest = _HASHES.get(key)
+        if digest is None:
+            digest = _HASHES[key] = file_hash(path)
+    except OSError as err:
+        raise EsphomeError(f"Error reading ELF file {path}: {err}") from err
+    index = _INDEXES.get(digest)
+    if index is None:
+        index = _INDEXES[digest] = SymbolIndex.from_file(path)
+    return index
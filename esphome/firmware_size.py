@@ -0,0 +1,218 @@
+"""Attribution of the flash and RAM of the compiled firmware to components.
+
+The sections of the firmware ELF give the size of every memory region. The linker map
+(firmware.map, written with -Wl,-Map) gives the object file of every input section, which
+copy_src_tree places in src/esphome/components/<name>/ for components. Without the map, symbols
+are attributed by their C++ namespace, which only covers named symbols in esphome::<name>.
+"""
+import json
+import logging
+import os
+import re
+
+from esphome import elf_symbols
+from esphome.core import EsphomeError
+from esphome.helpers import read_file, write_file
+
+# pylint: disable=unused-import, wrong-import-order
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple  # noqa
+
+_LOGGER = logging.getLogger(__name__)
+
+# Bump this when the format of the JSON report changes
+SIZE_REPORT_VERSION = 1
+
+FLASH = 'flash'
+IRAM = 'iram'
+DRAM = 'dram'
+BSS = 'bss'
+REGIONS = (FLASH, IRAM, DRAM, BSS)
+
+# Region of the sections in the ESP8266 and ESP32 linker scripts. .data and .rodata of the
+# ESP8266 are loaded to DRAM from flash, they count as DRAM.
+SECTION_REGIONS = {
+    '.irom0.text': FLASH,
+    '.flash.text': FLASH,
+    '.flash.rodata': FLASH,
+    '.text': IRAM,
+    '.iram0.vectors': IRAM,
+    '.iram0.text': IRAM,
+    '.data': DRAM,
+    '.rodata': DRAM,
+    '.dram0.data': DRAM,
+    '.bss': BSS,
+    '.noinit': BSS,
+    '.dram0.bss': BSS,
+}
+
+# Pseudo components for code outside of the components
+CORE_COMPONENT = '[core]'
+MAIN_COMPONENT = '[main]'
+OTHER_COMPONENT = '[other]'
+UNATTRIBUTED = '[unattributed]'
+
+_COMPONENT_OBJECT_RE = re.compile(r'(?:^|/)src/esphome/components/([^/]+)/')
+_CORE_OBJECT_RE = re.compile(r'(?:^|/)src/esphome/core/')
+_MAIN_OBJECT_RE = re.compile(r'(?:^|/)src/main\.cpp\.o$')
+# Mangled names in the esphome namespace: functions, local statics, vtables and type info
+_ESPHOME_SYMBOL_RE = re.compile(r'_Z(?:Z|T[VIST])?N[rVK]*7esphome(\d+)')
+
+# A section of the map, the indented input sections have the object file after their size
+_MAP_SECTION_RE = re.compile(r'^( ?)(\.\S+|COMMON)(?:\s+0x([0-9a-fA-F]+)\s+0x([0-9a-fA-F]+)'
+                             r'(?:\s+(.*\S))?)?\s*$')
+# The address and size of a section whose name is too long for the column
+_MAP_CONTINUATION_RE = re.compile(r'^\s+0x[0-9a-fA-F]+\s+0x[0-9a-fA-F]+(?:\s|$)')
+
+
+def parse_map(path):  # type: (str) -> List[Tuple[str, int, str]]
+    """Return the input sections of the linker map at path as (output section, size, object)."""
+    return list(_parse_map_lines(read_file(path).splitlines()))
+
+
+def _parse_map_lines(lines):  # type: (Iterable[str]) -> Iterator[Tuple[str, int, str]]
+    lines = iter(lines)
+    # Discarded input sections and the memory configuration come first
+    for line in lines:
+        if line.startswith('Linker script and memory map'):
+            break
+    output = None
+    pending = None
+    for line in lines:
+        if pending is not None and _MAP_CONTINUATION_RE.match(line):
+            line = pending + line
+        pending = None
+        match = _MAP_SECTION_RE.match(line)
+        if match is None:
+            continue
+        indent, name, _, size, rest = match.groups()
+        if not indent:
+            output = name
+        if size is None:
+            pending = line
+        elif indent and rest and int(size, 16):
+            yield output, int(size, 16), rest
+
+
+def object_component(path):  # type: (str) -> str
+    """Return the component the object file at path was compiled from."""
+    path = path.replace('\\', '/')
+    match = _COMPONENT_OBJECT_RE.search(path)
+    if match is not None:
+        return match.group(1)
+    if _CORE_OBJECT_RE.search(path):
+        return CORE_COMPONENT
+    if _MAIN_OBJECT_RE.search(path):
+        return MAIN_COMPONENT
+    return OTHER_COMPONENT
+
+
+def symbol_component(name, components):  # type: (str, Iterable[str]) -> str
+    """Return the component of a mangled symbol name by its namespace."""
+    match = _ESPHOME_SYMBOL_RE.match(name)
+    if match is None:
+        return OTHER_COMPONENT
+    namespace = name[match.end():match.end() + int(match.group(1))]
+    # The namespace of components named like C++ keywords ends with _, like template_
+    if namespace.rstrip('_') in components:
+        return namespace.rstrip('_')
+    return CORE_COMPONENT
+
+
+def _attribute_map(map_path, sections):
+    for output, size, obj in parse_map(map_path):
+        if output in sections:
+            yield object_component(obj), output, size
+
+
+def _attribute_symbols(elf_path, sections, components):
+    end = 0
+    for symbol in elf_symbols.SymbolIndex.from_file(elf_path, functions_only=False).symbols:
+        # Skip aliases and symbols inside of others
+        if symbol.section not in sections or not symbol.size or symbol.address < end:
+            continue
+        end = symbol.address + symbol.size
+        yield symbol_component(symbol.name, components), symbol.section, symbol.size
+
+
+def size_report(elf_path, map_path=None, components=()):
+    # type: (str, Optional[str], Iterable[str]) -> dict
+    """Return the bytes every component uses of every memory region of the firmware."""
+    if not os.path.isfile(elf_path):
+        raise EsphomeError(f"Could not find the firmware {elf_path}, please compile it first.")
+    sections = {section.name: section for section in elf_symbols.read_sections(elf_path)
+                if section.flags & elf_symbols.SHF_ALLOC and section.name in SECTION_REGIONS}
+
+    if map_path is not None and os.path.isfile(map_path):
+        attributed = _attribute_map(map_path, sections)
+    else:
+        _LOGGER.warning("No linker map %s, attributing symbols by their namespace only.",
+                        map_path)
+        attributed = _attribute_symbols(elf_path, sections, set(components))
+
+    report = {name: dict.fromkeys(REGIONS, 0) for name in (OTHER_COMPONENT, UNATTRIBUTED)}
+    unattributed = {name: section.size for name, section in sections.items()}
+    for component, section, size in attributed:
+        report.setdefault(component, dict.fromkeys(REGIONS, 0))
+        report[component][SECTION_REGIONS[section]] += size
+        unattributed[section] -= size
+    totals = dict.fromkeys(REGIONS, 0)
+    for name, section in sections.items():
+        totals[SECTION_REGIONS[name]] += section.size
+        report[UNATTRIBUTED][SECTION_REGIONS[name]] += max(unattributed[name], 0)
+    return {'version': SIZE_REPORT_VERSION, 'regions': totals,
+            'components': {name: report[name] for name in sorted(report)}}
+
+
+def read_report(path):  # type: (str) -> dict
+    try:
+        report = json.loads(read_file(path))
+    except ValueError as err:
+        raise EsphomeError(f"Could not read size report {path}: {err}") from err
+    if not isinstance(report, dict) or report.get('version') != SIZE_REPORT_VERSION:
+        raise EsphomeError(f"{path} is not a size report of this ESPHome version.")
+    return report
+
+
+def write_report(path, report):  # type: (str, dict) -> None
+    write_file(path, json.dumps(report, indent=2, sort_keys=True) + '\n')
+
+
+def diff_reports(old, new):  # type: (dict, dict) -> dict
+    """Return the change of the bytes every component uses, only of components that changed."""
+    changes = {}
+    empty = dict.fromkeys(REGIONS, 0)
+    for name in sorted(set(old['components']) | set(new['components'])):
+        old_sizes = old['components'].get(name, empty)
+        new_sizes = new['components'].get(name, empty)
+        change = {region: new_sizes.get(region, 0) - old_sizes.get(region, 0)
+                  for region in REGIONS}
+        if any(change.values()):
+            changes[name] = change
+    return {'regions': {region: new['regions'].get(region, 0) - old['regions'].get(region, 0)
+                        for region in REGIONS},
+            'components': changes}
+
+
+def _format_table(rows, total, signed=False):
+    """Format the bytes of rows of components, the largest first, and the total."""
+    width = max([len(name) for name in rows] + [len('Component')]) + 2
+    sign = '+' if signed else ''
+
+    def format_line(name, sizes):
+        return f'{name:<{width}}' + ''.join(f'{sizes.get(region, 0):>{sign}10}'
+                                            for region in REGIONS)
+
+    lines = [f'{"Component":<{width}}' + ''.join(f'{region.upper():>10}' for region in REGIONS)]
+    for name, sizes in sorted(rows.items(), key=lambda x: (-sum(map(abs, x[1].values())), x[0])):
+        lines.append(format_line(name, sizes))
+    lines.append(format_line('Total', total))
+    return '\n'.join(lines)
+
+
+def format_report(report):  # type: (dict) -> str
+    rows = {name: sizes for name, sizes in report['components'].items() if any(sizes.values())}
+    return _format_table(rows, report['regions'])
+
+
+def format_diff(diff):  # type: (dict) -> str
+    return _format_table(diff['components'], diff['regions'], signed=True)
@@ -1,9 +1,10 @@
 import codecs
+import hashlib
 
 import logging
 import os
 from pathlib import Path
-from typing import Union
+from typing import Iterable, Optional, Union
 import tempfile
 
 _LOGGER = logging.getLogger(__name__)
@@ -221,6 +222,57 @@ def write_file_if_changed(path: Union[Path, str], text: str):
         write_file(path, text)
 
 
+def file_hash(path: Union[Path, str]) -> bytes:
+    """Return the SHA-256 digest of the contents of the file at path."""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f_handle:
+        for blob in iter(lambda: f_handle.read(64 * 1024), b''):
+            hasher.update(blob)
+    return hasher.digest()
+
+
+def write_chunks_if_changed(path: Union[Path, str], chunks: Iterable[str],
+                            digest: Optional[bytes] = None) -> bool:
+    """Write the concatenation of chunks to path, only replacing it if the contents changed.
+
+    The chunks are streamed to a temporary file next to path while hashing them, so the full
+    text is never held in memory. digest is the file_hash of path if the caller knows it, then
+    path isn't read. Return True if path was replaced.
+    """
+    if not isinstance(path, Path):
+        path = Path(path)
+    directory = path.parent
+
+    tmp_path = None
+    try:
+        directory.mkdir(exist_ok=True, parents=True)
+        old_hash = digest
+        if old_hash is None and path.is_file():
+            old_hash = file_hash(path)
+        hasher = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(mode="wb", dir=directory, delete=False) as f_handle:
+            tmp_path = f_handle.name
+            for chunk in chunks:
+                data = chunk.encode()
+                hasher.update(data)
+                f_handle.write(data)
+        if hasher.digest() == old_hash:
+            return False
+        # Newer tempfile implementations create the file with mode 0o600
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+        return True
+    except OSError as err:
+        from esphome.core import EsphomeError
+        raise EsphomeError(f"Could not write file at {path}") from err
+    finally:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except OSError as err:
+                _LOGGER.error("Write file cleanup failed: %s", err)
+
+
 def copy_file_if_changed(src, dst):
     import shutil
     if file_compare(src, dst):
@@ -1,12 +1,19 @@
+from collections import OrderedDict
+import atexit
 import json
-from typing import Union
+from typing import Dict, List, Optional, Union  # noqa
 
 import logging
 import os
+import queue
 import re
 import subprocess
+import threading
+import time
 
-from esphome.core import CORE
+from esphome import elf_symbols
+from esphome.core import CORE, EsphomeError
+from esphome.helpers import file_hash, write_file
 from esphome.util import run_external_command, run_external_process
 
 _LOGGER = logging.getLogger(__name__)
@@ -91,7 +98,15 @@ def run_platformio_cli_run(config, verbose, *args, **kwargs) -> Union[str, int]:
 
 
 def run_compile(config, verbose):
-    return run_platformio_cli_run(config, verbose)
+    global IDE_DATA
+
+    result = run_platformio_cli_run(config, verbose)
+    if result == 0:
+        # Fetch the IDE data of the new firmware now, so that log sessions can decode stack
+        # traces right away
+        IDE_DATA = None
+        get_idedata(config)
+    return result
 
 
 def run_upload(config, verbose, port):
@@ -100,7 +115,11 @@ def run_upload(config, verbose, port):
 
 def run_idedata(config):
     args = ['-t', 'idedata']
-    stdout = run_platformio_cli_run(config, False, *args, capture_stdout=True)
+    try:
+        stdout = run_platformio_cli_run(config, False, *args, capture_stdout=True)
+    except ImportError:
+        _LOGGER.debug("PlatformIO is not installed, no IDEData")
+        return IDEData(None)
     match = re.search(r'{\s*".*}', stdout)
     if match is None:
         _LOGGER.debug("Could not match IDEData for %s", stdout)
@@ -113,14 +132,67 @@ def run_idedata(config):
 
 
 IDE_DATA = None
+# Bump this when the format of the IDE data cache changes
+IDEDATA_CACHE_VERSION = 1
+
+
+def _platformio_version():
+    try:
+        from platformio import __version__
+    except ImportError:
+        return None
+    return __version__
+
+
+def idedata_cache_path():
+    return CORE.relative_config_path('.esphome', f'{CORE.config_filename}.idedata.json')
+
+
+def _idedata_key():
+    """Return the key of the IDE data of the current firmware, None if there is none.
+
+    The IDE data depends on platformio.ini and the PlatformIO version, the mtime of the
+    firmware ELF changes with every build.
+    """
+    version = _platformio_version()
+    if version is None:
+        return None
+    try:
+        ini_hash = file_hash(CORE.relative_build_path('platformio.ini')).hex()
+        elf_mtime = os.stat(CORE.firmware_elf).st_mtime_ns
+    except OSError:
+        return None
+    return f'{IDEDATA_CACHE_VERSION}:{version}:{ini_hash}:{elf_mtime}'
+
+
+def _load_idedata(key):
+    try:
+        with open(idedata_cache_path(), encoding='utf-8') as f_handle:
+            cached = json.load(f_handle)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cached, dict) or cached.get('key') != key:
+        return None
+    return IDEData(cached.get('idedata'))
 
 
 def get_idedata(config):
+    """Return the IDE data of the firmware, from the cache in the .esphome directory if valid."""
     global IDE_DATA
 
+    if IDE_DATA is not None:
+        return IDE_DATA
+    key = _idedata_key()
+    if key is not None:
+        IDE_DATA = _load_idedata(key)
     if IDE_DATA is None:
         _LOGGER.info("Need to fetch platformio IDE-data, please stand by")
         IDE_DATA = run_idedata(config)
+        if key is not None and IDE_DATA.raw:
+            try:
+                write_file(idedata_cache_path(), json.dumps({'key': key, 'idedata': IDE_DATA.raw}))
+            except EsphomeError as err:
+                _LOGGER.debug("Could not write IDE data cache: %s", err)
     return IDE_DATA
 
 
@@ -164,23 +236,209 @@ ESP8266_EXCEPTION_CODES = {
 }
 
 
-def _decode_pc(config, addr):
-    idedata = get_idedata(config)
-    if not idedata.addr2line_path or not idedata.firmware_elf_path:
-        _LOGGER.debug("decode_pc no addr2line")
-        return
-    command = [idedata.addr2line_path, '-pfiaC', '-e', idedata.firmware_elf_path, addr]
+# Number of decoded addresses Addr2Line keeps
+ADDR2LINE_CACHE_SIZE = 1024
+# Seconds addr2line may take to decode a batch of addresses
+ADDR2LINE_TIMEOUT = 10
+
+
+class Addr2Line:
+    """A long-lived addr2line process decoding the addresses of one firmware ELF.
+
+    Addresses are written to the stdin of addr2line, which flushes the decoding of every
+    address. Every batch of addresses ends with a null address, addr2line decoding it marks
+    the end of the output of the batch. Decoded addresses are kept in an LRU cache.
+
+    The process is ended by close(), or when leaving the Addr2Line as a context manager.
+    """
+
+    def __init__(self, addr2line_path, elf_path):
+        self.addr2line_path = addr2line_path
+        self.elf_path = elf_path
+        self.elf_mtime = os.stat(elf_path).st_mtime_ns
+        self._process = None
+        # Lines printed by addr2line, '' once it exits
+        self._lines = None  # type: Optional[queue.Queue]
+        # Set once addr2line took longer than ADDR2LINE_TIMEOUT, it isn't started again
+        self._timed_out = False
+        # Address -> decoded address, least recently used first
+        self._cache = OrderedDict()  # type: Dict[str, str]
+
+    def is_for(self, addr2line_path, elf_path):
+        """Return whether this decodes the addresses of the current ELF at elf_path."""
+        try:
+            elf_mtime = os.stat(elf_path).st_mtime_ns
+        except OSError:
+            return False
+        return (addr2line_path, elf_path, elf_mtime) == \
+            (self.addr2line_path, self.elf_path, self.elf_mtime)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _start(self):
+        # The process lives until close(), so it can't be used as a context manager here
+        # pylint: disable=consider-using-with
+        self._process = subprocess.Popen(
+            [self.addr2line_path, '-pfiaC', '-e', self.elf_path],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            universal_newlines=True)
+        # Reading pipes with a timeout isn't portable, a thread forwards the output instead
+        self._lines = queue.Queue()
+        threading.Thread(target=self._forward_output, args=(self._process.stdout, self._lines),
+                         daemon=True).start()
+
+    @staticmethod
+    def _forward_output(stdout, lines):
+        with stdout:
+            for line in iter(stdout.readline, ''):
+                lines.put(line)
+        lines.put('')
+
+    def _translate(self, addresses):  # type: (List[str]) -> List[str]
+        if self._process is None:
+            self._start()
+        process = self._process
+        process.stdin.write(''.join(f'{addr}\n' for addr in addresses) + '0\n')
+        process.stdin.flush()
+        deadline = time.monotonic() + ADDR2LINE_TIMEOUT
+        # Every decoded address starts with the address, inlined functions follow on
+        # their own lines
+        translations = []
+        lines = None
+        while True:
+            try:
+                line = self._lines.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                raise subprocess.TimeoutExpired(process.args, ADDR2LINE_TIMEOUT) from None
+            if not line:
+                raise OSError(f"addr2line exited with {process.poll()}")
+            if line.startswith('0x'):
+                if lines is not None:
+                    translations.append(''.join(lines).strip())
+                lines = []
+                if len(translations) == len(addresses):
+                    break
+            lines.append(line)
+        return translations
+
+    def decode(self, addresses):  # type: (List[str]) -> Dict[str, str]
+        """Return the addr2line output for the addresses, decoding the new ones in one batch."""
+        missing = [addr for addr in dict.fromkeys(addresses) if addr not in self._cache]
+        if missing and not self._timed_out:
+            try:
+                translations = self._translate(missing)
+            except subprocess.TimeoutExpired:
+                # Waiting for a hanging addr2line would hold up every later stack trace
+                _LOGGER.debug("%s took longer than %ss, not using it anymore",
+                              self.addr2line_path, ADDR2LINE_TIMEOUT)
+                self._timed_out = True
+                self.close()
+                translations = None
+            except (OSError, ValueError):
+                _LOGGER.debug("Could not decode addresses with %s", self.addr2line_path,
+                              exc_info=1)
+                self.close()
+                translations = None
+            if translations is not None:
+                self._cache.update(zip(missing, translations))
+        result = {}
+        for addr in addresses:
+            if addr in self._cache:
+                self._cache.move_to_end(addr)
+                result[addr] = self._cache[addr]
+        while len(self._cache) > ADDR2LINE_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return result
+
+    def close(self):
+        """End the addr2line process, it's started again by the next decode()."""
+        if self._process is None:
+            return
+        process, self._process = self._process, None
+        self._lines = None
+        try:
+            process.stdin.close()
+            process.wait(timeout=1)
+        except (OSError, subprocess.TimeoutExpired):
+            process.kill()
+            process.wait()
+
+
+_ADDR2LINE = None
+
+
+@atexit.register
+def _close_addr2line():
+    if _ADDR2LINE is not None:
+        _ADDR2LINE.close()
+
+
+def _get_addr2line(addr2line_path, elf_path):
+    """Return the Addr2Line for the firmware, None if there is no addr2line."""
+    global _ADDR2LINE
+
+    if not addr2line_path or not os.path.isfile(addr2line_path):
+        return None
+    if _ADDR2LINE is None or not _ADDR2LINE.is_for(addr2line_path, elf_path):
+        if _ADDR2LINE is not None:
+            _ADDR2LINE.close()
+        try:
+            _ADDR2LINE = Addr2Line(addr2line_path, elf_path)
+        except OSError:
+            _LOGGER.debug("Could not find firmware %s", elf_path, exc_info=1)
+            return None
+    return _ADDR2LINE
+
+
+def _firmware_elf_path(idedata):
+    """Return the path of the firmware ELF, also if there is only the ELF of the build."""
+    if idedata.firmware_elf_path:
+        return idedata.firmware_elf_path
+    if CORE.build_path is not None and os.path.isfile(CORE.firmware_elf):
+        return CORE.firmware_elf
+    return None
+
+
+def _resolve_symbol(elf_path, addr):
+    """Decode addr with the symbol table of the ELF, for when addr2line is not available."""
     try:
-        translation = subprocess.check_output(command).decode().strip()
-    except Exception:  # pylint: disable=broad-except
-        _LOGGER.debug("Caught exception for command %s", command, exc_info=1)
+        index = elf_symbols.symbol_index(elf_path)
+    except EsphomeError as err:
+        _LOGGER.debug("Could not read the symbols of the firmware: %s", err)
+        return None
+    address = int(addr, 16)
+    name = index.resolve(address)
+    if name is None:
+        return None
+    return f'0x{address:08x}: {name}'
+
+
+def _decode_pcs(config, addresses):
+    idedata = get_idedata(config)
+    elf_path = _firmware_elf_path(idedata)
+    if elf_path is None:
+        _LOGGER.debug("decode_pc no firmware")
         return
+    addr2line = _get_addr2line(idedata.addr2line_path, elf_path)
+    translations = addr2line.decode(addresses) if addr2line is not None else {}
+    for addr in addresses:
+        translation = translations.get(addr)
+        # addr2line can't place absolute symbols like the functions in the ROM of the ESP32
+        if translation is None or "?? ??:0" in translation:
+            translation = _resolve_symbol(elf_path, addr)
+        if translation is None:
+            # Nothing useful
+            continue
+        translation = translation.replace(' at ??:?', '').replace(':?', '')
+        _LOGGER.warning("Decoded %s", translation)
 
-    if "?? ??:0" in translation:
-        # Nothing useful
-        return
-    translation = translation.replace(' at ??:?', '').replace(':?', '')
-    _LOGGER.warning("Decoded %s", translation)
+
+def _decode_pc(config, addr):
+    _decode_pcs(config, [addr])
 
 
 def _parse_register(config, regex, line):
@@ -226,8 +484,7 @@ def process_stacktrace(config, line, backtrace_state):
     match = re.match(STACKTRACE_ESP32_BACKTRACE_RE, line)
     if match is not None:
         _LOGGER.warning("Found stack trace! Trying to decode it")
-        for addr in re.finditer(STACKTRACE_ESP32_BACKTRACE_PC_RE, line):
-            _decode_pc(config, addr.group())
+        _decode_pcs(config, STACKTRACE_ESP32_BACKTRACE_PC_RE.findall(line))
 
     # ESP8266 multi-line backtrace
     if '>>>stack>>>' in line:
@@ -239,8 +496,9 @@ def process_stacktrace(config, line, backtrace_state):
         backtrace_state = False
 
     if backtrace_state:
-        for addr in re.finditer(STACKTRACE_ESP8266_BACKTRACE_PC_RE, line):
-            _decode_pc(config, addr.group())
+        addresses = STACKTRACE_ESP8266_BACKTRACE_PC_RE.findall(line)
+        if addresses:
+            _decode_pcs(config, addresses)
 
     return backtrace_state
 
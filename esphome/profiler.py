@@ -0,0 +1,168 @@
+"""Phase timings of esphome commands, enabled with --profile.
+
+The Profiler records the wall and CPU time of the phases of a command (loading YAML,
+validation, code generation, PlatformIO, ...) and of the validation and to_code of every
+component. The report is written as JSON to the .esphome directory of the config, where the
+dashboard reads it to show the build time breakdown of a node.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+import json
+import logging
+import os
+import time
+
+from esphome import const
+from esphome.core import CORE
+from esphome.helpers import mkdir_p, write_file
+
+# pylint: disable=unused-import, wrong-import-order
+from typing import Any, Dict, List, Optional  # noqa
+
+_LOGGER = logging.getLogger(__name__)
+
+# Bump this when the format of the report changes
+PROFILE_VERSION = 1
+
+
+def profile_path():  # type: () -> str
+    return CORE.relative_config_path('.esphome', f'{CORE.config_filename}.profile.json')
+
+
+def ext_profile_path(base_path, config_filename):  # type: (str, str) -> str
+    return os.path.join(base_path, '.esphome', f'{config_filename}.profile.json')
+
+
+def load_profile(path):  # type: (str) -> Optional[Dict[str, Any]]
+    """Load a profile report, None if there is none or it's from another report version."""
+    try:
+        with open(path, encoding='utf-8') as f_handle:
+            report = json.load(f_handle)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(report, dict) or report.get('profile_version') != PROFILE_VERSION:
+        return None
+    return report
+
+
+def _timing(wall, cpu):
+    return {'wall': round(wall, 6), 'cpu': round(cpu, 6)}
+
+
+class Profiler:
+    """Collect the timings of one command run on one config."""
+
+    def __init__(self, command, python=False):
+        self.command = command
+        self.started = datetime.now()
+        self._start = (time.perf_counter(), time.process_time())
+        # The phases being timed, innermost last; each has the list of its finished sub-phases
+        self._phases = [{'phases': []}]
+        # Component name -> kind ('validation' or 'to_code') -> [wall, cpu]
+        self._components = {}  # type: Dict[str, Dict[str, List[float]]]
+        # to_code tasks of CORE.flush_tasks -> component name
+        self._task_names = {}
+        self._python = None
+        if python:
+            import cProfile
+
+            self._python = cProfile.Profile()
+            self._python.enable()
+
+    @contextmanager
+    def phase(self, name, external=False):
+        """Time the code in the with block as a phase, nested in the currently running phase.
+
+        External phases run tools like PlatformIO, they're excluded from the Python profile.
+        """
+        phase = {'name': name, 'phases': []}
+        self._phases.append(phase)
+        if external and self._python is not None:
+            self._python.disable()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            phase.update(_timing(time.perf_counter() - wall, time.process_time() - cpu))
+            if not phase['phases']:
+                del phase['phases']
+            if external and self._python is not None:
+                self._python.enable()
+            self._phases.pop()
+            self._phases[-1]['phases'].append(phase)
+
+    @contextmanager
+    def component(self, kind, name):
+        """Add the time of the with block to the validation or to_code time of a component."""
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            times = self._components.setdefault(name, {}).setdefault(kind, [0.0, 0.0])
+            times[0] += time.perf_counter() - wall
+            times[1] += time.process_time() - cpu
+
+    def add_task(self, task, name):
+        """Count the time spent in a task of CORE.flush_tasks as to_code time of name."""
+        self._task_names[task] = name
+
+    def run_task(self, task):
+        """Run the next step of a task of CORE.flush_tasks, return what it yielded."""
+        name = self._task_names.get(task)
+        if name is None:
+            return next(task)
+        with self.component('to_code', name):
+            return next(task)
+
+    def report(self, exit_code=None):  # type: (Optional[int]) -> Dict[str, Any]
+        wall, cpu = self._start
+        return {
+            'profile_version': PROFILE_VERSION,
+            'esphome_version': const.__version__,
+            'name': CORE.name,
+            'command': self.command,
+            'started': self.started.isoformat(),
+            'exit_code': exit_code,
+            **_timing(time.perf_counter() - wall, time.process_time() - cpu),
+            'phases': self._phases[0]['phases'],
+            'components': {
+                name: {kind: _timing(*times) for kind, times in kinds.items()}
+                for name, kinds in sorted(self._components.items())
+            },
+        }
+
+    def save(self, exit_code=None):  # type: (Optional[int]) -> None
+        """Write the report (and the Python profile) to the .esphome directory of the config."""
+        report = self.report(exit_code)
+        path = profile_path()
+        if self._python is not None:
+            self._python.disable()
+            pstats_path = CORE.relative_config_path('.esphome',
+                                                    f'{CORE.config_filename}.pstats')
+            mkdir_p(os.path.dirname(pstats_path))
+            self._python.dump_stats(pstats_path)
+            report['pstats'] = os.path.basename(pstats_path)
+        write_file(path, json.dumps(report, indent=2))
+        _LOGGER.info("Wrote profile report to %s", path)
+
+
+@contextmanager
+def profile_phase(name, external=False):
+    """Time the with block as a phase of CORE.profiler, if profiling is enabled."""
+    profiler = CORE.profiler
+    if profiler is None:
+        yield
+        return
+    with profiler.phase(name, external):
+        yield
+
+
+@contextmanager
+def profile_component(kind, name):
+    """Add the time of the with block to a component in CORE.profiler, if profiling is enabled."""
+    profiler = CORE.profiler
+    if profiler is None:
+        yield
+        return
+    with profiler.component(kind, name):
+        yield
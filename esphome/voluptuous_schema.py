@@ -1,3 +1,4 @@
+import collections
 import difflib
 import itertools
 
@@ -16,6 +17,26 @@ def ensure_multiple_invalid(err):
     return vol.MultipleInvalid(err)
 
 
+# Compiled validators of recently compiled schemas, see _Schema._compile
+_COMPILE_CACHE = collections.OrderedDict()
+# Maximum number of entries in _COMPILE_CACHE, 0 disables the cache
+COMPILE_CACHE_SIZE = 16384
+COMPILE_CACHE_STATS = {'hits': 0, 'misses': 0}
+
+
+def _schema_key(schema):
+    """Return a key that is equal for schemas built from the same objects.
+
+    dicts and lists are compared by their items, so that the key also changes if the schema
+    is mutated, everything else by identity.
+    """
+    if isinstance(schema, dict):
+        return dict, tuple((id(key), _schema_key(value)) for key, value in schema.items())
+    if isinstance(schema, (list, tuple)):
+        return type(schema), tuple(_schema_key(value) for value in schema)
+    return id(schema)
+
+
 # pylint: disable=protected-access, unidiomatic-typecheck
 class _Schema(vol.Schema):
     """Custom cv.Schema that prints similar keys on error."""
@@ -36,8 +57,30 @@ class _Schema(vol.Schema):
                 raise ensure_multiple_invalid(err)
         return res
 
+    def _compile(self, schema):
+        # Schemas are mostly built by extending other schemas, so most of their values were
+        # already compiled before. The cache entries keep the schema alive, so that the ids
+        # in the key can't be reused.
+        if not COMPILE_CACHE_SIZE:
+            COMPILE_CACHE_STATS['misses'] += 1
+            return super()._compile(schema)
+        key = (self.extra, self.required, _schema_key(schema))
+        entry = _COMPILE_CACHE.get(key)
+        if entry is not None:
+            COMPILE_CACHE_STATS['hits'] += 1
+            _COMPILE_CACHE.move_to_end(key)
+            return entry[1]
+        COMPILE_CACHE_STATS['misses'] += 1
+        compiled = super()._compile(schema)
+        _COMPILE_CACHE[key] = (schema, compiled)
+        if len(_COMPILE_CACHE) > COMPILE_CACHE_SIZE:
+            _COMPILE_CACHE.popitem(last=False)
+        return compiled
+
     def _compile_mapping(self, schema, invalid_msg=None):
         invalid_msg = invalid_msg or 'mapping value'
+        # The compiled mapping may be shared with other schemas, don't refer to self
+        extra = self.extra
 
         # Check some things that ESPHome's schemas do not allow
         # mostly to keep the logic in this method sane (so these may be re-added if needed).
@@ -153,9 +196,9 @@ class _Schema(vol.Schema):
 
                     break
                 else:
-                    if self.extra == vol.ALLOW_EXTRA:
+                    if extra == vol.ALLOW_EXTRA:
                         out[key] = value
-                    elif self.extra != vol.REMOVE_EXTRA:
+                    elif extra != vol.REMOVE_EXTRA:
                         if isinstance(key, str) and key_names:
                             matches = difflib.get_close_matches(key, key_names)
                             errors.append(ExtraKeysInvalid('extra keys not allowed', key_path,
@@ -195,5 +238,32 @@ class _Schema(vol.Schema):
         schema = schemas[0]
         if isinstance(schema, vol.Schema):
             schema = schema.schema
-        ret = super().extend(schema, extra=extra)
-        return _Schema(ret.schema, extra=ret.extra, extra_schemas=self._extra_schemas)
+        assert type(self.schema) is dict and type(schema) is dict, \
+            'Both schemas must be dictionary-based'
+        if extra is None:
+            extra = self.extra
+        return _Schema(_merge_schema_dicts(self.schema, schema), extra=extra,
+                       extra_schemas=self._extra_schemas)
+
+
+def _merge_schema_dicts(base, extension):
+    """Merge the dict-based schema extension into base, like vol.Schema.extend.
+
+    Unlike vol.Schema.extend this doesn't compile the intermediate schemas of nested dicts.
+    """
+    result = base.copy()
+
+    def key_literal(key):
+        return key.schema if isinstance(key, vol.Marker) else key
+
+    result_key_map = {key_literal(key): key for key in result}
+    for key, value in extension.items():
+        result_key = result_key_map.get(key_literal(key), vol.UNDEFINED)
+        if result_key is vol.UNDEFINED:
+            result[key] = value
+            continue
+        result_value = result.pop(result_key)
+        if type(result_value) is dict and type(value) is dict:
+            value = _merge_schema_dicts(result_value, value)
+        result[key] = value
+    return result
@@ -1,4 +1,7 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import logging
+import marshal
 import os
 import re
 
@@ -6,11 +9,16 @@ from esphome.config import iter_components
 from esphome.const import CONF_BOARD_FLASH_MODE, CONF_ESPHOME, CONF_PLATFORMIO_OPTIONS, \
     HEADER_FILE_EXTENSIONS, SOURCE_FILE_EXTENSIONS, __version__, ARDUINO_VERSION_ESP8266
 from esphome.core import CORE, EsphomeError
-from esphome.helpers import mkdir_p, read_file, write_file_if_changed, walk_files, \
-    copy_file_if_changed
+from esphome.core_config import BUILD_ID_MACRO
+from esphome.helpers import mkdir_p, read_file, write_file, write_file_if_changed, walk_files, \
+    copy_file_if_changed, file_hash, write_chunks_if_changed
+from esphome.profiler import profile_phase
 from esphome.storage_json import StorageJSON, storage_path
 from esphome.pins import ESP8266_FLASH_SIZES, ESP8266_LD_SCRIPTS
 
+# pylint: disable=unused-import, wrong-import-order
+from typing import Dict, List, Optional, Tuple  # noqa
+
 _LOGGER = logging.getLogger(__name__)
 
 CPP_AUTO_GENERATE_BEGIN = '// ========== AUTO GENERATED CODE BEGIN ==========='
@@ -163,7 +171,8 @@ def format_ini(data):
     for key, value in sorted(data.items()):
         if isinstance(value, (list, set, tuple)):
             content += f'{key} =\n'
-            for x in value:
+            # The order of sets depends on the hash seed
+            for x in sorted(value) if isinstance(value, set) else value:
                 content += f'    {x}\n'
         else:
             content += f'{key} = {value}\n'
@@ -310,7 +319,107 @@ or use the custom_components folder.
 """
 
 
-def copy_src_tree():
+# Bump this when the format of the source manifest changes
+SRC_MANIFEST_VERSION = 1
+
+
+def _stat(path):
+    """Return the size and mtime of the file at path, None if there is none."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class SourceManifest:
+    """The files copy_src_tree and write_cpp wrote to the build directory.
+
+    For every written file the manifest has the path, size and mtime of its source file, the
+    hash of its contents and its size and mtime after it was written. A file whose source and
+    itself still have the same size and mtime wasn't changed and isn't read again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = self._load()  # type: Dict[str, tuple]
+        # The entries of the files written by this build, only these are stored again
+        self._written = {}  # type: Dict[str, tuple]
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f_handle:
+                manifest = marshal.loads(f_handle.read())
+            if manifest['version'] == SRC_MANIFEST_VERSION:
+                return manifest['files']
+        except FileNotFoundError:
+            pass
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.debug("Ignoring corrupt source manifest %s", self.path, exc_info=True)
+        return {}
+
+    def digest(self, dst):  # type: (str) -> Optional[bytes]
+        """Return the hash of the contents of dst, if it wasn't changed since it was written."""
+        entry = self._entries.get(dst)
+        if entry is None or entry[3] != _stat(dst):
+            return None
+        return entry[2]
+
+    def is_unchanged(self, dst, src, src_stat):  # type: (str, str, tuple) -> bool
+        """Return whether dst was copied from src with src_stat and wasn't changed since."""
+        entry = self._entries.get(dst)
+        if entry is None or entry[:2] != (src, src_stat) or entry[3] != _stat(dst):
+            return False
+        self._written[dst] = entry
+        return True
+
+    def add(self, dst, src, src_stat, digest):
+        """Record that dst was written with contents hashed to digest, from src if not None."""
+        self._written[dst] = (src, src_stat, digest, _stat(dst))
+
+    def digests(self, base):  # type: (str) -> List[Tuple[str, bytes]]
+        """Return the paths relative to base and the hashes of the files written by this build."""
+        return sorted((os.path.relpath(dst, base).replace(os.path.sep, '/'), entry[2])
+                      for dst, entry in self._written.items())
+
+    def save(self):
+        if self._written == self._entries:
+            return
+        manifest = {'version': SRC_MANIFEST_VERSION, 'files': self._written}
+        try:
+            write_file(self.path, marshal.dumps(manifest))
+        except EsphomeError as err:
+            _LOGGER.debug("Could not write source manifest: %s", err)
+
+
+def _src_manifest_path():
+    return CORE.relative_config_path('.esphome', f'{CORE.config_filename}.src_manifest.bin')
+
+
+def _copy_source(src, dst, digest):
+    """Copy src to dst unless dst has the contents hashed to digest, return the hash of src."""
+    try:
+        src_digest = file_hash(src)
+    except OSError as err:
+        raise EsphomeError(f"Error reading file {src}: {err}") from err
+    if src_digest != digest:
+        copy_file_if_changed(src, dst)
+    return src_digest
+
+
+def _write_text_if_changed(manifest, path, text):
+    digest = hashlib.sha256(text.encode()).digest()
+    if manifest.digest(path) != digest:
+        write_file_if_changed(path, text)
+    manifest.add(path, None, None, digest)
+
+
+def copy_src_tree(manifest):
+    """Copy the source files of the components to the build directory.
+
+    Files that didn't change according to the manifest are skipped without reading them, the
+    others are copied on a thread pool if their contents changed.
+    """
     source_files = {}
     for _, component, _ in iter_components(CORE.config):
         source_files.update(component.source_files)
@@ -329,7 +438,10 @@ def copy_src_tree():
 
     source_files_copy = source_files.copy()
     source_files_copy.pop(DEFINES_H_TARGET)
+    # Generated below, copying the placeholder from the core would change it on every build
+    source_files_copy.pop(VERSION_H_TARGET, None)
 
+    copies = []
     for path in walk_files(CORE.relative_src_path('esphome')):
         if os.path.splitext(path)[1] not in SOURCE_FILE_EXTENSIONS:
             # Not a source file, ignore
@@ -343,23 +455,36 @@ def copy_src_tree():
             # Source file removed, delete target
             os.remove(path)
         else:
-            src_path = source_files_copy.pop(target)
-            copy_file_if_changed(src_path, path)
+            copies.append((source_files_copy.pop(target), path))
 
     # Now copy new files
     for target, src_path in source_files_copy.items():
-        dst_path = CORE.relative_src_path(*target.split('/'))
-        copy_file_if_changed(src_path, dst_path)
+        copies.append((src_path, CORE.relative_src_path(*target.split('/'))))
+
+    pending = []
+    for src_path, dst_path in copies:
+        src_stat = _stat(src_path)
+        if not manifest.is_unchanged(dst_path, src_path, src_stat):
+            pending.append((src_path, dst_path, src_stat))
+    if pending:
+        with ThreadPoolExecutor() as executor:
+            futures = [
+                (executor.submit(_copy_source, src_path, dst_path, manifest.digest(dst_path)),
+                 src_path, dst_path, src_stat)
+                for src_path, dst_path, src_stat in pending
+            ]
+            for future, src_path, dst_path, src_stat in futures:
+                manifest.add(dst_path, src_path, src_stat, future.result())
 
     # Finally copy defines
-    write_file_if_changed(CORE.relative_src_path('esphome', 'core', 'defines.h'),
-                          generate_defines_h())
-    write_file_if_changed(CORE.relative_src_path('esphome', 'README.txt'),
-                          ESPHOME_README_TXT)
-    write_file_if_changed(CORE.relative_src_path('esphome.h'),
-                          ESPHOME_H_FORMAT.format(include_s))
-    write_file_if_changed(CORE.relative_src_path('esphome', 'core', 'version.h'),
-                          VERSION_H_FORMAT.format(__version__))
+    _write_text_if_changed(manifest, CORE.relative_src_path('esphome', 'core', 'defines.h'),
+                           generate_defines_h())
+    _write_text_if_changed(manifest, CORE.relative_src_path('esphome', 'README.txt'),
+                           ESPHOME_README_TXT)
+    _write_text_if_changed(manifest, CORE.relative_src_path('esphome.h'),
+                           ESPHOME_H_FORMAT.format(include_s))
+    _write_text_if_changed(manifest, CORE.relative_src_path('esphome', 'core', 'version.h'),
+                           VERSION_H_FORMAT.format(__version__))
 
 
 def generate_defines_h():
@@ -368,24 +493,87 @@ def generate_defines_h():
     return DEFINES_H_FORMAT.format('\n'.join(define_content_l))
 
 
-def write_cpp(code_s):
+def _main_cpp_format(path):
+    if not os.path.isfile(path):
+        return CPP_BASE_FORMAT
+    text = read_file(path)
+    code_format = find_begin_end(text, CPP_AUTO_GENERATE_BEGIN, CPP_AUTO_GENERATE_END)
+    code_format_ = find_begin_end(code_format[0], CPP_INCLUDE_BEGIN, CPP_INCLUDE_END)
+    return code_format_[0], code_format_[1], code_format[1]
+
+
+def _iter_global_code(build_id=None):
+    yield '#include "esphome.h"\n'
+    if build_id is not None:
+        yield f'#define {BUILD_ID_MACRO} "{build_id}"\n'
+    empty = True
+    for text in CORE.iter_cpp_global_section():
+        empty = False
+        yield text + '\n'
+    if empty:
+        yield '\n'
+
+
+def _iter_main_code(padding='  '):
+    # Same as indent(CORE.cpp_main_section, padding), built one statement at a time
+    empty = True
+    for text in CORE.iter_cpp_main_section():
+        empty = False
+        yield ''.join(padding + line + '\n' for line in text.splitlines() or [''])
+    if empty:
+        yield padding + '\n'
+    yield padding
+
+
+def _iter_main_cpp(code_format, build_id=None):
+    yield code_format[0] + CPP_INCLUDE_BEGIN + '\n'
+    yield from _iter_global_code(build_id)
+    yield CPP_INCLUDE_END + code_format[1] + CPP_AUTO_GENERATE_BEGIN + '\n'
+    yield from _iter_main_code()
+    yield CPP_AUTO_GENERATE_END + code_format[2]
+
+
+def _build_id(manifest, code_format):
+    """Return the ID of the build, which replaces the compilation time with --reproducible.
+
+    The ID is a hash of platformio.ini, the source files copied by copy_src_tree and main.cpp
+    without the ID, so it only changes with the sources.
+    """
+    hasher = hashlib.sha256()
+    ini_path = CORE.relative_build_path('platformio.ini')
+    if os.path.isfile(ini_path):
+        hasher.update(file_hash(ini_path))
+    for path, digest in manifest.digests(CORE.relative_src_path()):
+        hasher.update(path.encode() + b'\0' + digest)
+    for chunk in _iter_main_cpp(code_format):
+        hasher.update(chunk.encode())
+    return hasher.hexdigest()[:16]
+
+
+def write_cpp():
+    """Write main.cpp, keeping the user code outside of the auto-generated sections.
+
+    The code is streamed to the file one statement at a time and the file is only replaced
+    if its contents changed, so unchanged builds don't recompile main.cpp.
+    """
     path = CORE.relative_src_path('main.cpp')
-    if os.path.isfile(path):
-        text = read_file(path)
-        code_format = find_begin_end(text, CPP_AUTO_GENERATE_BEGIN, CPP_AUTO_GENERATE_END)
-        code_format_ = find_begin_end(code_format[0], CPP_INCLUDE_BEGIN, CPP_INCLUDE_END)
-        code_format = (code_format_[0], code_format_[1], code_format[1])
-    else:
-        code_format = CPP_BASE_FORMAT
-
-    copy_src_tree()
-    global_s = '#include "esphome.h"\n'
-    global_s += CORE.cpp_global_section
-
-    full_file = code_format[0] + CPP_INCLUDE_BEGIN + '\n' + global_s + CPP_INCLUDE_END
-    full_file += code_format[1] + CPP_AUTO_GENERATE_BEGIN + '\n' + code_s + CPP_AUTO_GENERATE_END
-    full_file += code_format[2]
-    write_file_if_changed(path, full_file)
+    code_format = _main_cpp_format(path)
+    manifest = SourceManifest(_src_manifest_path())
+
+    with profile_phase('copy_src_tree'):
+        copy_src_tree(manifest)
+    build_id = _build_id(manifest, code_format) if CORE.reproducible else None
+    hasher = hashlib.sha256()
+
+    def hashed(chunks):
+        for chunk in chunks:
+            hasher.update(chunk.encode())
+            yield chunk
+
+    write_chunks_if_changed(path, hashed(_iter_main_cpp(code_format, build_id)),
+                            manifest.digest(path))
+    manifest.add(path, None, None, hasher.digest())
+    manifest.save()
 
 
 def clean_build():
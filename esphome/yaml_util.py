@@ -1,28 +1,52 @@
+from contextlib import contextmanager
+import array
 import fnmatch
 import functools
+import hashlib
 import inspect
+import io
 import logging
+import marshal
 import math
 import os
+import sys
 
 import uuid
 import yaml
 import yaml.constructor
 
-from esphome import core
+from esphome import cache_util, core
 from esphome.config_helpers import read_config_file
-from esphome.core import EsphomeError, IPAddress, Lambda, MACAddress, TimePeriod, DocumentRange
-from esphome.helpers import add_class_to_obj
+from esphome.core import EsphomeError, IPAddress, Lambda, MACAddress, TimePeriod, \
+    DocumentLocation, DocumentRange
+from esphome.helpers import add_class_to_obj, read_file, write_file
 from esphome.util import OrderedDict, filter_yaml_files
 
+# pylint: disable=unused-import, wrong-import-order
+from typing import Any, Dict, List, Optional, Tuple  # noqa
+
 _LOGGER = logging.getLogger(__name__)
 
+try:
+    # Use the libyaml-backed C parser if PyYAML was built with it, it is much faster
+    # than the pure python implementation.
+    from yaml import CSafeLoader as FastestAvailableSafeLoader
+except ImportError:  # pragma: no cover
+    from yaml import SafeLoader as FastestAvailableSafeLoader
+
 # Mostly copied from Home Assistant because that code works fine and
 # let's not reinvent the wheel here
 
 SECRET_YAML = 'secrets.yaml'
+# Absolute path of a secrets file -> (secrets or None if missing, inputs of the load)
 _SECRET_CACHE = {}
 _SECRET_VALUES = {}
+# Directory of the file passed to load_yaml, the last secrets file looked at is in here
+_SECRET_ROOT = None
+# The YAMLCache of the running load_yaml call, None if caching is disabled
+_YAML_CACHE = None
+# The SourceLocationTable of the last load_yaml call, None if locations are stored on the values
+_LOCATIONS = None
 
 
 class ESPHomeDataBase:
@@ -47,6 +71,181 @@ def make_data_base(value):
         return value
 
 
+class SourceLocationTable:
+    """Source ranges of loaded YAML values, stored next to the data instead of on it.
+
+    Values stay plain builtins. Ranges are stored in a flat integer array with five
+    entries (document, start line, start column, end line, end column) per row.
+    Containers are indexed by identity, all other values by their parent container and
+    key or index.
+
+    Validators return new containers, copy_locations gives them the rows of the containers
+    they replace by matching keys and indices. Values a validator moves elsewhere, like
+    the message of the "logger.log: message" shorthand, lose their range; without compact
+    locations such values keep the range stored on them.
+    """
+
+    _ROW_SIZE = 5
+
+    def __init__(self):
+        self.documents = []  # type: List[str]
+        self._document_index = {}  # type: Dict[str, int]
+        self._ranges = array.array('i')
+        # id(container) -> [container, row of its own range, rows of its items]
+        # The container itself is kept so that its id can't be re-used.
+        self._containers = {}  # type: Dict[int, list]
+
+    def __len__(self):
+        return len(self._ranges) // self._ROW_SIZE
+
+    def add_range(self, document, start_line, start_col, end_line, end_col):
+        # type: (str, int, int, int, int) -> int
+        """Add a range and return its row."""
+        index = self._document_index.get(document)
+        if index is None:
+            index = self._document_index[document] = len(self.documents)
+            self.documents.append(document)
+        row = len(self)
+        self._ranges.extend((index, start_line, start_col, end_line, end_col))
+        return row
+
+    def add_node_range(self, node):
+        # type: (yaml.Node) -> int
+        start, end = node.start_mark, node.end_mark
+        return self.add_range(start.name, start.line, start.column, end.line, end.column)
+
+    def add_node(self, value, node):
+        """Record the range of a container constructed from node, and of its list items."""
+        if not isinstance(value, (list, dict)):
+            return
+        self._entry(value)[1] = self.add_node_range(node)
+        if isinstance(node, yaml.SequenceNode) and isinstance(value, list) and \
+                len(value) == len(node.value):
+            self.set_items(value, [self.add_node_range(item) for item in node.value])
+
+    def set_container_row(self, container, row):
+        self._entry(container)[1] = row
+
+    def set_items(self, container, rows):
+        """Set the rows of all items of container, a list of rows for lists or a dict for dicts.
+
+        Missing ranges are marked with a row of -1.
+        """
+        if isinstance(container, list):
+            rows = array.array('i', rows)
+        self._entry(container)[2] = rows
+
+    def _entry(self, container):
+        entry = self._containers.get(id(container))
+        if entry is None:
+            entry = self._containers[id(container)] = [container, -1, None]
+        return entry
+
+    def item_row(self, container, key):
+        # type: (Any, Any) -> int
+        entry = self._containers.get(id(container))
+        if entry is None or entry[2] is None:
+            return -1
+        rows = entry[2]
+        if isinstance(rows, dict):
+            return rows.get(key, -1)
+        if isinstance(key, int) and 0 <= key < len(rows):
+            return rows[key]
+        return -1
+
+    def get_row(self, row):
+        # type: (int) -> DocumentRange
+        offset = row * self._ROW_SIZE
+        index, start_line, start_col, end_line, end_col = self._ranges[offset:offset + 5]
+        document = self.documents[index]
+        return DocumentRange(
+            DocumentLocation(document, start_line, start_col),
+            DocumentLocation(document, end_line, end_col),
+        )
+
+    def get_container_range(self, container):
+        # type: (Any) -> Optional[DocumentRange]
+        entry = self._containers.get(id(container))
+        if entry is None or entry[1] < 0:
+            return None
+        return self.get_row(entry[1])
+
+    def get_range(self, parent, key, value):
+        # type: (Any, Any, Any) -> Optional[DocumentRange]
+        """Return the range of value, which is stored in parent under key."""
+        doc_range = self.get_container_range(value)
+        if doc_range is not None:
+            return doc_range
+        row = self.item_row(parent, key)
+        if row < 0:
+            return None
+        return self.get_row(row)
+
+    def copy_rows(self, source, target):
+        """Give the containers in target without ranges the rows of those in source.
+
+        Items are matched by key or index, target is usually source after validation.
+        """
+        if source is target or not isinstance(target, (list, dict)):
+            return
+        if isinstance(target, list) and not isinstance(source, list):
+            # Validators like ensure_list wrap a single value
+            if len(target) == 1:
+                self.copy_rows(source, target[0])
+            return
+        entry = self._containers.get(id(source))
+        if entry is None or isinstance(source, dict) != isinstance(target, dict):
+            return
+        if isinstance(target, dict):
+            keys = [key for key in target if key in source]
+            rows = {key: self.item_row(source, key) for key in keys}
+        elif len(source) == len(target):
+            keys = range(len(target))
+            rows = [self.item_row(source, i) for i in keys]
+        else:
+            # Items were added or removed, they can't be matched by index
+            keys, rows = (), None
+        target_entry = self._entry(target)
+        if target_entry[1] < 0:
+            target_entry[1] = entry[1]
+        if target_entry[2] is None and rows is not None:
+            self.set_items(target, rows)
+        for key in keys:
+            self.copy_rows(source[key], target[key])
+
+
+def get_document_range(parent, key):
+    # type: (Any, Any) -> Optional[DocumentRange]
+    """Return the source range of parent[key], or None if it wasn't loaded from a YAML file."""
+    try:
+        value = parent[key]
+    except (KeyError, IndexError, TypeError):
+        return None
+    if isinstance(value, ESPHomeDataBase) and value.esp_range is not None:
+        return value.esp_range
+    if _LOCATIONS is not None:
+        return _LOCATIONS.get_range(parent, key, value)
+    return None
+
+
+def copy_locations(source, target):
+    """Give target, the value that replaces source, and its items the ranges of source.
+
+    Only does something with compact locations, see SourceLocationTable.
+    """
+    if _LOCATIONS is not None:
+        _LOCATIONS.copy_rows(source, target)
+
+
+def _document_range_of(value):
+    # type: (Any) -> Optional[DocumentRange]
+    if isinstance(value, ESPHomeDataBase):
+        return value.esp_range
+    if _LOCATIONS is not None:
+        return _LOCATIONS.get_container_range(value)
+    return None
+
+
 def _add_data_ref(fn):
     @functools.wraps(fn)
     def wrapped(loader, node):
@@ -58,6 +257,9 @@ def _add_data_ref(fn):
             # Let generator finish
             for _ in generator:
                 pass
+        if _LOCATIONS is not None:
+            _LOCATIONS.add_node(res, node)
+            return res
         res = make_data_base(res)
         if isinstance(res, ESPHomeDataBase):
             res.from_node(node)
@@ -66,8 +268,16 @@ def _add_data_ref(fn):
     return wrapped
 
 
-class ESPHomeLoader(yaml.SafeLoader):  # pylint: disable=too-many-ancestors
-    """Loader class that keeps track of line numbers."""
+class ESPHomeLoaderMixin:
+    """Loader mixin that keeps track of line numbers and handles ESPHome's custom tags."""
+
+    def __init__(self, content, name):
+        # The C parser only picks up the document name from file-like streams,
+        # so always pass the content in as a named stream.
+        stream = io.StringIO(content)
+        stream.name = name
+        super().__init__(stream)
+        self.name = name
 
     @_add_data_ref
     def construct_yaml_int(self, node):
@@ -106,6 +316,8 @@ class ESPHomeLoader(yaml.SafeLoader):  # pylint: disable=too-many-ancestors
         # which keys to merge.
         # Value of dict items is the start mark of the previous declaration.
         seen_keys = {}
+        # Key -> row in the source location table, only used with compact locations
+        item_rows = {}
 
         for key_node, value_node in node.value:
             # merge key is '<<'
@@ -140,6 +352,8 @@ class ESPHomeLoader(yaml.SafeLoader):  # pylint: disable=too-many-ancestors
 
                 # Add to pairs
                 pairs.append((key, value))
+                if _LOCATIONS is not None:
+                    item_rows[key] = _LOCATIONS.add_node_range(value_node)
                 continue
 
             # This is a merge key, resolve value and add to merge_pairs
@@ -147,7 +361,7 @@ class ESPHomeLoader(yaml.SafeLoader):  # pylint: disable=too-many-ancestors
             if isinstance(value, dict):
                 # base case, copy directly to merge_pairs
                 # direct merge, like "<<: {some_key: some_value}"
-                merge_pairs.extend(value.items())
+                merge_pairs.extend((k, v, value) for k, v in value.items())
             elif isinstance(value, list):
                 # sequence merge, like "<<: [{some_key: some_value}, {other_key: some_value}]"
                 for item in value:
@@ -156,7 +370,7 @@ class ESPHomeLoader(yaml.SafeLoader):  # pylint: disable=too-many-ancestors
                             "While constructing a mapping", node.start_mark,
                             "Expected a mapping for merging, but found {}".format(type(item)),
                             value_node.start_mark)
-                    merge_pairs.extend(item.items())
+                    merge_pairs.extend((k, v, item) for k, v in item.items())
             else:
                 raise yaml.constructor.ConstructorError(
                     "While constructing a mapping", node.start_mark,
@@ -168,7 +382,7 @@ class ESPHomeLoader(yaml.SafeLoader):  # pylint: disable=too-many-ancestors
             # https://yaml.org/type/merge.html
             # Construct a new merge set with values overridden by current mapping or earlier
             # sequence entries removed
-            for key, value in merge_pairs:
+            for key, value, source in merge_pairs:
                 if key in seen_keys:
                     # key already in the current map or from an earlier merge sequence entry,
                     # do not override
@@ -182,14 +396,21 @@ class ESPHomeLoader(yaml.SafeLoader):  # pylint: disable=too-many-ancestors
                     #  in the sequence override keys specified in later mapping nodes."
                     continue
                 pairs.append((key, value))
+                if _LOCATIONS is not None:
+                    item_rows[key] = _LOCATIONS.item_row(source, key)
                 # Add key node to seen keys, for sequence merge values.
                 seen_keys[key] = None
 
-        return OrderedDict(pairs)
+        res = OrderedDict(pairs)
+        if _LOCATIONS is not None:
+            _LOCATIONS.set_items(res, item_rows)
+        return res
 
     @_add_data_ref
     def construct_env_var(self, node):
         args = node.value.split()
+        if _YAML_CACHE is not None:
+            _YAML_CACHE.track_env_var(args[0])
         # Check for a default value
         if len(args) > 1:
             return os.getenv(args[0], ' '.join(args[1:]))
@@ -208,37 +429,55 @@ class ESPHomeLoader(yaml.SafeLoader):  # pylint: disable=too-many-ancestors
 
     @_add_data_ref
     def construct_secret(self, node):
-        secrets = _load_yaml_internal(self._rel_path(SECRET_YAML))
-        if node.value not in secrets:
+        for path in _secret_search_path(self._directory):
+            secrets = _load_secrets_file(path)
+            if secrets is not None and node.value in secrets:
+                val = secrets[node.value]
+                break
+        else:
             raise yaml.MarkedYAMLError(
                 f"Secret '{node.value}' not defined", node.start_mark
             )
-        val = secrets[node.value]
         _SECRET_VALUES[str(val)] = node.value
+        if _YAML_CACHE is not None:
+            _YAML_CACHE.track_secret(str(val), node.value)
         return val
 
     @_add_data_ref
     def construct_include(self, node):
         return _load_yaml_internal(self._rel_path(node.value))
 
+    def _find_yaml_files(self, node):
+        directory = self._rel_path(node.value)
+        files = filter_yaml_files(_find_files(directory, '*.yaml'))
+        if _YAML_CACHE is not None:
+            _YAML_CACHE.track_directory(directory, files)
+        return files
+
     @_add_data_ref
     def construct_include_dir_list(self, node):
-        files = filter_yaml_files(_find_files(self._rel_path(node.value), '*.yaml'))
+        files = self._find_yaml_files(node)
         return [_load_yaml_internal(f) for f in files]
 
     @_add_data_ref
     def construct_include_dir_merge_list(self, node):
-        files = filter_yaml_files(_find_files(self._rel_path(node.value), '*.yaml'))
+        files = self._find_yaml_files(node)
         merged_list = []
+        item_rows = []
         for fname in files:
             loaded_yaml = _load_yaml_internal(fname)
             if isinstance(loaded_yaml, list):
                 merged_list.extend(loaded_yaml)
+                if _LOCATIONS is not None:
+                    item_rows.extend(_LOCATIONS.item_row(loaded_yaml, i)
+                                     for i in range(len(loaded_yaml)))
+        if _LOCATIONS is not None:
+            _LOCATIONS.set_items(merged_list, item_rows)
         return merged_list
 
     @_add_data_ref
     def construct_include_dir_named(self, node):
-        files = filter_yaml_files(_find_files(self._rel_path(node.value), '*.yaml'))
+        files = self._find_yaml_files(node)
         mapping = OrderedDict()
         for fname in files:
             filename = os.path.splitext(os.path.basename(fname))[0]
@@ -247,12 +486,18 @@ class ESPHomeLoader(yaml.SafeLoader):  # pylint: disable=too-many-ancestors
 
     @_add_data_ref
     def construct_include_dir_merge_named(self, node):
-        files = filter_yaml_files(_find_files(self._rel_path(node.value), '*.yaml'))
+        files = self._find_yaml_files(node)
         mapping = OrderedDict()
+        item_rows = {}
         for fname in files:
             loaded_yaml = _load_yaml_internal(fname)
             if isinstance(loaded_yaml, dict):
                 mapping.update(loaded_yaml)
+                if _LOCATIONS is not None:
+                    item_rows.update((key, _LOCATIONS.item_row(loaded_yaml, key))
+                                     for key in loaded_yaml)
+        if _LOCATIONS is not None:
+            _LOCATIONS.set_items(mapping, item_rows)
         return mapping
 
     @_add_data_ref
@@ -265,36 +510,125 @@ class ESPHomeLoader(yaml.SafeLoader):  # pylint: disable=too-many-ancestors
         return add_class_to_obj(obj, ESPForceValue)
 
 
-ESPHomeLoader.add_constructor('tag:yaml.org,2002:int', ESPHomeLoader.construct_yaml_int)
-ESPHomeLoader.add_constructor('tag:yaml.org,2002:float', ESPHomeLoader.construct_yaml_float)
-ESPHomeLoader.add_constructor('tag:yaml.org,2002:binary', ESPHomeLoader.construct_yaml_binary)
-ESPHomeLoader.add_constructor('tag:yaml.org,2002:omap', ESPHomeLoader.construct_yaml_omap)
-ESPHomeLoader.add_constructor('tag:yaml.org,2002:str', ESPHomeLoader.construct_yaml_str)
-ESPHomeLoader.add_constructor('tag:yaml.org,2002:seq', ESPHomeLoader.construct_yaml_seq)
-ESPHomeLoader.add_constructor('tag:yaml.org,2002:map', ESPHomeLoader.construct_yaml_map)
-ESPHomeLoader.add_constructor('!env_var', ESPHomeLoader.construct_env_var)
-ESPHomeLoader.add_constructor('!secret', ESPHomeLoader.construct_secret)
-ESPHomeLoader.add_constructor('!include', ESPHomeLoader.construct_include)
-ESPHomeLoader.add_constructor('!include_dir_list', ESPHomeLoader.construct_include_dir_list)
-ESPHomeLoader.add_constructor('!include_dir_merge_list',
-                              ESPHomeLoader.construct_include_dir_merge_list)
-ESPHomeLoader.add_constructor('!include_dir_named', ESPHomeLoader.construct_include_dir_named)
-ESPHomeLoader.add_constructor('!include_dir_merge_named',
-                              ESPHomeLoader.construct_include_dir_merge_named)
-ESPHomeLoader.add_constructor('!lambda', ESPHomeLoader.construct_lambda)
-ESPHomeLoader.add_constructor('!force', ESPHomeLoader.construct_force)
-
-
-def load_yaml(fname):
+class ESPHomeLoader(ESPHomeLoaderMixin, FastestAvailableSafeLoader):
+    """Loader class that uses libyaml for parsing when available."""
+
+
+class ESPHomePurePythonLoader(ESPHomeLoaderMixin, yaml.SafeLoader):
+    """Pure python loader, its errors include a snippet of the offending source."""
+
+
+for _loader in (ESPHomeLoader, ESPHomePurePythonLoader):
+    _loader.add_constructor('tag:yaml.org,2002:int', _loader.construct_yaml_int)
+    _loader.add_constructor('tag:yaml.org,2002:float', _loader.construct_yaml_float)
+    _loader.add_constructor('tag:yaml.org,2002:binary', _loader.construct_yaml_binary)
+    _loader.add_constructor('tag:yaml.org,2002:omap', _loader.construct_yaml_omap)
+    _loader.add_constructor('tag:yaml.org,2002:str', _loader.construct_yaml_str)
+    _loader.add_constructor('tag:yaml.org,2002:seq', _loader.construct_yaml_seq)
+    _loader.add_constructor('tag:yaml.org,2002:map', _loader.construct_yaml_map)
+    _loader.add_constructor('!env_var', _loader.construct_env_var)
+    _loader.add_constructor('!secret', _loader.construct_secret)
+    _loader.add_constructor('!include', _loader.construct_include)
+    _loader.add_constructor('!include_dir_list', _loader.construct_include_dir_list)
+    _loader.add_constructor('!include_dir_merge_list', _loader.construct_include_dir_merge_list)
+    _loader.add_constructor('!include_dir_named', _loader.construct_include_dir_named)
+    _loader.add_constructor('!include_dir_merge_named',
+                            _loader.construct_include_dir_merge_named)
+    _loader.add_constructor('!lambda', _loader.construct_lambda)
+    _loader.add_constructor('!force', _loader.construct_force)
+
+
+def load_yaml(fname, cache_dir=None, compact_locations=False):
+    """Load the YAML file at fname.
+
+    If cache_dir is given, the constructed documents of fname and all files it includes
+    are cached in that directory and re-used as long as none of their inputs change.
+
+    If compact_locations is set, loaded values are kept as plain builtins and their source
+    ranges are stored in a SourceLocationTable instead, see get_document_range.
+    """
+    global _YAML_CACHE, _SECRET_ROOT, _LOCATIONS
+
     _SECRET_VALUES.clear()
     _SECRET_CACHE.clear()
-    return _load_yaml_internal(fname)
+    _SECRET_ROOT = os.path.dirname(os.path.abspath(fname))
+    _LOCATIONS = SourceLocationTable() if compact_locations else None
+    if cache_dir is None:
+        return _load_yaml_internal(fname)
+
+    _YAML_CACHE = YAMLCache(cache_dir)
+    try:
+        return _load_yaml_internal(fname)
+    finally:
+        _LOGGER.debug("YAML cache: %s hits, %s misses", _YAML_CACHE.hits, _YAML_CACHE.misses)
+        _YAML_CACHE = None
 
 
 def _load_yaml_internal(fname):
     content = read_config_file(fname)
-    loader = ESPHomeLoader(content)
-    loader.name = fname
+    if _YAML_CACHE is not None:
+        return _YAML_CACHE.load(fname, content)
+    return _load_yaml_uncached(fname, content)
+
+
+def _secret_search_path(directory):
+    """Return the secrets files used for documents in directory, in lookup order.
+
+    Secrets are looked up in the directory of the document first, then in its parent
+    directories up to the directory of the main configuration file.
+    """
+    directory = os.path.abspath(directory)
+    root = _SECRET_ROOT or directory
+    paths = [os.path.join(directory, SECRET_YAML)]
+    while directory != root:
+        parent = os.path.dirname(directory)
+        if parent == directory or os.path.commonpath([parent, root]) != root:
+            # Document is outside of the config directory, continue with the root secrets
+            paths.append(os.path.join(root, SECRET_YAML))
+            break
+        directory = parent
+        paths.append(os.path.join(directory, SECRET_YAML))
+    return paths
+
+
+def _load_secrets_file(path):
+    """Return the secrets defined in path, or None if there's no such file.
+
+    Each secrets file is only parsed once per load_yaml call.
+    """
+    if path not in _SECRET_CACHE:
+        if not os.path.isfile(path):
+            _SECRET_CACHE[path] = None, None
+        elif _YAML_CACHE is None:
+            _SECRET_CACHE[path] = _load_yaml_internal(path), None
+        else:
+            with _YAML_CACHE.track() as frame:
+                secrets = _load_yaml_internal(path)
+            _SECRET_CACHE[path] = secrets, frame
+            return secrets
+
+    secrets, frame = _SECRET_CACHE[path]
+    if _YAML_CACHE is not None:
+        if secrets is None:
+            _YAML_CACHE.track_missing_file(path)
+        elif frame is not None:
+            _YAML_CACHE.track_frame(frame)
+    return secrets
+
+
+def _load_yaml_uncached(fname, content):
+    try:
+        return _load_yaml_internal_with_type(ESPHomeLoader, fname, content)
+    except EsphomeError:
+        if FastestAvailableSafeLoader is yaml.SafeLoader:
+            raise
+        # Loading failed, so we now load with the Python loader which has more
+        # readable exceptions
+        return _load_yaml_internal_with_type(ESPHomePurePythonLoader, fname, content)
+
+
+def _load_yaml_internal_with_type(loader_type, fname, content):
+    loader = loader_type(content, fname)
     try:
         return loader.get_single_data() or OrderedDict()
     except yaml.YAMLError as exc:
@@ -303,6 +637,309 @@ def _load_yaml_internal(fname):
         loader.dispose()
 
 
+# Bump this when the format of cache entries changes
+YAML_CACHE_VERSION = 1
+
+
+class _Uncacheable(Exception):
+    """Raised when a constructed document contains values the cache can't store."""
+
+
+def _file_fingerprint(fname, content):
+    # type: (str, str) -> Tuple[int, int, str]
+    stat = os.stat(fname)
+    digest = hashlib.sha256(content.encode('utf-8')).hexdigest()
+    return stat.st_mtime_ns, stat.st_size, digest
+
+
+class _LoadFrame:
+    """The inputs a single file load depends on, collected while the file is constructed."""
+
+    def __init__(self):
+        # Absolute path -> (mtime_ns, size, sha256 of content) of all loaded files
+        self.files = {}
+        # Directory -> list of files found by !include_dir_* tags
+        self.directories = {}
+        # Environment variable name -> value (None if unset) read by !env_var tags
+        self.env_vars = {}
+        # Reverse secret mapping (see _SECRET_VALUES) registered by !secret tags
+        self.secrets = {}
+
+    def update(self, other):
+        self.files.update(other.files)
+        self.directories.update(other.directories)
+        self.env_vars.update(other.env_vars)
+        self.secrets.update(other.secrets)
+
+
+class YAMLCache:
+    """Persistent cache of constructed YAML documents.
+
+    Entries are keyed on the absolute path of a file and the directory of the main
+    configuration file, where the lookup of secrets ends. They are only re-used if the
+    mtime, size and content hash of the file and everything it includes (including
+    secrets files, directory listings and environment variables) are unchanged.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._stack = []  # type: List[_LoadFrame]
+
+    def _entry_path(self, fname):
+        # Which secrets files !secret tags look in depends on the directory of the main
+        # configuration file, see _secret_search_path
+        name = f'{os.path.abspath(fname)}\0{_SECRET_ROOT}'
+        key = hashlib.sha256(name.encode('utf-8')).hexdigest()
+        # Entries written with compact locations don't have ranges for mapping keys
+        suffix = '-compact' if _LOCATIONS is not None else ''
+        return os.path.join(self.directory, f'{key}{suffix}.bin')
+
+    def track_env_var(self, name):
+        if self._stack:
+            self._stack[-1].env_vars[name] = os.environ.get(name)
+
+    def track_secret(self, value, name):
+        if self._stack:
+            self._stack[-1].secrets[value] = name
+
+    def track_directory(self, directory, files):
+        if self._stack:
+            self._stack[-1].directories[os.path.abspath(directory)] = list(files)
+
+    def track_missing_file(self, path):
+        if self._stack:
+            self._stack[-1].files[os.path.abspath(path)] = None
+
+    def track_frame(self, frame):
+        if self._stack:
+            self._stack[-1].update(frame)
+
+    @contextmanager
+    def track(self):
+        """Collect the inputs of all files loaded in this context in a new frame."""
+        frame = _LoadFrame()
+        self._stack.append(frame)
+        try:
+            yield frame
+        finally:
+            self._stack.pop()
+            self.track_frame(frame)
+
+    def load(self, fname, content):
+        abspath = os.path.abspath(fname)
+        fingerprint = _file_fingerprint(fname, content)
+        entry = self._read_entry(fname)
+        if entry is not None and entry['files'].get(abspath) == fingerprint and \
+                self._is_valid(entry):
+            self.hits += 1
+            frame = _LoadFrame()
+            frame.files.update(entry['files'])
+            frame.directories.update(entry['directories'])
+            frame.env_vars.update(entry['env_vars'])
+            frame.secrets.update(entry['secrets'])
+            _SECRET_VALUES.update(entry['secrets'])
+            self.track_frame(frame)
+            return _decode_document(entry['data'], entry['documents'])
+
+        self.misses += 1
+        with self.track() as frame:
+            frame.files[abspath] = fingerprint
+            value = _load_yaml_uncached(fname, content)
+        self._write_entry(fname, frame, value)
+        return value
+
+    @staticmethod
+    def _is_valid(entry):
+        for path, fingerprint in entry['files'].items():
+            if fingerprint is None:
+                # File was looked for but didn't exist
+                if os.path.exists(path):
+                    return False
+                continue
+            mtime, size, digest = fingerprint
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return False
+            if stat.st_mtime_ns == mtime and stat.st_size == size:
+                continue
+            # Touched but maybe not modified, compare the content hash
+            if stat.st_size != size:
+                return False
+            try:
+                if _file_fingerprint(path, read_file(path))[2] != digest:
+                    return False
+            except (OSError, EsphomeError):
+                return False
+        for directory, files in entry['directories'].items():
+            if filter_yaml_files(_find_files(directory, '*.yaml')) != files:
+                return False
+        for name, value in entry['env_vars'].items():
+            if os.environ.get(name) != value:
+                return False
+        return True
+
+    def _read_entry(self, fname):
+        path = self._entry_path(fname)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path, 'rb') as f_handle:
+                entry = marshal.loads(f_handle.read())
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.debug("Ignoring corrupt YAML cache entry %s", path, exc_info=True)
+            return None
+        if not isinstance(entry, dict) or entry.get('version') != _cache_version():
+            return None
+        return entry
+
+    def _write_entry(self, fname, frame, value):
+        documents = []
+        try:
+            data = _encode_document(value, documents, _document_range_of(value))
+        except _Uncacheable as err:
+            _LOGGER.debug("Not caching %s: %s", fname, err)
+            return
+        entry = {
+            'version': _cache_version(),
+            'files': frame.files,
+            'directories': frame.directories,
+            'env_vars': frame.env_vars,
+            'secrets': frame.secrets,
+            'documents': documents,
+            'data': data,
+        }
+        try:
+            write_file(self._entry_path(fname), marshal.dumps(entry))
+        except EsphomeError as err:
+            _LOGGER.debug("Could not write YAML cache entry for %s: %s", fname, err)
+
+
+def _cache_version():
+    # marshal's format is only stable within one python version
+    return f'{YAML_CACHE_VERSION}-{sys.hexversion}'
+
+
+def _encode_document(value, documents, doc_range):
+    """Encode a constructed document into marshal-able builtins.
+
+    Every node is encoded as a (kind, payload, range, forced) tuple, where range is
+    a (document index, start line, start column, end line, end column) tuple.
+    """
+    if doc_range is not None:
+        start, end = doc_range.start_mark, doc_range.end_mark
+        try:
+            doc_index = documents.index(start.document)
+        except ValueError:
+            doc_index = len(documents)
+            documents.append(start.document)
+        doc_range = (doc_index, start.line, start.column, end.line, end.column)
+    forced = isinstance(value, ESPForceValue)
+
+    if value is None:
+        return 'n', None, doc_range, forced
+    if isinstance(value, bool):
+        return 'b', bool(value), doc_range, forced
+    if isinstance(value, int):
+        return 'i', int(value), doc_range, forced
+    if isinstance(value, float):
+        return 'f', float(value), doc_range, forced
+    if isinstance(value, str):
+        return 's', str(value), doc_range, forced
+    if isinstance(value, bytes):
+        return 'y', bytes(value), doc_range, forced
+    if isinstance(value, Lambda):
+        return 'l', value.value, doc_range, forced
+    if isinstance(value, list):
+        items = [_encode_document(x, documents, get_document_range(value, i))
+                 for i, x in enumerate(value)]
+        return 'L', items, doc_range, forced
+    if isinstance(value, dict):
+        items = [(_encode_document(k, documents, _document_range_of(k)),
+                  _encode_document(v, documents, get_document_range(value, k)))
+                 for k, v in value.items()]
+        return 'M', items, doc_range, forced
+    raise _Uncacheable(f"values of type {type(value).__name__} are not supported")
+
+
+_DECODE_SAMPLES = {
+    'n': lambda: None,
+    'b': lambda: False,
+    'i': int,
+    'f': float,
+    's': str,
+    'y': bytes,
+    'l': lambda: Lambda(''),
+    'L': list,
+    'M': OrderedDict,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _decode_class(kind, forced, data_base):
+    """Return the class the YAML loader would give a value of this kind, or None for builtins."""
+    sample = _DECODE_SAMPLES[kind]()
+    if forced:
+        sample = add_class_to_obj(sample, ESPForceValue)
+    if data_base:
+        sample = make_data_base(sample)
+    if type(sample) is type(_DECODE_SAMPLES[kind]()):  # pylint: disable=unidiomatic-typecheck
+        return None
+    return type(sample)
+
+
+def _decode_document(data, documents):
+    """Inverse of _encode_document, creates the same objects as the YAML loader."""
+    kind, payload, doc_range, forced = data
+    item_ranges = None
+    if kind == 'L':
+        item_ranges = [x[2] for x in payload]
+        payload = [_decode_document(x, documents) for x in payload]
+    elif kind == 'M':
+        item_ranges = [v[2] for _, v in payload]
+        payload = [(_decode_document(k, documents), _decode_document(v, documents))
+                   for k, v in payload]
+    elif kind == 'l':
+        payload = Lambda(payload)
+    elif kind == 'n':
+        return None
+
+    cls = _decode_class(kind, forced, doc_range is not None and _LOCATIONS is None)
+    if cls is None:
+        value = OrderedDict(payload) if kind == 'M' else payload
+    elif kind == 'l':
+        payload.__class__ = cls
+        value = payload
+    else:
+        value = cls(payload)
+
+    if _LOCATIONS is not None:
+        if item_ranges is not None:
+            rows = [_decode_row(x, documents) for x in item_ranges]
+            if kind == 'M':
+                rows = dict(zip(value.keys(), rows))
+            _LOCATIONS.set_container_row(value, _decode_row(doc_range, documents))
+            _LOCATIONS.set_items(value, rows)
+    elif doc_range is not None and cls is not None:
+        doc_index, start_line, start_col, end_line, end_col = doc_range
+        document = documents[doc_index]
+        # pylint: disable=protected-access
+        value._esp_range = DocumentRange(
+            DocumentLocation(document, start_line, start_col),
+            DocumentLocation(document, end_line, end_col),
+        )
+    return value
+
+
+def _decode_row(doc_range, documents):
+    if doc_range is None:
+        return -1
+    doc_index, start_line, start_col, end_line, end_col = doc_range
+    return _LOCATIONS.add_range(documents[doc_index], start_line, start_col, end_line, end_col)
+
+
 def dump(dict_):
     """Dump YAML to a string and remove null."""
     return yaml.dump(dict_, default_flow_style=False, allow_unicode=True,
@@ -421,3 +1058,65 @@ ESPHomeDumper.add_multi_representer(TimePeriod, ESPHomeDumper.represent_stringif
 ESPHomeDumper.add_multi_representer(Lambda, ESPHomeDumper.represent_lambda)
 ESPHomeDumper.add_multi_representer(core.ID, ESPHomeDumper.represent_id)
 ESPHomeDumper.add_multi_representer(uuid.UUID, ESPHomeDumper.represent_stringify)
+
+
+# Bump this when the format of the dump cache changes
+DUMP_CACHE_VERSION = 1
+
+
+class DumpCache:
+    """Dump component configs like dump, reusing the dumps of earlier runs.
+
+    Dumps are stored by the hash of the fingerprint of the config, which is much faster to
+    compute than the dump itself. Configs without a fingerprint are dumped every time. The
+    dumps depend on the code of ESPHome and on the secrets, the cache is discarded when either
+    changes.
+    """
+
+    def __init__(self, path=None):  # type: (Optional[str]) -> None
+        self.path = path
+        self._context = None
+        self._dumps = {}  # type: Dict[str, str]
+        # The dumps of this run, only these are stored again
+        self._used = {}  # type: Dict[str, str]
+        if path is not None:
+            self._context = cache_util.digest(
+                repr((DUMP_CACHE_VERSION, yaml.__version__,
+                      cache_util.code_fingerprint(*cache_util.code_dirs()),
+                      sorted(_SECRET_VALUES.items()))))
+            self._dumps = self._load()
+
+    def _load(self):  # type: () -> Dict[str, str]
+        try:
+            with open(self.path, 'rb') as f_handle:
+                entry = marshal.loads(f_handle.read())
+            if entry['version'] == DUMP_CACHE_VERSION and entry['context'] == self._context:
+                return entry['dumps']
+        except FileNotFoundError:
+            pass
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.debug("Ignoring corrupt dump cache %s", self.path, exc_info=True)
+        return {}
+
+    def dump(self, data):  # type: (Any) -> str
+        if self.path is None:
+            return dump(data)
+        try:
+            key = cache_util.digest(cache_util.fingerprint(data))
+        except cache_util.Uncacheable:
+            return dump(data)
+        text = self._dumps.get(key)
+        if text is None:
+            text = dump(data)
+        self._used[key] = text
+        return text
+
+    def save(self):  # type: () -> None
+        """Store the dumps of this run, if they changed."""
+        if self.path is None or self._used == self._dumps:
+            return
+        entry = {'version': DUMP_CACHE_VERSION, 'context': self._context, 'dumps': self._used}
+        try:
+            write_file(self.path, marshal.dumps(entry))
+        except EsphomeError as err:
+            _LOGGER.debug("Could not write dump cache: %s", err)
@@ -0,0 +1,810 @@
+#!/usr/bin/env python3
+"""Micro benchmarks for the hot paths of the ESPHome toolchain.
+
+Run with `script/benchmark.py <benchmark> [options]`, for example
+`script/benchmark.py yaml tests/test1.yaml`.
+"""
+from pathlib import Path
+import argparse
+import contextlib
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+# The root directory of the repo
+root = Path(__file__).parent.parent
+sys.path.insert(0, str(root))
+
+# pylint: disable=wrong-import-position
+from esphome import yaml_util  # noqa: E402
+from esphome.helpers import read_file  # noqa: E402
+
+DEFAULT_CONFIGS = [str(root / 'tests' / f'test{i}.yaml') for i in range(1, 5)]
+
+
+def _time(func, number):
+    """Return the best time per call of func over `number` runs, in milliseconds."""
+    timer = timeit.Timer(func)
+    return min(timer.repeat(repeat=3, number=number)) / number * 1000
+
+
+def _print_row(*columns):
+    print(''.join(f'{col:<22}' for col in columns).rstrip())
+
+
+def benchmark_yaml(args):
+    loaders = [('pure python', yaml_util.ESPHomePurePythonLoader)]
+    if yaml_util.FastestAvailableSafeLoader is not yaml_util.yaml.SafeLoader:
+        loaders.append(('libyaml', yaml_util.ESPHomeLoader))
+    else:
+        print("PyYAML was built without libyaml, only the pure python loader is available")
+
+    _print_row('file', *(name for name, _ in loaders), 'speedup')
+    for fname in args.configs or DEFAULT_CONFIGS:
+        content = read_file(fname)
+        times = []
+        for _, loader in loaders:
+            # pylint: disable=protected-access, cell-var-from-loop
+            times.append(_time(lambda: yaml_util._load_yaml_internal_with_type(
+                loader, fname, content), args.number))
+        _print_row(Path(fname).name, *(f'{t:.2f} ms' for t in times),
+                   f'{times[0] / times[-1]:.2f}x')
+
+
+def benchmark_secrets(args):
+    _print_row('secrets', 'load_yaml', 'per secret')
+    for count in args.counts:
+        with tempfile.TemporaryDirectory() as directory:
+            directory = Path(directory)
+            (directory / 'secrets.yaml').write_text(
+                ''.join(f'secret_{i}: value {i}\n' for i in range(count)))
+            config = directory / 'config.yaml'
+            config.write_text(''.join(f'key_{i}: !secret secret_{i}\n' for i in range(count)))
+            duration = _time(lambda: yaml_util.load_yaml(str(config)), args.number)
+        _print_row(count, f'{duration:.2f} ms', f'{duration / count * 1000:.2f} us')
+
+
+def _retained_memory(func):
+    """Return the size of the result of func in kB, measured with tracemalloc."""
+    tracemalloc.start()
+    try:
+        result = func()  # noqa: F841 pylint: disable=unused-variable
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return size / 1024
+
+
+def benchmark_locations(args):
+    _print_row('file', 'mode', 'retained', 'load_yaml')
+    for fname in args.configs or DEFAULT_CONFIGS:
+        for mode, compact in (('default', False), ('compact', True)):
+            # pylint: disable=cell-var-from-loop
+            def load():
+                # Return the table too, it's kept alive as long as the config is
+                # pylint: disable=protected-access
+                return yaml_util.load_yaml(fname, compact_locations=compact), \
+                    yaml_util._LOCATIONS
+
+            memory = _retained_memory(load)
+            duration = _time(load, args.number)
+            _print_row(Path(fname).name, mode, f'{memory:.1f} kB', f'{duration:.2f} ms')
+
+
+def _leaf_paths(value, path=()):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _leaf_paths(item, path + (key,))
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            yield from _leaf_paths(item, path + (i,))
+    else:
+        yield list(path)
+
+
+def benchmark_errors(args):
+    from esphome import config
+
+    loaded = yaml_util.load_yaml(args.config)
+    paths = list(_leaf_paths(loaded))
+    _print_row('errors', 'render')
+    for count in args.counts:
+        # Spread the errors over the whole config
+        error_paths = paths[::max(1, len(paths) // count)][:count]
+
+        def render():
+            result = config.Config()
+            result.update(loaded)
+            for domain in loaded:
+                result.add_output_path([domain], domain)
+            for path in error_paths:  # pylint: disable=cell-var-from-loop
+                result.add_str_error("Invalid option", path)
+            for path, _ in result.output_paths:
+                if result.is_in_error_path(path):
+                    config.dump_dict(result, path)
+
+        _print_row(len(error_paths), f'{_time(render, args.number):.2f} ms')
+
+
+def _sensor_config(count):
+    lines = ['esphome:', '  name: benchmark', '  platform: ESP8266', '  board: nodemcuv2',
+             'sensor:']
+    for i in range(count):
+        lines += [
+            '  - platform: template',
+            f'    name: "Sensor {i}"',
+            f'    id: sensor_{i}',
+            '    lambda: return 42.0;',
+            '    update_interval: 60s',
+            '    filters:',
+            '      - offset: 1.0',
+            '      - sliding_window_moving_average:',
+            '          window_size: 15',
+            '          send_every: 15',
+            '    on_value:',
+            '      - logger.log: "value"',
+        ]
+    return '\n'.join(lines) + '\n'
+
+
+def benchmark_schemas(args):
+    if args.cache_size is None:
+        # Import time can only be measured in a fresh interpreter
+        from esphome.voluptuous_schema import COMPILE_CACHE_SIZE
+
+        _print_row('schema cache', 'import components', 'compiled', 'cache hits',
+                   *(f'validate {Path(c).name}' for c in args.configs or DEFAULT_CONFIGS))
+        for size in (0, COMPILE_CACHE_SIZE):
+            subprocess.run([sys.executable, __file__, '-n', str(args.number), 'schemas',
+                            '--cache-size', str(size), *args.configs], check=True)
+        return
+
+    from esphome import voluptuous_schema
+
+    # Before any schemas are created
+    voluptuous_schema.COMPILE_CACHE_SIZE = args.cache_size
+    logging.disable(logging.WARNING)
+    from esphome import config
+    from esphome.core import CORE
+
+    stats = voluptuous_schema.COMPILE_CACHE_STATS
+    CORE.config_path = str(root / 'tests' / 'dummy.yaml')
+    start = timeit.default_timer()
+    for path in sorted((root / 'esphome' / 'components').iterdir()):
+        if not (path / '__init__.py').is_file():
+            continue
+        config.get_component(path.name)
+        for platform_path in path.iterdir():
+            if platform_path.suffix == '.py' or platform_path.is_dir():
+                config.get_platform(platform_path.stem, path.name)
+    import_time = (timeit.default_timer() - start) * 1000
+    compiled, hits = stats['misses'], stats['hits']
+
+    times = []
+    for fname in args.configs or DEFAULT_CONFIGS:
+        def validate(fname=fname):
+            CORE.reset()
+            CORE.config_path = fname
+            CORE.raw_config = yaml_util.load_yaml(fname)
+            config.validate_config(CORE.raw_config, {})
+        times.append(_time(validate, args.number))
+    _print_row(args.cache_size or 'off', f'{import_time:.2f} ms', compiled, hits,
+               *(f'{t:.2f} ms' for t in times))
+
+
+def benchmark_manifests(args):
+    if args.index is None:
+        # Imports can only be measured in a fresh interpreter
+        _print_row('manifest index', 'resolve metadata', 'modules imported',
+                   *(f'validate {Path(c).name}' for c in args.configs or DEFAULT_CONFIGS))
+        for index in ('off', 'on'):
+            subprocess.run([sys.executable, __file__, 'manifests', '--index', index,
+                            *args.configs], check=True)
+        return
+
+    logging.disable(logging.WARNING)
+    from esphome import config
+    from esphome.core import CORE
+
+    if args.index == 'off':
+        config._MANIFEST_INDEX = {}  # pylint: disable=protected-access
+
+    if args.validate:
+        CORE.config_path = args.validate
+        CORE.raw_config = raw = yaml_util.load_yaml(args.validate)
+        start = timeit.default_timer()
+        config.validate_config(raw, {})
+        print((timeit.default_timer() - start) * 1000)
+        return
+
+    def imported():
+        return sum(name.startswith('esphome.components.') for name in sys.modules)
+
+    CORE.config_path = str(root / 'tests' / 'dummy.yaml')
+    before = imported()
+    start = timeit.default_timer()
+    for path in sorted((root / 'esphome' / 'components').iterdir()):
+        if not (path / '__init__.py').is_file():
+            continue
+        comp = config.get_component(path.name)
+        _ = comp.dependencies, comp.auto_load, comp.conflicts_with, comp.esp_platforms
+    metadata_time = (timeit.default_timer() - start) * 1000
+    modules = imported() - before
+
+    times = []
+    for fname in args.configs or DEFAULT_CONFIGS:
+        # Validating in a fresh interpreter includes importing the components
+        output = subprocess.run([sys.executable, __file__, 'manifests', '--index', args.index,
+                                 '--validate', fname], check=True, stdout=subprocess.PIPE)
+        times.append(float(output.stdout.decode().split()[-1]))
+    _print_row(args.index, f'{metadata_time:.2f} ms', modules, *(f'{t:.2f} ms' for t in times))
+
+
+def benchmark_preprocess(args):
+    from esphome import config
+    from esphome.components import substitutions
+    from esphome.config_walker import ConfigWalker
+    from esphome.core import CORE
+
+    _print_row('entities', 'raw values', 'substitutions', 'validated values', 'iter_ids')
+    for count in args.counts:
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'benchmark.yaml'
+            content = _sensor_config(count).replace('name: "Sensor', 'name: "${prefix}')
+            path.write_text('substitutions:\n  prefix: Sensor\n' + content)
+            CORE.reset()
+            CORE.config_path = str(path)
+
+            times = []
+            for _ in range(args.number):
+                raw = yaml_util.load_yaml(str(path))
+                start = timeit.default_timer()
+                # Like validate_config, substitutions and REPLACEME checks share one walk
+                walker = ConfigWalker()
+                substitutions.do_substitution_pass(raw, {}, walker)
+                walker.add_visitor(str, config.check_replaceme)
+                walker.walk(raw)
+                times.append(timeit.default_timer() - start)
+            preprocess = min(times) * 1000
+            raw_values = _count_values(raw)
+
+            CORE.raw_config = raw
+            result = config.validate_config(raw, {})
+            assert not result.errors, result.errors
+            iter_ids = _time(lambda: config.iter_ids(result), args.number)
+            _print_row(count, raw_values, f'{preprocess:.2f} ms',
+                       _count_values(result), f'{iter_ids:.2f} ms')
+
+
+def _fold_packages(config):
+    """do_packages_pass before packages were merged in a single pass, for comparison."""
+    import esphome.config_validation as cv
+
+    def merge(old, new):
+        if isinstance(new, dict):
+            if not isinstance(old, dict):
+                return new
+            res = old.copy()
+            for key, value in new.items():
+                res[key] = merge(old[key], value) if key in old else value
+            return res
+        if isinstance(new, list) and isinstance(old, list):
+            return old + new
+        return new
+
+    if 'packages' not in config:
+        return config
+    with cv.prepend_path('packages'):
+        for package_name, package_config in config['packages'].items():
+            with cv.prepend_path(package_name):
+                if isinstance(package_config, dict):
+                    package_config = _fold_packages(package_config)
+                config = merge(package_config, config)
+        del config['packages']
+    return config
+
+
+def _layered_packages(count, depth, sensors):
+    """A config with count packages, each nesting depth packages with sensors and options."""
+    def package(name, level):
+        config = {
+            'sensor': [{'platform': 'template', 'name': f'{name} {i}'} for i in range(sensors)],
+            'wifi': {'ssid': name, 'manual_ip': {'static_ip': f'10.0.0.{level}'}},
+            'esphome': {'name': 'device', 'on_boot': [{'logger.log': name}]},
+        }
+        if level < depth:
+            config['packages'] = {f'{name}_{level}': package(f'{name}_{level}', level + 1)}
+        return config
+
+    config = package('config', depth)
+    config['packages'] = {f'package_{i}': package(f'package_{i}', 1) for i in range(count)}
+    return config
+
+
+def benchmark_packages(args):
+    from esphome.components import packages
+
+    _print_row('packages', 'depth', 'merged values', 'fold', 'single pass')
+    for count in args.counts:
+        for depth in args.depths:
+            # Neither merge modifies the config, so it can be merged repeatedly
+            config = _layered_packages(count, depth, args.sensors)
+            actual = packages.do_packages_pass(config)
+            assert actual == _fold_packages(config)
+            fold = _time(lambda: _fold_packages(config), args.number)
+            single = _time(lambda: packages.do_packages_pass(config), args.number)
+            _print_row(count, depth, _count_values(actual), f'{fold:.2f} ms', f'{single:.2f} ms')
+
+
+def _flush_tasks(add_jobs, number):
+    """Return the task steps, variable stats and best time in ms of CORE.flush_tasks."""
+    from esphome.core import CORE
+
+    times = []
+    steps = stats = None
+    for i in range(number + 1):
+        add_jobs()
+        if i == 0:
+            # Only count in a separate run, debug logging slows down every step
+            disabled = logging.root.manager.disable
+            logging.disable(logging.NOTSET)
+            with _capture_log('esphome.core') as messages:
+                CORE.flush_tasks()
+            logging.disable(disabled)
+            steps = next(m for m in messages if m.startswith('Ran ')).split()[1]
+            stats = dict(CORE.variable_stats)
+            continue
+        start = timeit.default_timer()
+        CORE.flush_tasks()
+        times.append(timeit.default_timer() - start)
+    return steps, stats, min(times) * 1000
+
+
+def benchmark_codegen(args):
+    from esphome import __main__ as esphome_main
+    from esphome.config import iter_components, read_config
+    from esphome.core import CORE, ID, coroutine_with_priority
+
+    logging.disable(logging.WARNING)
+    _print_row('config', 'task steps', 'variables', 'lookups', 'full ID lookups', 'waits',
+               'flush_tasks')
+    for fname in args.configs or DEFAULT_CONFIGS:
+        def add_jobs():
+            # Validation sets up CORE for code generation
+            CORE.reset()
+            CORE.config_path = fname
+            CORE.config = read_config({})
+            for name, component, conf in iter_components(CORE.config):
+                if component.to_code is not None:
+                    CORE.add_job(esphome_main.wrap_to_code(name, component), conf)
+
+        steps, stats, time_ = _flush_tasks(add_jobs, args.number)
+        _print_row(Path(fname).name, steps, *stats.values(), f'{time_:.2f} ms')
+
+    # Tasks waiting for an ID that is registered by a task with a low priority
+    for count in args.waiting:
+        late_id = ID('late', is_declaration=True)
+
+        def wait():
+            yield CORE.get_variable(late_id)
+
+        @coroutine_with_priority(-100.0)
+        def register():
+            CORE.register_variable(late_id, None)
+            yield
+
+        def add_jobs():
+            CORE.reset()
+            for _ in range(count):
+                CORE.add_job(wait)
+            CORE.add_job(register)
+
+        steps, stats, time_ = _flush_tasks(add_jobs, args.number)
+        _print_row(f'{count} waiting', steps, *stats.values(), f'{time_:.2f} ms')
+
+    # Lambdas referencing variables, like process_lambda does for every id(...) in a lambda
+    for count in args.lambdas:
+        ids = [ID(f'variable_{i}', is_declaration=True) for i in range(count)]
+
+        def register_all():
+            for id_ in ids:
+                CORE.register_variable(id_, None)
+            yield
+
+        def lambda_ids(id_):
+            yield CORE.get_variable_with_full_id(id_)
+
+        def add_jobs():
+            CORE.reset()
+            CORE.add_job(register_all)
+            for id_ in ids:
+                CORE.add_job(lambda_ids, ID(id_.id))
+
+        steps, stats, time_ = _flush_tasks(add_jobs, args.number)
+        _print_row(f'{count} lambdas', steps, *stats.values(), f'{time_:.2f} ms')
+
+
+def benchmark_codegen_cache(args):
+    import shutil
+    from esphome import __main__ as esphome_main
+    from esphome.config import read_config
+    from esphome.core import CORE
+
+    logging.disable(logging.WARNING)
+    _print_row('config', 'run', 'generate', 'cache')
+    for fname in args.configs or DEFAULT_CONFIGS:
+        with tempfile.TemporaryDirectory() as directory:
+            # The cache is stored next to the config
+            shutil.copytree(Path(fname).parent, directory, dirs_exist_ok=True,
+                            ignore=shutil.ignore_patterns('build', '.esphome'))
+            path = str(Path(directory) / Path(fname).name)
+            for name, use_cache in [('no cache', False), ('cold', True), ('warm', True)]:
+                times = []
+                stats = ''
+                for _ in range(1 if name == 'cold' else args.number):
+                    CORE.reset()
+                    CORE.config_path = path
+                    CORE.config = read_config({})
+                    CORE.codegen_cache = use_cache
+                    start = timeit.default_timer()
+                    disabled = logging.root.manager.disable
+                    logging.disable(logging.NOTSET)
+                    with _capture_log('esphome.__main__') as messages:
+                        esphome_main.generate_cpp_contents(CORE.config)
+                    logging.disable(disabled)
+                    times.append(timeit.default_timer() - start)
+                    stats = next((m for m in messages if 'Codegen cache' in m), '')
+                _print_row(Path(fname).name, name, f'{min(times) * 1000:.2f} ms',
+                           stats.split(': ')[-1])
+            CORE.codegen_cache = False
+
+
+def benchmark_comments(args):
+    import shutil
+    from esphome import __main__ as esphome_main
+    from esphome.config import read_config
+    from esphome.core import CORE
+
+    logging.disable(logging.WARNING)
+    _print_row('config', 'comments', 'generate')
+    for fname in args.configs or DEFAULT_CONFIGS:
+        with tempfile.TemporaryDirectory() as directory:
+            # The dump cache is stored next to the config
+            shutil.copytree(Path(fname).parent, directory, dirs_exist_ok=True,
+                            ignore=shutil.ignore_patterns('build', '.esphome'))
+            path = str(Path(directory) / Path(fname).name)
+            modes = [('dumped', False, True), ('cold cache', True, True),
+                     ('warm cache', True, True), ('off', False, False)]
+            for name, yaml_cache, comments in modes:
+                times = []
+                for _ in range(1 if name == 'cold cache' else args.number):
+                    CORE.reset()
+                    CORE.config_path = path
+                    CORE.config = read_config({})
+                    CORE.yaml_cache = yaml_cache
+                    CORE.config_comments = comments
+                    start = timeit.default_timer()
+                    esphome_main.generate_cpp_contents(CORE.config)
+                    times.append(timeit.default_timer() - start)
+                _print_row(Path(fname).name, name, f'{min(times) * 1000:.2f} ms')
+            CORE.yaml_cache = False
+            CORE.config_comments = True
+
+
+def _include_graph(src):
+    """Return the files in src each file includes with #include "...", by relative path."""
+    import re
+
+    include_re = re.compile(r'^\s*#\s*include\s*"([^"]+)"', re.MULTILINE)
+    files = {path.relative_to(src).as_posix() for path in src.rglob('*') if path.is_file()}
+    graph = {}
+    for name in files:
+        text = (src / name).read_text(errors='replace')
+        graph[name] = set()
+        for include in include_re.findall(text):
+            relative = os.path.normpath(os.path.join(os.path.dirname(name), include))
+            for candidate in (relative.replace(os.sep, '/'), include):
+                if candidate in files:
+                    graph[name].add(candidate)
+                    break
+    return graph
+
+
+def _rebuilt_units(graph, units, changed):
+    """Return the translation units that include one of the changed files."""
+    rebuilt = 0
+    for unit in units:
+        seen = set()
+        stack = [unit]
+        while stack:
+            name = stack.pop()
+            if name in changed:
+                rebuilt += 1
+                break
+            if name not in seen:
+                seen.add(name)
+                stack.extend(graph.get(name, ()))
+    return rebuilt
+
+
+def benchmark_includes(args):
+    import shutil
+    from esphome import __main__ as esphome_main
+    from esphome.config import read_config
+    from esphome.core import CORE
+
+    logging.disable(logging.WARNING)
+    _print_row('config', 'units', 'rebuilt avg', 'rebuilt max')
+    for fname in args.configs or DEFAULT_CONFIGS:
+        with tempfile.TemporaryDirectory() as directory:
+            shutil.copytree(Path(fname).parent, directory, dirs_exist_ok=True,
+                            ignore=shutil.ignore_patterns('build', '.esphome'))
+            CORE.reset()
+            CORE.config_path = str(Path(directory) / Path(fname).name)
+            CORE.config = read_config({})
+            esphome_main.write_cpp(CORE.config)
+            src = Path(CORE.relative_src_path())
+            graph = _include_graph(src)
+            units = [name for name in graph if os.path.splitext(name)[1] in ('.c', '.cpp')]
+            components = {}
+            for name in graph:
+                parts = name.split('/')
+                if parts[:2] == ['esphome', 'components']:
+                    components.setdefault(parts[2], set()).add(name)
+            rebuilt = {component: _rebuilt_units(graph, units, changed)
+                       for component, changed in components.items()}
+            most = max(rebuilt, key=rebuilt.get)
+            _print_row(Path(fname).name, len(units),
+                       f'{sum(rebuilt.values()) / len(rebuilt):.1f}',
+                       f'{rebuilt[most]} ({most})')
+
+
+def _crash_log(directory, backtraces, frames):
+    """Build an ELF linked at the ESP32 flash address and a crash log with backtraces in it."""
+    import random
+
+    source = Path(directory) / 'crash.c'
+    source.write_text(''.join(f'int func_{i}(int x) {{ return x * {i} + {i % 7}; }}\n'
+                              for i in range(200)) + 'int main(void) { return 0; }\n')
+    elf = Path(directory) / 'crash.elf'
+    subprocess.check_call(['gcc', '-g', '-O1', '-no-pie', '-Wl,-Ttext-segment=0x40000000',
+                           str(source), '-o', str(elf)])
+    symbols = subprocess.check_output(['nm', str(elf)], universal_newlines=True)
+    pcs = [int(line.split()[0], 16) + 2 for line in symbols.splitlines()
+           if ' func_' in line]
+    rand = random.Random(0)
+    lines = []
+    for _ in range(backtraces):
+        lines.append('[12:00:00]Guru Meditation Error: Core  1 panic\'ed (LoadProhibited)')
+        frames_s = ' '.join(f'0x{pc:08x}:0x3ffb1f00' for pc in rand.sample(pcs[:60], frames))
+        lines.append(f'Backtrace: {frames_s}')
+    log = Path(directory) / 'crash.log'
+    log.write_text('\n'.join(lines) + '\n')
+    return str(elf), str(log)
+
+
+def benchmark_addr2line(args):
+    from esphome import elf_symbols, platformio_api
+
+    if (args.elf is None) != (args.log is None):
+        sys.exit("--elf and --log must be given together")
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        if args.elf is None:
+            elf, log = _crash_log(directory, args.backtraces, args.frames)
+        else:
+            elf, log = args.elf, args.log
+        lines = Path(log).read_text().splitlines()
+        addr2line = _which(args.addr2line)
+        # IDE data pointing to the ELF and the addr2line next to the C compiler
+        platformio_api.IDE_DATA = platformio_api.IDEData({
+            'prog_path': elf, 'cc_path': addr2line[:-len('addr2line')] + 'gcc'})
+
+        def replay():
+            backtrace_state = False
+            for line in lines:
+                backtrace_state = platformio_api.process_stacktrace({}, line, backtrace_state)
+
+        def decode_per_process(config, addresses):
+            # How every address was decoded before, with one addr2line process each
+            for addr in addresses:
+                subprocess.check_output([addr2line, '-pfiaC', '-e', elf, addr])
+
+        decode_pcs = platformio_api._decode_pcs
+        platformio_api._decode_pcs = decode_per_process
+        per_process = _time(replay, 1)
+        platformio_api._decode_pcs = decode_pcs
+        cold = _time(lambda: (setattr(platformio_api, '_ADDR2LINE', None), replay()), 1)
+        warm = _time(replay, 1)
+        platformio_api._ADDR2LINE.close()
+
+        # Without addr2line, only the symbol table of the ELF
+        platformio_api.IDE_DATA = platformio_api.IDEData({'prog_path': elf})
+        symbols_cold = _time(lambda: (elf_symbols._INDEXES.clear(), elf_symbols._HASHES.clear(),
+                                      replay()), 1)
+        symbols_warm = _time(replay, 1)
+
+    _print_row('decoder', 'time', 'per backtrace')
+    count = sum('Backtrace:' in line for line in lines)
+    for name, time_ms in [('process per address', per_process), ('co-process', cold),
+                          ('co-process, cached', warm), ('symbol table', symbols_cold),
+                          ('symbols, memoised', symbols_warm)]:
+        _print_row(name, f'{time_ms:.1f} ms', f'{time_ms / count:.2f} ms')
+
+
+def _which(name):
+    import shutil
+
+    path = shutil.which(name)
+    if path is None:
+        sys.exit(f"{name} not found")
+    return path
+
+
+def benchmark_progmem(args):
+    from esphome import cpp_generator as cg
+    from esphome.core import HexInt
+
+    _print_row('size', 'HexInt list', 'bytes', 'speedup')
+    for size in args.sizes:
+        data = os.urandom(int(size * 1024 * 1024))
+        # How image and font data was passed to progmem_array before
+        hex_ints = _time(lambda: str(cg.safe_exp([HexInt(x) for x in data])), 1)
+        byte_data = _time(lambda: str(cg.safe_exp(data)), 1)
+        _print_row(f'{size} MiB', f'{hex_ints:.0f} ms', f'{byte_data:.0f} ms',
+                   f'{hex_ints / byte_data:.1f}x')
+
+
+def _count_values(config):
+    from esphome.config_walker import ConfigWalker
+
+    values = []
+    walker = ConfigWalker()
+    walker.add_visitor(object, lambda w, v: values.append(v) or v)
+    walker.walk(config)
+    return len(values)
+
+
+@contextlib.contextmanager
+def _capture_log(name):
+    messages = []
+    handler = logging.Handler(logging.DEBUG)
+    handler.emit = lambda record: messages.append(record.getMessage())
+    logger = logging.getLogger(name)
+    old_level = logger.level
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    try:
+        yield messages
+    finally:
+        logger.removeHandler(handler)
+        logger.setLevel(old_level)
+
+
+BENCHMARKS = {
+    'yaml': benchmark_yaml,
+    'secrets': benchmark_secrets,
+    'locations': benchmark_locations,
+    'errors': benchmark_errors,
+    'schemas': benchmark_schemas,
+    'manifests': benchmark_manifests,
+    'preprocess': benchmark_preprocess,
+    'packages': benchmark_packages,
+    'codegen': benchmark_codegen,
+    'codegen_cache': benchmark_codegen_cache,
+    'comments': benchmark_comments,
+    'includes': benchmark_includes,
+    'addr2line': benchmark_addr2line,
+    'progmem': benchmark_progmem,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run ESPHome micro benchmarks.")
+    parser.add_argument('-n', '--number', type=int, default=10,
+                        help="Number of runs per measurement.")
+    subparsers = parser.add_subparsers(dest='benchmark')
+    subparsers.required = True
+
+    parser_yaml = subparsers.add_parser('yaml', help="Compare the libyaml and pure python "
+                                                     "YAML loaders.")
+    parser_yaml.add_argument('configs', nargs='*', help="YAML files to load.")
+
+    parser_secrets = subparsers.add_parser('secrets', help="Load configs using many !secret "
+                                                           "tags.")
+    parser_secrets.add_argument('counts', nargs='*', type=int, default=[10, 100, 1000],
+                                help="Numbers of secrets to benchmark.")
+
+    parser_locations = subparsers.add_parser('locations', help="Compare memory usage of the "
+                                                               "source location modes.")
+    parser_locations.add_argument('configs', nargs='*', help="YAML files to load.")
+
+    parser_errors = subparsers.add_parser('errors', help="Render a failed config with many "
+                                                         "errors.")
+    parser_errors.add_argument('config', nargs='?', default=DEFAULT_CONFIGS[0],
+                               help="YAML file to add errors to.")
+    parser_errors.add_argument('--counts', nargs='*', type=int, default=[10, 100, 500],
+                               help="Numbers of errors to benchmark.")
+
+    parser_schemas = subparsers.add_parser('schemas', help="Load all components and validate "
+                                                           "configs with and without the "
+                                                           "compiled schema cache.")
+    parser_schemas.add_argument('configs', nargs='*', help="YAML files to validate.")
+    parser_schemas.add_argument('--cache-size', type=int,
+                                help="Only measure this compiled schema cache size.")
+
+    parser_manifests = subparsers.add_parser('manifests', help="Resolve component metadata and "
+                                                               "validate configs with and "
+                                                               "without the manifest index.")
+    parser_manifests.add_argument('configs', nargs='*', help="YAML files to validate.")
+    parser_manifests.add_argument('--index', choices=['on', 'off'],
+                                  help="Only measure with or without the manifest index.")
+    parser_manifests.add_argument('--validate', metavar='CONFIG',
+                                  help="Only measure validating this YAML file.")
+
+    parser_preprocess = subparsers.add_parser('preprocess', help="Expand substitutions, check "
+                                                                 "for REPLACEME and collect IDs "
+                                                                 "of generated configs.")
+    parser_preprocess.add_argument('counts', nargs='*', type=int, default=[100, 1000, 4000],
+                                   help="Numbers of sensors to benchmark.")
+
+    parser_packages = subparsers.add_parser('packages', help="Merge deeply layered packages.")
+    parser_packages.add_argument('counts', nargs='*', type=int, default=[10, 50, 100],
+                                 help="Numbers of packages to benchmark.")
+    parser_packages.add_argument('--depths', nargs='*', type=int, default=[1, 5],
+                                 help="Numbers of nested packages in every package.")
+    parser_packages.add_argument('--sensors', type=int, default=10,
+                                 help="Number of sensors in every package.")
+
+    parser_codegen = subparsers.add_parser('codegen', help="Run the code generation tasks of "
+                                                           "configs and of tasks waiting for "
+                                                           "an ID.")
+    parser_codegen.add_argument('configs', nargs='*', help="YAML files to generate code for.")
+    parser_codegen.add_argument('--waiting', nargs='*', type=int, default=[100, 1000],
+                                help="Numbers of waiting tasks to benchmark.")
+    parser_codegen.add_argument('--lambdas', nargs='*', type=int, default=[1000, 5000],
+                                help="Numbers of variables referenced by lambdas to benchmark.")
+
+    parser_codegen_cache = subparsers.add_parser('codegen_cache', help="Generate the code of "
+                                                                       "configs with the codegen "
+                                                                       "cache.")
+    parser_codegen_cache.add_argument('configs', nargs='*', help="YAML files to generate code "
+                                                                 "for.")
+
+    parser_comments = subparsers.add_parser('comments', help="Generate the code of configs "
+                                                             "with dumped, cached and without "
+                                                             "config comments.")
+    parser_comments.add_argument('configs', nargs='*', help="YAML files to generate code for.")
+
+    parser_includes = subparsers.add_parser('includes', help="Count the translation units "
+                                                             "rebuilt after changing the "
+                                                             "sources of one component.")
+    parser_includes.add_argument('configs', nargs='*', help="YAML files to generate code for.")
+
+    parser_addr2line = subparsers.add_parser('addr2line', help="Decode the backtraces of a "
+                                                               "crash log.")
+    parser_addr2line.add_argument('--elf', help="Firmware ELF to decode the addresses with, "
+                                                "by default an ELF is built with gcc.")
+    parser_addr2line.add_argument('--log', help="Crash log recorded from the firmware.")
+    parser_addr2line.add_argument('--addr2line', default='addr2line',
+                                  help="addr2line executable for the ELF.")
+    parser_addr2line.add_argument('--backtraces', type=int, default=20,
+                                  help="Number of backtraces in the generated crash log.")
+    parser_addr2line.add_argument('--frames', type=int, default=20,
+                                  help="Number of frames in every generated backtrace.")
+
+    parser_progmem = subparsers.add_parser('progmem', help="Format binary data like images and "
+                                                           "fonts for PROGMEM arrays.")
+    parser_progmem.add_argument('sizes', nargs='*', type=float, default=[1, 4],
+                                help="Sizes of the data to benchmark in MiB.")
+
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == '__main__':
+    main()
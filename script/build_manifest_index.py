@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+from pathlib import Path
+import argparse
+import importlib
+import json
+import sys
+
+from esphome.helpers import write_file_if_changed
+from esphome.config import ComponentManifest, CORE_COMPONENTS_PATH, MANIFEST_INDEX_FILE
+from esphome.const import ESP_PLATFORMS
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--check', help="Check if the manifest index is up to date.",
+                    action='store_true')
+args = parser.parse_args()
+
+components_dir = Path(CORE_COMPONENTS_PATH)
+index_file = components_dir / MANIFEST_INDEX_FILE
+
+
+def manifest_entry(name):
+    """Return the index entry of a component module, only values that differ from the default."""
+    module = importlib.import_module(f'esphome.components.{name}')
+    manifest = ComponentManifest(module, CORE_COMPONENTS_PATH)
+    entry = {}
+    for key, value, default in [
+            ('dependencies', manifest.dependencies, []),
+            ('auto_load', manifest.auto_load, []),
+            ('conflicts_with', manifest.conflicts_with, []),
+            ('esp_platforms', manifest.esp_platforms, ESP_PLATFORMS),
+    ]:
+        if callable(value):
+            print(f"{key.upper()} of {name} must be a list to be indexed")
+            sys.exit(1)
+        if list(value) != list(default):
+            entry[key] = list(value)
+    for key, value in [
+            ('is_platform_component', manifest.is_platform_component),
+            ('multi_conf', manifest.is_multi_conf),
+            ('config_schema', manifest.config_schema is not None),
+    ]:
+        if value:
+            entry[key] = True
+    return entry
+
+
+index = {}
+platform_paths = []
+for path in sorted(components_dir.iterdir()):
+    if not (path / '__init__.py').is_file():
+        continue
+    index[path.name] = manifest_entry(path.name)
+
+    for platform_path in sorted(path.iterdir()):
+        if platform_path.is_dir():
+            if not (platform_path / '__init__.py').is_file():
+                continue
+        elif platform_path.suffix != '.py' or platform_path.name == '__init__.py':
+            continue
+        platform_paths.append((path.name, platform_path.stem))
+
+for name, platform_name in platform_paths:
+    # Only modules named after a platform component are platforms, like adc/sensor.py
+    if not index.get(platform_name, {}).get('is_platform_component'):
+        continue
+    index[f'{name}.{platform_name}'] = manifest_entry(f'{name}.{platform_name}')
+
+content = json.dumps({
+    'comment': "This file is generated by script/build_manifest_index.py",
+    'components': index,
+}, indent=2, sort_keys=True) + '\n'
+
+if args.check:
+    if not index_file.is_file() or index_file.read_text() != content:
+        print("Manifest index is not up to date.")
+        print("Please run `script/build_manifest_index.py`")
+        sys.exit(1)
+    print("Manifest index is up to date")
+else:
+    write_file_if_changed(index_file, content)
+    print("Wrote manifest index")
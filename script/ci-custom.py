@@ -51,7 +51,7 @@ files.sort()
 
 file_types = ('.h', '.c', '.cpp', '.tcc', '.yaml', '.yml', '.ini', '.txt', '.ico', '.svg',
               '.py', '.html', '.js', '.md', '.sh', '.css', '.proto', '.conf', '.cfg',
-              '.woff', '.woff2', '')
+              '.woff', '.woff2', '.json', '')
 cpp_include = ('*.h', '*.c', '*.cpp', '*.tcc')
 ignore_types = ('.ico', '.woff', '.woff2', '')
 
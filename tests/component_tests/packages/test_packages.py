@@ -0,0 +1,122 @@
+""" Tests for the packages component """
+from collections import OrderedDict
+
+import pytest
+
+from esphome import config_validation as cv
+from esphome.components.packages import _merge_package, do_packages_pass
+
+
+def _fold(config):
+    """Merge the packages one at a time, like do_packages_pass did before merging in one pass."""
+    for package_config in config["packages"].values():
+        if isinstance(package_config, dict) and "packages" in package_config:
+            package_config = _fold(package_config)
+        config = _merge_package(package_config, config)
+    del config["packages"]
+    return config
+
+
+def _config():
+    return {
+        "packages": {
+            "first": {
+                "wifi": {"ssid": "first", "password": "first", "ap": {"ssid": "first"}},
+                "sensor": [{"id": "first"}],
+                "logger": {"level": "DEBUG"},
+                "api": None,
+            },
+            "second": {
+                "wifi": {"ssid": "second", "domain": ".second"},
+                "sensor": [{"id": "second"}],
+                "logger": "scalar",
+                "packages": {"nested": {"sensor": [{"id": "nested"}], "ota": {}}},
+            },
+            "third": {"sensor": {"id": "dict"}, "api": {"password": "third"}},
+        },
+        "esphome": {"name": "device"},
+        "wifi": {"ssid": "config"},
+        "sensor": [{"id": "config"}],
+        "logger": {"baud_rate": 0},
+    }
+
+
+def test_packages__merged():
+    """
+    Later packages are merged below the earlier ones, and all packages below the config
+    """
+    actual = do_packages_pass(_config())
+
+    assert actual == {
+        "esphome": {"name": "device"},
+        "wifi": {"ssid": "config", "password": "first", "ap": {"ssid": "first"},
+                 "domain": ".second"},
+        # Values of another type only replace the values of lower packages
+        "sensor": [{"id": "nested"}, {"id": "second"}, {"id": "first"}, {"id": "config"}],
+        "logger": {"level": "DEBUG", "baud_rate": 0},
+        "api": None,
+        "ota": {},
+    }
+    # Keys of lower packages come first
+    assert list(actual) == ["sensor", "api", "ota", "wifi", "logger", "esphome"]
+    assert list(actual["wifi"]) == ["ssid", "domain", "password", "ap"]
+
+
+@pytest.mark.parametrize("count", (1, 2, 3, 10))
+def test_packages__same_as_fold(count):
+    def config():
+        result = _config()
+        for i in range(3, count):
+            result["packages"][f"package_{i}"] = {
+                "wifi": {"ssid": f"package_{i}", "manual_ip": {"static_ip": f"10.0.0.{i}"}},
+                "sensor": [{"id": f"package_{i}"}],
+                "packages": {"nested": {"sensor": [{"id": f"nested_{i}"}]}},
+            }
+        while len(result["packages"]) > count:
+            result["packages"].popitem()
+        return result
+
+    actual = do_packages_pass(config())
+    expected = _fold(config())
+
+    assert actual == expected
+    assert list(actual) == list(expected)
+    assert list(actual["wifi"]) == list(expected["wifi"])
+
+
+def test_packages__shared_and_unmodified():
+    """
+    Values only set in one package are shared, and merging does not modify the packages
+    """
+    config = _config()
+    ap_config = config["packages"]["first"]["wifi"]["ap"]
+    first = config["packages"]["first"]
+    first_wifi = dict(first["wifi"])
+
+    actual = do_packages_pass(config)
+
+    assert actual["wifi"]["ap"] is ap_config
+    assert first["wifi"] == first_wifi
+    assert "packages" in config
+
+
+def test_packages__dict_type():
+    """
+    The merged dict has the type of the dict in the lowest package
+    """
+    config = {
+        "packages": {"first": {"wifi": {"ssid": "first"}}, "second": OrderedDict(wifi={})},
+        "wifi": {"password": "config"},
+    }
+
+    actual = do_packages_pass(config)
+
+    assert isinstance(actual, OrderedDict)
+    assert actual["wifi"] == {"ssid": "first", "password": "config"}
+
+
+def test_packages__invalid():
+    with pytest.raises(cv.Invalid) as err:
+        do_packages_pass({"packages": ["wifi"]})
+
+    assert err.value.path == ["packages"]
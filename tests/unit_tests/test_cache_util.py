@@ -0,0 +1,57 @@
+import pytest
+
+from esphome import cache_util, yaml_util
+import esphome.codegen as cg
+from esphome.core import ID, DocumentLocation, DocumentRange, Lambda
+
+
+def _data(value, line):
+    value = yaml_util.make_data_base(value)
+    value._esp_range = DocumentRange(  # pylint: disable=protected-access
+        DocumentLocation("test.yaml", line, 2), DocumentLocation("test.yaml", line, 8))
+    return value
+
+
+def test_fingerprint__shared_values():
+    name = "".join(["sen", "sor"])
+    type_ = cg.esphome_ns.class_("CacheUtilTestComponent", cg.Component)
+    id_ = ID("my_id", is_declaration=True, type=type_)
+    shared = {"name": name, "other": name, "id": id_, "ref": id_}
+    copied = {"name": "sensor", "other": "".join(["sens", "or"]),
+              "id": ID("my_id", is_declaration=True, type=type_),
+              "ref": ID("my_id", is_declaration=True, type=type_)}
+
+    assert cache_util.fingerprint(shared) == cache_util.fingerprint(copied)
+
+
+def test_fingerprint__ranges_ignored():
+    assert cache_util.fingerprint({"name": _data("sensor", 3)}) == \
+        cache_util.fingerprint({"name": _data("sensor", 7)})
+
+
+def test_fingerprint__lambda_parts():
+    lambda_ = Lambda("return id(my_sensor).state;")
+    fingerprint = cache_util.fingerprint(lambda_)
+    assert lambda_.requires_ids
+
+    assert cache_util.fingerprint(lambda_) == fingerprint
+
+
+@pytest.mark.parametrize("value, other", (
+    ("1", 1),
+    (1, 1.0),
+    (1, True),
+    ("sensor", _data("sensor", 3)),
+    ([1], (1,)),
+    # The slots of MockObj
+    (cg.MockObj("a"), cg.MockObj("b")),
+    (cg.MockObj("a"), cg.MockObj("a", "->")),
+    (ID("a"), ID("a", is_declaration=True)),
+))
+def test_fingerprint__different(value, other):
+    assert cache_util.fingerprint(value) != cache_util.fingerprint(other)
+
+
+def test_fingerprint__uncacheable():
+    with pytest.raises(cache_util.Uncacheable):
+        cache_util.fingerprint({"value": lambda: None})
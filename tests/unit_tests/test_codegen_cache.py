@@ -0,0 +1,130 @@
+import logging
+import marshal
+
+import pytest
+
+from esphome import __main__ as esphome_main
+from esphome import config
+from esphome.core import CORE
+
+
+def _config(offset=1.0):
+    return f"""
+esphome:
+  name: test
+  platform: ESP32
+  board: nodemcu-32s
+
+globals:
+  - id: counter
+    type: int
+    initial_value: "0"
+
+sensor:
+  - platform: template
+    id: sensor_0
+    name: Sensor 0
+    lambda: return id(counter);
+    filters:
+      - offset: {offset}
+    on_value:
+      - globals.set:
+          id: counter
+          value: "1"
+  - platform: template
+    id: sensor_1
+    name: Sensor 1
+    lambda: return id(sensor_0).state;
+"""
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    path = tmp_path / "test.yaml"
+    path.write_text(_config())
+    yield path
+    CORE.codegen_cache = False
+    CORE.reset()
+
+
+def _generate(path, caplog, use_cache=True):
+    """Generate the code of the config, return it and the log messages of the cache."""
+    CORE.reset()
+    CORE.config_path = str(path)
+    CORE.config = config.read_config({})
+    CORE.codegen_cache = use_cache
+    caplog.clear()
+    with caplog.at_level(logging.DEBUG, logger="esphome.__main__"):
+        esphome_main.generate_cpp_contents(CORE.config)
+    code = (
+        CORE.cpp_global_section,
+        CORE.cpp_main_section,
+        sorted(define.as_macro for define in CORE.defines),
+        sorted(CORE.build_flags),
+        [library.as_lib_dep for library in CORE.libraries],
+    )
+    messages = [r.getMessage() for r in caplog.records
+                if "Codegen cache" in r.getMessage() or "again" in r.getMessage()]
+    return code, messages
+
+
+def test_codegen_cache__replayed(config_path, caplog):
+    expected, _ = _generate(config_path, caplog, use_cache=False)
+
+    cold, cold_messages = _generate(config_path, caplog)
+    warm, warm_messages = _generate(config_path, caplog)
+
+    assert cold == expected
+    assert warm == expected
+    assert cold_messages == ["Codegen cache: 0 hits, 5 misses"]
+    assert warm_messages == ["Codegen cache: 5 hits, 0 misses"]
+
+
+def test_codegen_cache__changed_component(config_path, caplog):
+    _generate(config_path, caplog)
+    config_path.write_text(_config(offset=2.0))
+
+    expected, _ = _generate(config_path, caplog, use_cache=False)
+    actual, messages = _generate(config_path, caplog)
+
+    assert actual == expected
+    # sensor.template of sensor_0, and sensor with the configs of all sensors
+    assert messages == ["Codegen cache: 3 hits, 2 misses"]
+
+
+def test_codegen_cache__mismatch(config_path, caplog):
+    expected, _ = _generate(config_path, caplog, use_cache=False)
+    _generate(config_path, caplog)
+    # Pretend that the variables looked up by the cached components changed
+    for entry_path in (config_path.parent / ".esphome" / "codegen_cache").iterdir():
+        entry = marshal.loads(entry_path.read_bytes())
+        entry["events"] = [
+            event[:3] + (("MockObj", "changed", "->"),) if event[0] == "get_variable" else event
+            for event in entry["events"]
+        ]
+        entry_path.write_bytes(marshal.dumps(entry))
+
+    actual, messages = _generate(config_path, caplog)
+
+    assert actual == expected
+    assert messages[0].endswith("generating the code of all components again.")
+    assert messages[1] == "Codegen cache: 0 hits, 5 misses"
+    # The entries were recorded again
+    _, messages = _generate(config_path, caplog)
+    assert messages == ["Codegen cache: 5 hits, 0 misses"]
+
+
+def test_codegen_cache__config_comments(config_path, caplog):
+    expected, _ = _generate(config_path, caplog, use_cache=False)
+    CORE.config_comments = False
+    try:
+        without_comments, _ = _generate(config_path, caplog)
+    finally:
+        CORE.config_comments = True
+
+    actual, messages = _generate(config_path, caplog)
+
+    assert "//   name: test" in expected[1]
+    assert "//   name: test" not in without_comments[1]
+    assert actual == expected
+    assert messages == ["Codegen cache: 0 hits, 5 misses"]
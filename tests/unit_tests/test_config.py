@@ -0,0 +1,213 @@
+import pytest
+
+from esphome import config, yaml_util
+from esphome.core import EsphomeError
+
+
+@pytest.fixture(params=(False, True), ids=("default", "compact"))
+def loaded_config(request, fixture_path):
+    path = str(fixture_path / "yaml_util" / "tags.yaml")
+    result = config.Config()
+    result.update(yaml_util.load_yaml(path, compact_locations=request.param))
+    return result
+
+
+def test_config__get_document_range_for_path(loaded_config):
+    actual = loaded_config.get_document_range_for_path(["merged", "name"])
+
+    # Merged from the anchor
+    assert (actual.start_mark.line, actual.start_mark.column) == (1, 8)
+    assert loaded_config.get_document_range_for_path(["merged", "missing"]) is None
+    assert loaded_config.get_document_range_for_path([]) is None
+
+
+def test_config__get_deepest_document_range_for_path(loaded_config):
+    actual = loaded_config.get_deepest_document_range_for_path(["list", 2, "invalid"])
+
+    assert (actual.start_mark.line, actual.start_mark.column) == (17, 4)
+    included = loaded_config.get_deepest_document_range_for_path(["included", "nested", 0])
+    assert included.start_mark.document.endswith("included.yaml")
+
+
+def test_line_info(loaded_config):
+    actual = config.line_info(loaded_config, ["list", 1])
+
+    assert "tags.yaml:17]" in actual
+    assert config.line_info(loaded_config, ["list", 1], highlight=False) is None
+    assert config.line_info(loaded_config, ["missing"]) is None
+
+
+def test_do_id_pass__scale(monkeypatch):
+    from esphome.core import CORE, ID
+    from esphome.cpp_generator import MockObjClass
+    from esphome.cpp_types import Component
+
+    monkeypatch.setattr(CORE, "component_ids", set())
+    sensor = MockObjClass("test::Sensor", parents=[Component])
+    templated = MockObjClass("test::TemplateSensor", parents=[sensor])
+    count = 5000
+    result = config.Config()
+    result["sensor"] = [{"id": ID(f"sensor_{i}", is_declaration=True, type=templated)}
+                        for i in range(count)]
+    # Default IDs of the same type are the worst case for making names unique
+    result["defaults"] = [{"id": ID(None, is_declaration=True, type=templated)}
+                          for _ in range(count)]
+    result["uses"] = [{"by_name": ID(f"sensor_{i}", type=sensor),
+                       "by_type": ID(None, type=sensor)} for i in range(count)]
+
+    config.do_id_pass(result)
+
+    assert not result.errors
+    assert result["defaults"][0]["id"].id == "test_templatesensor"
+    assert result["defaults"][-1]["id"].id == f"test_templatesensor_{count}"
+    assert all(use["by_type"].id == "sensor_0" for use in result["uses"])
+    assert len(CORE.component_ids) == 2 * count
+
+
+def test_do_id_pass__errors(monkeypatch):
+    from esphome.core import CORE, ID
+    from esphome.cpp_generator import MockObjClass
+    from esphome.cpp_types import Component
+
+    monkeypatch.setattr(CORE, "component_ids", set())
+    sensor = MockObjClass("test::Sensor", parents=[Component])
+    other = MockObjClass("test::Other", parents=[])
+    result = config.Config()
+    result["a"] = {"id": ID("my_sensor", is_declaration=True, type=sensor)}
+    result["b"] = {"id": ID("my_sensor", is_declaration=True, type=sensor)}
+    result["c"] = {"use": ID("my_sensr", type=sensor),
+                   "wrong_type": ID("my_sensor", type=other),
+                   "by_type": ID(None, type=other)}
+
+    config.do_id_pass(result)
+
+    messages = [str(err) for err in result.errors]
+    assert messages[0].startswith("ID my_sensor redefined! Check a->id")
+    assert 'These IDs look similar: "my_sensor".' in messages[1]
+    assert "doesn't inherit from test::Other" in messages[2]
+    assert messages[3].startswith("Couldn't resolve ID for type 'test::Other'")
+
+
+def test_config__error_lookup():
+    result = config.Config()
+    result["sensor"] = [{"name": "a", "filters": [{"offset": 1}]}]
+    result.add_str_error("first", ["sensor", 0, "filters", 0, "offset"])
+    result.add_str_error("second", ["sensor", 0, "filters", 0, "offset"])
+    # Paths that don't exist in the config are attributed to their deepest existing parent
+    result.add_str_error("missing", ["sensor", 0, "unknown", "deeper"])
+
+    assert result.is_in_error_path([])
+    assert result.is_in_error_path(["sensor", 0, "filters"])
+    assert result.is_in_error_path(["sensor", 0, "unknown", "deeper"])
+    assert not result.is_in_error_path(["sensor", 0, "name"])
+    assert not result.is_in_error_path(["sensor", 1])
+    assert str(result.get_error_for_path(["sensor", 0, "filters", 0, "offset"])).startswith("first")
+    assert str(result.get_error_for_path(["sensor", 0])).startswith("missing")
+    assert result.get_error_for_path(["sensor", 0, "name"]) is None
+
+    result.add_str_error("name", ["sensor", 0, "name"])
+
+    assert result.is_in_error_path(["sensor", 0, "name"])
+    assert str(result.get_error_for_path(["sensor", 0, "name"])).startswith("name")
+
+
+def test_dump_dict__errors():
+    result = config.Config()
+    result["sensor"] = [{"name": "a", "offset": "bogus"}]
+    result.add_str_error("Expected a number", ["sensor", 0, "offset"])
+
+    actual, _ = config.dump_dict(result, ["sensor"])
+
+    assert "Expected a number" in actual
+    assert "name: " in actual
+
+
+@pytest.fixture
+def component_cache(monkeypatch, tmp_path):
+    from esphome.core import CORE
+
+    monkeypatch.setattr(config, "_COMPONENT_CACHE", {"esphome": config._COMPONENT_CACHE["esphome"]})
+    monkeypatch.setattr(config, "CUSTOM_COMPONENTS_PATH", None)
+    monkeypatch.setattr(CORE, "config_path", str(tmp_path / "test.yaml"))
+    yield
+    CORE.reset()
+
+
+def test_get_component__from_index(component_cache):
+    assert "adalight" in config.get_manifest_index()
+
+    actual = config.get_component("adalight")
+
+    assert isinstance(actual, config.IndexedComponentManifest)
+    assert actual.dependencies == ["uart"]
+    assert not actual.is_platform_component
+    assert config.get_platform("sensor", "adc").auto_load == ["voltage_sampler"]
+    assert actual.config_schema is not None
+    assert actual.module.__name__ == "esphome.components.adalight"
+
+
+def test_get_component__not_found(component_cache):
+    assert config.get_component("not_a_component") is None
+
+
+def test_get_component__import_error_from_index(component_cache, monkeypatch):
+    index = dict(config.get_manifest_index())
+    index["broken"] = {"config_schema": True}
+    monkeypatch.setattr(config, "_MANIFEST_INDEX", index)
+
+    # The module is only imported once it is needed, not by get_component
+    actual = config.get_component("broken")
+
+    assert isinstance(actual, config.IndexedComponentManifest)
+    with pytest.raises(EsphomeError, match="Unable to load component broken: No module named"):
+        _ = actual.config_schema
+
+
+def test_validate_config__did_you_mean(component_cache):
+    from esphome.core import CORE
+
+    raw = {
+        "esphome": {"name": "test", "platform": "ESP8266", "board": "nodemcuv2"},
+        "wifii": {},
+        "sensor": [{"platform": "adcc"}],
+    }
+    CORE.raw_config = raw
+
+    result = config.validate_config(raw, {})
+
+    messages = [config.humanize_error(result, err) for err in result.errors]
+    assert "Component not found: wifii. Did you mean 'wifi'?" in messages
+    assert "Platform not found: 'sensor.adcc'. Did you mean 'adc'?" in messages
+
+
+def test_validate_config__compact_locations(component_cache, tmp_path):
+    from esphome.core import CORE
+
+    path = tmp_path / "test.yaml"
+    path.write_text("esphome:\n  name: test\n  platform: ESP8266\n  board: nodemcuv2\n"
+                    "logger:\n"
+                    "sensor:\n"
+                    "  - platform: template\n"
+                    "    name: Template\n"
+                    "    lambda: return 1.0;\n"
+                    "    filters:\n"
+                    "      - offset: 1.0\n"
+                    "    on_value:\n"
+                    "      - logger.log: Value\n")
+    CORE.raw_config = raw = yaml_util.load_yaml(str(path), compact_locations=True)
+
+    result = config.validate_config(raw, {})
+
+    def start(path_):
+        doc_range = result.get_document_range_for_path(path_)
+        return doc_range and (doc_range.start_mark.line, doc_range.start_mark.column)
+
+    assert not result.errors
+    # The containers returned by the validators have the ranges of the loaded ones
+    assert start(["esphome", "board"]) == (3, 9)
+    assert start(["sensor", 0]) == (6, 4)
+    assert start(["sensor", 0, "filters", 0]) == (10, 8)
+    assert start(["sensor", 0, "filters", 0, "offset"]) == (10, 16)
+    assert start(["sensor", 0, "on_value", 0]) == (12, 8)
+    # The message of the shorthand action is moved into a new mapping, which has no range
+    assert start(["sensor", 0, "on_value", 0, "then", 0, "logger.log", "format"]) is None
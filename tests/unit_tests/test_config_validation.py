@@ -112,3 +112,32 @@ def hex_int__valid(value):
 
     assert isinstance(actual, HexInt)
     assert actual == value
+
+
+def test_schema_extend__nested():
+    base = config_validation.Schema({
+        config_validation.Optional("a", default=1): int,
+        config_validation.Optional("nested"): {config_validation.Required("x"): int},
+    })
+
+    actual = base.extend({
+        config_validation.Required("a"): str,
+        config_validation.Optional("nested"): {config_validation.Optional("y"): int},
+    })
+
+    assert actual({"a": "text", "nested": {"x": 1, "y": 2}}) == \
+        {"a": "text", "nested": {"x": 1, "y": 2}}
+    with pytest.raises(Invalid, match="required key not provided"):
+        actual({"a": "text", "nested": {"y": 2}})
+    assert base({}) == {"a": 1}
+
+
+def test_schema__compile_cache_mutated_schema():
+    nested = {config_validation.Optional("x"): int}
+    first = config_validation.Schema({config_validation.Optional("nested"): nested})
+    nested[config_validation.Optional("y")] = int
+    second = config_validation.Schema({config_validation.Optional("nested"): nested})
+
+    with pytest.raises(Invalid, match="extra keys not allowed"):
+        first({"nested": {"y": 1}})
+    assert second({"nested": {"y": 1}}) == {"nested": {"y": 1}}
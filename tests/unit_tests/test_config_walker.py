@@ -0,0 +1,86 @@
+import pytest
+
+from esphome import config, config_validation as cv
+from esphome.components import substitutions
+from esphome.config_walker import ConfigWalker
+from esphome.core import ID, Lambda
+from esphome.helpers import add_class_to_obj
+from esphome.yaml_util import ESPForceValue
+
+
+def test_walker__replace():
+    value = {"a": [1, "x"], "key_x": {"b": "x"}, "c": "y"}
+    walker = ConfigWalker()
+    walker.add_visitor(str, lambda w, v: v.replace("x", "z"))
+    walker.add_key_visitor(str, lambda w, k: k.replace("x", "z"))
+    # Visitors registered later see the replaced value
+    walker.add_visitor(str, lambda w, v: v.upper())
+
+    actual = walker.walk(value)
+
+    assert actual is value
+    assert value == {"a": [1, "Z"], "c": "Y", "key_z": {"b": "Z"}}
+    # Renamed keys are moved to the end
+    assert list(value) == ["a", "c", "key_z"]
+
+
+def test_walker__paths_and_errors():
+    paths = []
+
+    def visit(walker, value):
+        paths.append((walker.path, walker.depth))
+        if value == "bad":
+            raise cv.Invalid("Bad value")
+        return value
+
+    walker = ConfigWalker()
+    walker.add_visitor(str, visit)
+
+    walker.walk({"a": ["ok", {"b": "bad"}], "c": "bad"})
+
+    assert paths == [(["a", 0], 2), (["a", 1, "b"], 3), (["c"], 1)]
+    assert [(str(err.msg), err.path) for err in walker.errors] == \
+        [("Bad value", ["a", 1, "b"]), ("Bad value", ["c"])]
+
+
+def test_do_substitution_pass(caplog):
+    raw = {
+        "substitutions": {"name": "device", "$name_2": "other"},
+        "esphome": {"name": "$name", "platform": "${name}_x"},
+        "sensor": [{"lambda": Lambda("return id(${name});"), "$name": "key"}],
+        "text": "$missing",
+    }
+
+    substitutions.do_substitution_pass(raw, {"extra": "cli"})
+
+    assert raw["esphome"] == {"name": "device", "platform": "device_x"}
+    assert raw["sensor"][0]["lambda"].value == "return id(device);"
+    assert raw["sensor"][0]["device"] == "key"
+    assert raw["substitutions"] == {"name": "device", "name_2": "other", "extra": "cli"}
+    assert raw["text"] == "$missing"
+    assert "text" in caplog.text
+
+
+def test_iter_ids():
+    declared = ID("a", is_declaration=True)
+    lam = Lambda("return id(b).state;")
+
+    actual = config.iter_ids({"sensor": [{"id": declared, "lambda": lam}]})
+
+    assert actual == [
+        (declared, ["sensor", 0, "id"]),
+        (lam.requires_ids[0], ["sensor", 0, "lambda"]),
+    ]
+
+
+@pytest.mark.parametrize("forced", (False, True))
+def test_check_replaceme(forced):
+    value = "REPLACEME"
+    if forced:
+        value = add_class_to_obj(value, ESPForceValue)
+    walker = ConfigWalker()
+    walker.add_visitor(str, config.check_replaceme)
+
+    walker.walk({"wifi": {"ssid": value}})
+
+    assert [err.path for err in walker.errors] == ([] if forced else [["wifi", "ssid"]])
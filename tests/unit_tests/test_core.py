@@ -495,3 +495,85 @@ class TestEsphomeCore:
 
         assert target.is_esp32 is False
         assert target.is_esp8266 is True
+
+
+class TestFlushTasks:
+    @pytest.fixture
+    def target(self):
+        core.CORE.reset()
+        yield core.CORE
+        core.CORE.reset()
+
+    def test_waiting_task_is_woken(self, target, caplog):
+        order = []
+        id_ = core.ID("late", is_declaration=True)
+
+        def waiting():
+            var = yield target.get_variable(id_)
+            order.append(("waiting", var))
+
+        @core.coroutine_with_priority(-10.0)
+        def register():
+            target.register_variable(id_, "var")
+            order.append(("register", None))
+            yield
+
+        @core.coroutine_with_priority(-5.0)
+        def other():
+            order.append(("other", None))
+            yield
+
+        target.add_job(waiting)
+        target.add_job(register)
+        target.add_job(other)
+        with caplog.at_level("DEBUG", logger="esphome.core"):
+            target.flush_tasks()
+
+        # The waiting task isn't polled while it waits, and continues once the ID exists
+        assert order == [("other", None), ("register", None), ("waiting", "var")]
+        assert "parked 1 tasks waiting for IDs" in caplog.text
+        assert target.waiting_tasks == {}
+
+    def test_dependency_cycle(self, target):
+        def generate(config):
+            yield target.get_variable(config["requires"])
+            target.register_variable(config["id"], config["id"].id)
+
+        a, b = core.ID("a", is_declaration=True), core.ID("b", is_declaration=True)
+        target.add_job(generate, {"id": a, "requires": core.ID("b")})
+        target.add_job(generate, {"id": b, "requires": core.ID("a")})
+
+        cycle = "'a' requires 'b', 'b' requires 'a'|'b' requires 'a', 'a' requires 'b'"
+        with pytest.raises(core.EsphomeError, match=cycle):
+            target.flush_tasks()
+
+    def test_never_registered(self, target):
+        def generate():
+            yield target.get_variable(core.ID("missing"))
+
+        target.add_job(generate)
+
+        with pytest.raises(core.EsphomeError, match="never registered: 'missing'"):
+            target.flush_tasks()
+
+    def test_get_variable_with_full_id(self, target):
+        declared = core.ID("var", is_declaration=True, type="Type")
+        result = []
+
+        def lookup():
+            full_id, var = yield target.get_variable_with_full_id(core.ID("var"))
+            result.append((full_id, var))
+
+        def register():
+            target.register_variable(declared, "obj")
+            yield
+
+        target.add_job(lookup)
+        target.add_job(register)
+        target.flush_tasks()
+
+        assert result == [(declared, "obj")]
+        assert result[0][0].type == "Type"
+        assert target.variable_stats == {
+            "registered": 1, "lookups": 0, "full_id_lookups": 1, "waits": 1,
+        }
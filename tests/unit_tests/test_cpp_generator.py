@@ -136,6 +136,39 @@ class TestArrayInitializer:
         assert actual == "{\n  1,\n  2,\n  3,\n  4,\n}"
 
 
+class TestByteArrayInitializer:
+    def test_str__empty(self):
+        target = cg.ByteArrayInitializer(b"")
+
+        actual = str(target)
+
+        assert actual == "{}"
+
+    @pytest.mark.parametrize("data", (
+        bytes(range(20)), bytearray(range(20)), memoryview(bytes(range(20))),
+    ))
+    def test_str__wrapped(self, data):
+        target = cg.ByteArrayInitializer(data)
+
+        actual = str(target)
+
+        assert actual == (
+            "{\n"
+            "  0x00, 0x01, 0x02, 0x03, 0x04, 0x05, 0x06, 0x07, "
+            "0x08, 0x09, 0x0A, 0x0B, 0x0C, 0x0D, 0x0E, 0x0F,\n"
+            "  0x10, 0x11, 0x12, 0x13,\n"
+            "}"
+        )
+
+    def test_str__same_values_as_array_initializer(self):
+        data = bytes(range(256))
+
+        actual = str(cg.ByteArrayInitializer(data)).replace("\n", "").replace(" ", "")
+
+        expected = str(cg.ArrayInitializer(*[cg.HexInt(x) for x in data])).replace(" ", "")
+        assert actual == expected[:-1] + ",}"
+
+
 class TestParameterListExpression:
     def test_str(self):
         target = cg.ParameterListExpression(
@@ -230,6 +263,8 @@ FAKE_ENUM_VALUE.enum_value = "foo"
         (cg.TimePeriodMinutes(minutes=42), cg.IntLiteral),
         ((1, 2, 3), cg.ArrayInitializer),
         ([1, 2, 3], cg.ArrayInitializer),
+        (b"\x01\x02", cg.ByteArrayInitializer),
+        (bytearray(2), cg.ByteArrayInitializer),
 ))
 def test_safe_exp__allowed_values(obj, expected_type):
     actual = cg.safe_exp(obj)
@@ -279,9 +314,22 @@ class TestStatements:
         assert actual == expected
 
 
-# TODO: This method has side effects in CORE
-# def test_progmem_array():
-#     pass
+@pytest.mark.parametrize("rhs, expected_type", (
+        (b"\x01\x02", cg.ByteArrayInitializer),
+        ([cg.HexInt(1), cg.HexInt(2)], cg.ByteArrayInitializer),
+        ([cg.HexInt(1), cg.HexInt(0x100)], cg.ArrayInitializer),
+        ([1, 2], cg.ArrayInitializer),
+))
+def test_progmem_array(rhs, expected_type):
+    cg.CORE.reset()
+    try:
+        cg.progmem_array(cg.ID("foo", type=ct.uint8), rhs)
+
+        assignment = cg.CORE.main_statements[-1].expression
+        assert isinstance(assignment.rhs, expected_type)
+        assert cg.CORE.has_id(cg.ID("foo"))
+    finally:
+        cg.CORE.reset()
 
 
 class TestMockObj:
@@ -0,0 +1,143 @@
+import os
+import struct
+
+import pytest
+
+from esphome import elf_symbols
+from esphome.core import EsphomeError
+from esphome.elf_symbols import Symbol, SymbolIndex
+
+STT_OBJECT = 1
+STT_FUNC = 2
+TEXT = 0x400d0000
+
+# name, value, size, type, section index (1 is .text, 0 undefined, 0xfff1 SHN_ABS)
+SYMBOLS = [
+    ("app_main", TEXT + 0x40, 0x20, STT_FUNC, 1),
+    ("setup", TEXT, 0x40, STT_FUNC, 1),
+    ("_ZN7esphome4loopEv", TEXT + 0x80, 0x10, STT_FUNC, 1),
+    ("asm_label", TEXT + 0x90, 0, STT_FUNC, 1),
+    ("global_var", 0x3ffb0000, 4, STT_OBJECT, 1),
+    ("printf", 0, 0, STT_FUNC, 0),
+    ("abs_func", 0x40000000, 4, STT_FUNC, 0xfff1),
+]
+
+
+def _elf(is_64=False, big_endian=False):
+    """Return an ELF file with a .text section and the symbols of SYMBOLS."""
+    endian = ">" if big_endian else "<"
+    word = "Q" if is_64 else "I"
+    header_size = 64 if is_64 else 52
+    strtab = b"\0" + b"".join(name.encode() + b"\0" for name, *_ in SYMBOLS)
+    symtab = b"\0" * (24 if is_64 else 16)
+    name_offset = 1
+    for name, value, size, type_, shndx in SYMBOLS:
+        if is_64:
+            symtab += struct.pack(endian + "IBBHQQ", name_offset, 0x10 | type_, 0, shndx, value,
+                                  size)
+        else:
+            symtab += struct.pack(endian + "IIIBBH", name_offset, value, size, 0x10 | type_, 0,
+                                  shndx)
+        name_offset += len(name) + 1
+    shstrtab = b"\0.text\0.symtab\0.strtab\0.shstrtab\0"
+    text = b"\0" * 0xa0
+    # name offset, type, link, entsize and contents of the sections after the null section
+    sections = [(1, 1, 0, 0, text), (7, 2, 3, len(symtab) // (len(SYMBOLS) + 1), symtab),
+                (15, 3, 0, 0, strtab), (23, 3, 0, 0, shstrtab)]
+
+    data = b""
+    headers = struct.pack(endian + "II" + word * 4 + "II" + word * 2, *[0] * 10)
+    for name, type_, link, entsize, contents in sections:
+        offset = header_size + len(data)
+        address = TEXT if contents is text else 0
+        headers += struct.pack(endian + "II" + word * 4 + "II" + word * 2, name, type_, 0,
+                               address, offset, len(contents), link, 0, 1, entsize)
+        data += contents
+    shoff = header_size + len(data)
+    ident = b"\x7fELF" + bytes([2 if is_64 else 1, 2 if big_endian else 1, 1]) + b"\0" * 9
+    header = ident + struct.pack(endian + "HHI" + word * 3 + "IHHHHHH", 2, 94, 1, 0, 0, shoff,
+                                 0, header_size, 0, 0, len(headers) // (len(sections) + 1),
+                                 len(sections) + 1, 4)
+    return header + data + headers
+
+
+@pytest.fixture
+def elf(tmp_path, monkeypatch):
+    monkeypatch.setattr(elf_symbols, "_INDEXES", {})
+    monkeypatch.setattr(elf_symbols, "_HASHES", {})
+    path = tmp_path / "firmware.elf"
+    path.write_bytes(_elf())
+    return path
+
+
+@pytest.mark.parametrize("is_64, big_endian", ((False, False), (False, True), (True, False),
+                                               (True, True)))
+def test_symbol_index__functions(tmp_path, is_64, big_endian):
+    path = tmp_path / "firmware.elf"
+    path.write_bytes(_elf(is_64, big_endian))
+
+    index = SymbolIndex.from_file(str(path))
+
+    assert index.symbols == [
+        Symbol(0x40000000, 4, "abs_func", None),
+        Symbol(TEXT, 0x40, "setup", ".text"),
+        Symbol(TEXT + 0x40, 0x20, "app_main", ".text"),
+        Symbol(TEXT + 0x80, 0x10, "_ZN7esphome4loopEv", ".text"),
+        Symbol(TEXT + 0x90, 0, "asm_label", ".text"),
+    ]
+
+
+def test_symbol_index__all_symbols(elf):
+    index = SymbolIndex.from_file(str(elf), functions_only=False)
+
+    assert [symbol.name for symbol in index.symbols] == [
+        "global_var", "abs_func", "setup", "app_main", "_ZN7esphome4loopEv", "asm_label"]
+
+
+@pytest.mark.parametrize("address, expected", (
+    (TEXT, "setup+0x0"),
+    (TEXT + 0x3f, "setup+0x3f"),
+    (TEXT + 0x41, "app_main+0x1"),
+    # Between app_main and loop
+    (TEXT + 0x60, None),
+    (TEXT + 0x8f, "_ZN7esphome4loopEv+0xf"),
+    # Sizeless symbols extend to the next one
+    (TEXT + 0x1000, "asm_label+0xf70"),
+    (TEXT - 1, None),
+    (0x3f000000, None),
+))
+def test_symbol_index__resolve(elf, address, expected):
+    index = SymbolIndex.from_file(str(elf))
+
+    assert index.resolve(address) == expected
+
+
+def test_symbol_index__not_elf(tmp_path):
+    path = tmp_path / "firmware.bin"
+    path.write_bytes(b"\xe9" + b"\0" * 100)
+
+    with pytest.raises(EsphomeError, match="not a valid ELF file"):
+        SymbolIndex.from_file(str(path))
+    with pytest.raises(EsphomeError, match="Error reading ELF file"):
+        SymbolIndex.from_file(str(tmp_path / "missing.elf"))
+
+
+def test_symbol_index__memoised_by_hash(elf, tmp_path, monkeypatch):
+    copy = tmp_path / "copy.elf"
+    copy.write_bytes(elf.read_bytes())
+    reads = []
+    from_file = SymbolIndex.from_file
+    monkeypatch.setattr(SymbolIndex, "from_file",
+                        lambda path: reads.append(path) or from_file(path))
+
+    index = elf_symbols.symbol_index(str(elf))
+    # The same file, and another file with the same contents
+    assert elf_symbols.symbol_index(str(elf)) is index
+    assert elf_symbols.symbol_index(str(copy)) is index
+    elf.write_bytes(_elf(is_64=True))
+    os.utime(elf, ns=(0, 0))
+    new_index = elf_symbols.symbol_index(str(elf))
+
+    assert new_index is not index
+    assert new_index.symbols == index.symbols
+    assert reads == [str(elf), str(elf)]
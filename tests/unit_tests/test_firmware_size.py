@@ -0,0 +1,222 @@
+import argparse
+import json
+
+import pytest
+
+from esphome import __main__ as esphome_main
+from esphome import elf_symbols, firmware_size
+from esphome.core import CORE, EsphomeError
+from esphome.elf_symbols import Section, Symbol, SymbolIndex
+
+MAP = """\
+Archive member included to satisfy reference by file (symbol)
+
+Discarded input sections
+
+ .text._ZN7esphome3foo3barEv
+                0x00000000       0x10 src/esphome/components/foo/foo.cpp.o
+
+Memory Configuration
+
+Name             Origin             Length             Attributes
+iram0_0_seg      0x40080000         0x00020000         xr
+
+Linker script and memory map
+
+LOAD .pioenvs/test/src/main.cpp.o
+
+.iram0.text     0x40080000       0x40
+ *(.iram1 .iram1.*)
+ .iram1.5       0x40080000       0x30 .pioenvs/test/src/esphome/components/wifi/wifi.cpp.o
+                0x40080000                esphome::wifi::isr()
+ *fill*         0x40080030       0x10
+
+.dram0.data     0x3ffb0000       0x20 load address 0x3f400020
+ .data._ZN7esphome6sensor5tableE
+                0x3ffb0000       0x10 .pioenvs/test/src/esphome/components/sensor/sensor.cpp.o
+ .data          0x3ffb0010       0x10 /home/.platformio/lib/libc.a(lib_a-impure.o)
+
+.dram0.bss      0x3ffb0020      0x104
+ .bss._ZN7esphome3AppE
+                0x3ffb0020      0x100 .pioenvs/test/src/esphome/core/application.cpp.o
+ COMMON         0x3ffb0120        0x4 .pioenvs/test/src/main.cpp.o
+
+.flash.text     0x400d0000       0x60
+ .text.setup    0x400d0000       0x20 .pioenvs/test/src/main.cpp.o
+ .text._ZN7esphome4wifi13WiFiComponent5setupEv
+                0x400d0020       0x30 C:\\build\\src\\esphome\\components\\wifi\\wifi.cpp.o
+ .text.empty    0x400d0050        0x0 .pioenvs/test/src/main.cpp.o
+
+.debug_info     0x00000000      0x200
+ .debug_info    0x00000000      0x200 .pioenvs/test/src/main.cpp.o
+"""
+
+SECTIONS = [
+    Section("", 0, 0, 0, 0),
+    Section(".iram0.text", 1, 6, 0x40080000, 0x40),
+    Section(".dram0.data", 1, 3, 0x3ffb0000, 0x20),
+    Section(".dram0.bss", 8, 3, 0x3ffb0020, 0x104),
+    Section(".flash.text", 1, 6, 0x400d0000, 0x60),
+    Section(".debug_info", 1, 0, 0, 0x200),
+]
+
+
+@pytest.fixture
+def firmware(tmp_path, monkeypatch):
+    """The ELF and linker map of a firmware with the sections of SECTIONS."""
+    elf = tmp_path / "firmware.elf"
+    elf.write_bytes(b"\x7fELF")
+    map_path = tmp_path / "firmware.map"
+    map_path.write_text(MAP)
+    monkeypatch.setattr(elf_symbols, "read_sections", lambda path: SECTIONS)
+    return str(elf), str(map_path)
+
+
+def test_parse_map(firmware):
+    _, map_path = firmware
+
+    assert firmware_size.parse_map(map_path) == [
+        (".iram0.text", 0x30, ".pioenvs/test/src/esphome/components/wifi/wifi.cpp.o"),
+        (".dram0.data", 0x10, ".pioenvs/test/src/esphome/components/sensor/sensor.cpp.o"),
+        (".dram0.data", 0x10, "/home/.platformio/lib/libc.a(lib_a-impure.o)"),
+        (".dram0.bss", 0x100, ".pioenvs/test/src/esphome/core/application.cpp.o"),
+        (".dram0.bss", 0x4, ".pioenvs/test/src/main.cpp.o"),
+        (".flash.text", 0x20, ".pioenvs/test/src/main.cpp.o"),
+        (".flash.text", 0x30, "C:\\build\\src\\esphome\\components\\wifi\\wifi.cpp.o"),
+        (".debug_info", 0x200, ".pioenvs/test/src/main.cpp.o"),
+    ]
+
+
+@pytest.mark.parametrize("name, expected", (
+    ("_ZN7esphome6sensor6Sensor13publish_stateEf", "sensor"),
+    ("_ZNK7esphome6sensor6Sensor9get_stateEv", "sensor"),
+    ("_ZTVN7esphome4wifi13WiFiComponentE", "wifi"),
+    ("_ZZN7esphome4wifi5setupEvE5count", "wifi"),
+    ("_ZN7esphome9template_14TemplateSensor6updateEv", "template"),
+    ("_ZN7esphome11Application5setupEv", "[core]"),
+    ("_ZN7esphome3gpio6updateEv", "[core]"),
+    ("app_main", "[other]"),
+))
+def test_symbol_component(name, expected):
+    assert firmware_size.symbol_component(name, {"sensor", "wifi", "template"}) == expected
+
+
+def test_size_report__map(firmware):
+    elf, map_path = firmware
+
+    report = firmware_size.size_report(elf, map_path)
+
+    assert report == {
+        "version": firmware_size.SIZE_REPORT_VERSION,
+        "regions": {"flash": 0x60, "iram": 0x40, "dram": 0x20, "bss": 0x104},
+        "components": {
+            "[core]": {"flash": 0, "iram": 0, "dram": 0, "bss": 0x100},
+            "[main]": {"flash": 0x20, "iram": 0, "dram": 0, "bss": 0x4},
+            "[other]": {"flash": 0, "iram": 0, "dram": 0x10, "bss": 0},
+            # Fill of .iram0.text and the end of .flash.text
+            "[unattributed]": {"flash": 0x10, "iram": 0x10, "dram": 0, "bss": 0},
+            "sensor": {"flash": 0, "iram": 0, "dram": 0x10, "bss": 0},
+            "wifi": {"flash": 0x30, "iram": 0x30, "dram": 0, "bss": 0},
+        },
+    }
+
+
+def test_size_report__symbols_without_map(firmware, monkeypatch, caplog):
+    elf, _ = firmware
+    symbols = [
+        Symbol(0x40080000, 0x30, "_ZN7esphome4wifi3isrEv", ".iram0.text"),
+        # Alias of the function above
+        Symbol(0x40080000, 0x30, "wifi_isr", ".iram0.text"),
+        Symbol(0x3ffb0020, 0x100, "_ZN7esphome3AppE", ".dram0.bss"),
+        Symbol(0x400d0000, 0x20, "setup", ".flash.text"),
+        Symbol(0x400d0020, 0, "label", ".flash.text"),
+    ]
+    monkeypatch.setattr(SymbolIndex, "from_file",
+                        lambda path, functions_only: SymbolIndex(symbols))
+
+    report = firmware_size.size_report(elf, None, {"wifi"})
+
+    assert "No linker map" in caplog.text
+    assert report["components"] == {
+        "[core]": {"flash": 0, "iram": 0, "dram": 0, "bss": 0x100},
+        "[other]": {"flash": 0x20, "iram": 0, "dram": 0, "bss": 0},
+        "[unattributed]": {"flash": 0x40, "iram": 0x10, "dram": 0x20, "bss": 0x4},
+        "wifi": {"flash": 0, "iram": 0x30, "dram": 0, "bss": 0},
+    }
+
+
+def test_size_report__not_compiled(tmp_path):
+    with pytest.raises(EsphomeError, match="please compile it first"):
+        firmware_size.size_report(str(tmp_path / "firmware.elf"))
+
+
+def test_diff_reports(firmware):
+    elf, map_path = firmware
+    old = firmware_size.size_report(elf, map_path)
+    new = json.loads(json.dumps(old))
+    new["regions"]["iram"] += 0x20
+    new["components"]["wifi"]["iram"] += 0x20
+    del new["components"]["sensor"]
+    new["components"]["api"] = {"flash": 0x10, "iram": 0, "dram": 0, "bss": 0}
+
+    diff = firmware_size.diff_reports(old, new)
+
+    assert diff == {
+        "regions": {"flash": 0, "iram": 0x20, "dram": 0, "bss": 0},
+        "components": {
+            "api": {"flash": 0x10, "iram": 0, "dram": 0, "bss": 0},
+            "sensor": {"flash": 0, "iram": 0, "dram": -0x10, "bss": 0},
+            "wifi": {"flash": 0, "iram": 0x20, "dram": 0, "bss": 0},
+        },
+    }
+    assert firmware_size.format_diff(diff).splitlines() == [
+        "Component       FLASH      IRAM      DRAM       BSS",
+        "wifi               +0       +32        +0        +0",
+        "api               +16        +0        +0        +0",
+        "sensor             +0        +0       -16        +0",
+        "Total              +0       +32        +0        +0",
+    ]
+
+
+@pytest.fixture
+def size_args(firmware, tmp_path, monkeypatch):
+    """Run esphome size on the firmware, return its exit code and output."""
+    elf, map_path = firmware
+    monkeypatch.setattr(CORE.__class__, "firmware_elf", elf)
+    monkeypatch.setattr(CORE.__class__, "firmware_map", map_path)
+    output = []
+    monkeypatch.setattr(esphome_main, "safe_print", output.append)
+
+    def run(**kwargs):
+        output.clear()
+        args = argparse.Namespace(**{"json": None, "diff": None, "max_increase": None,
+                                     **kwargs})
+        return esphome_main.command_size(args, {}), "\n".join(output)
+
+    return run
+
+
+def test_command_size__max_increase(size_args, tmp_path, caplog):
+    report_path = tmp_path / "report.json"
+    rc, output = size_args(json=str(report_path))
+    assert rc == 0
+    assert output.splitlines()[1].startswith("[core]")
+    report = json.loads(report_path.read_text())
+    report["regions"]["iram"] -= 0x20
+    report["components"]["wifi"]["iram"] -= 0x20
+    report_path.write_text(json.dumps(report))
+
+    assert size_args(diff=str(report_path), max_increase=0x20)[0] == 0
+    rc, output = size_args(diff=str(report_path), max_increase=0x1f)
+
+    assert rc == 1
+    assert output.splitlines()[1].split() == ["wifi", "+0", "+32", "+0", "+0"]
+    assert "The firmware grew by more than 31 bytes: iram +32" in caplog.text
+
+
+def test_command_size__max_increase_without_diff(size_args, caplog):
+    rc, output = size_args(max_increase=0)
+
+    assert rc == 1
+    assert output == ""
+    assert "--max-increase needs --diff" in caplog.text
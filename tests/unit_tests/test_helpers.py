@@ -154,6 +154,47 @@ class Test_write_file_if_changed:
         assert dst.read_text() == text
 
 
+class Test_write_chunks_if_changed:
+    def test_src_and_dst_match(self, tmp_path):
+        dst = tmp_path / "file-a.txt"
+        dst.write_text("A files are unique.\n")
+        inode = dst.stat().st_ino
+
+        actual = helpers.write_chunks_if_changed(dst, ["A files ", "are unique.\n"])
+
+        assert actual is False
+        assert dst.stat().st_ino == inode
+        assert [p.name for p in tmp_path.iterdir()] == ["file-a.txt"]
+
+    def test_src_and_dst_do_not_match(self, tmp_path):
+        dst = tmp_path / "file-a.txt"
+        dst.write_text("B files are unique.\n")
+
+        actual = helpers.write_chunks_if_changed(dst, ["A files ", "are unique.\n"])
+
+        assert actual is True
+        assert dst.read_text() == "A files are unique.\n"
+        assert [p.name for p in tmp_path.iterdir()] == ["file-a.txt"]
+
+    def test_dst_does_not_exist(self, tmp_path):
+        dst = tmp_path / "dir" / "file-a.txt"
+
+        actual = helpers.write_chunks_if_changed(dst, iter(["A files are unique.\n"]))
+
+        assert actual is True
+        assert dst.read_text() == "A files are unique.\n"
+
+    def test_known_digest(self, tmp_path, monkeypatch):
+        dst = tmp_path / "file-a.txt"
+        dst.write_text("A files are unique.\n")
+        digest = helpers.file_hash(dst)
+        monkeypatch.setattr(helpers, "file_hash", None)
+
+        actual = helpers.write_chunks_if_changed(dst, ["A files are unique.\n"], digest)
+
+        assert actual is False
+
+
 class Test_copy_file_if_changed:
     def test_src_and_dst_match(self, tmp_path, fixture_path):
         src = fixture_path / "helpers" / "file-a.txt"
@@ -0,0 +1,255 @@
+import json
+import logging
+import os
+import sys
+import time
+
+import pytest
+
+from esphome import elf_symbols, platformio_api
+from esphome.core import CORE
+from esphome.elf_symbols import Symbol, SymbolIndex
+
+IDEDATA = {
+    "prog_path": "/build/.pioenvs/test/firmware.elf",
+    "cc_path": "/toolchain/bin/xtensa-esp32-elf-gcc",
+}
+
+
+@pytest.fixture
+def build(tmp_path, monkeypatch):
+    """A built firmware, and the list of the IDE data runs of PlatformIO."""
+    CORE.config_path = str(tmp_path / "test.yaml")
+    CORE.build_path = str(tmp_path / "build")
+    CORE.name = "test"
+    os.makedirs(os.path.dirname(CORE.firmware_elf))
+    (tmp_path / "build" / "platformio.ini").write_text("[env:test]\n")
+    (tmp_path / "build" / ".pioenvs" / "test" / "firmware.elf").write_bytes(b"\x7fELF")
+    runs = []
+
+    def run_platformio_cli_run(config, verbose, *args, **kwargs):
+        runs.append(args)
+        if args:
+            return "Processing test\n" + json.dumps(IDEDATA) + "\n"
+        return 0
+
+    monkeypatch.setattr(platformio_api, "run_platformio_cli_run", run_platformio_cli_run)
+    monkeypatch.setattr(platformio_api, "_platformio_version", lambda: "5.0.1")
+    monkeypatch.setattr(platformio_api, "IDE_DATA", None)
+    yield tmp_path / "build", runs
+    CORE.reset()
+
+
+def test_get_idedata__cached(build):
+    _, runs = build
+
+    assert platformio_api.get_idedata({}).raw == IDEDATA
+    platformio_api.IDE_DATA = None
+    idedata = platformio_api.get_idedata({})
+
+    assert idedata.addr2line_path == "/toolchain/bin/xtensa-esp32-elf-addr2line"
+    assert runs == [("-t", "idedata")]
+
+
+@pytest.mark.parametrize("change", ("platformio_ini", "firmware", "platformio_version"))
+def test_get_idedata__invalidated(build, monkeypatch, change):
+    build_path, runs = build
+    platformio_api.get_idedata({})
+    platformio_api.IDE_DATA = None
+
+    if change == "platformio_ini":
+        (build_path / "platformio.ini").write_text("[env:test]\nboard = other\n")
+    elif change == "firmware":
+        os.utime(CORE.firmware_elf, ns=(0, 0))
+    else:
+        monkeypatch.setattr(platformio_api, "_platformio_version", lambda: "5.1.0")
+    platformio_api.get_idedata({})
+
+    assert len(runs) == 2
+
+
+def test_get_idedata__no_firmware(build):
+    os.remove(CORE.firmware_elf)
+
+    platformio_api.get_idedata({})
+
+    assert not os.path.exists(platformio_api.idedata_cache_path())
+
+
+def test_run_compile__prewarms_idedata(build):
+    _, runs = build
+
+    assert platformio_api.run_compile({}, False) == 0
+    platformio_api.IDE_DATA = None
+    platformio_api.get_idedata({})
+
+    assert runs == [(), ("-t", "idedata")]
+
+
+FAKE_ADDR2LINE = """\
+import sys
+
+with open(sys.argv[0] + ".log", "a") as log:
+    log.write("start\\n")
+    for line in sys.stdin:
+        log.write(line)
+        log.flush()
+        addr = int(line, 16)
+        # The sentinel and the ROM
+        if addr < 0x40080000:
+            print(f"0x{addr:08x}: ?? ??:0")
+        else:
+            print(f"0x{addr:08x}: func_{addr:x}() at main.cpp:{addr & 0xff}")
+            if addr % 2:
+                print(f" (inlined by) caller_{addr:x}() at main.cpp:1")
+        sys.stdout.flush()
+"""
+
+
+@pytest.fixture
+def addr2line(tmp_path, monkeypatch):
+    """An addr2line decoding addresses to made up functions, and its log of the addresses."""
+    path = tmp_path / "xtensa-esp32-elf-addr2line"
+    path.write_text(f"#!{sys.executable}\n" + FAKE_ADDR2LINE)
+    path.chmod(0o755)
+    elf = tmp_path / "firmware.elf"
+    elf.write_bytes(b"\x7fELF")
+    monkeypatch.setattr(platformio_api, "IDE_DATA", platformio_api.IDEData({
+        "prog_path": str(elf), "cc_path": str(tmp_path / "xtensa-esp32-elf-gcc")}))
+    monkeypatch.setattr(platformio_api, "_ADDR2LINE", None)
+    yield elf, tmp_path / "xtensa-esp32-elf-addr2line.log"
+    if platformio_api._ADDR2LINE is not None:
+        platformio_api._ADDR2LINE.close()
+
+
+def _decoded(caplog, line):
+    caplog.clear()
+    with caplog.at_level(logging.WARNING, logger="esphome.platformio_api"):
+        platformio_api.process_stacktrace({}, line, False)
+    return [r.getMessage() for r in caplog.records if r.getMessage().startswith("Decoded")]
+
+
+def test_process_stacktrace__backtrace_batched(addr2line, caplog):
+    _, log = addr2line
+
+    decoded = _decoded(caplog, "Backtrace: 0x400d1234:0x3ffb1f00 0x400d1235:0x3ffb1f20 "
+                               "0x400d1234:0x3ffb1f40")
+    decoded_again = _decoded(caplog, "Backtrace: 0x400d1236:0x3ffb1f00 0x400d1235:0x3ffb1f20")
+
+    assert decoded == [
+        "Decoded 0x400d1234: func_400d1234() at main.cpp:52",
+        "Decoded 0x400d1235: func_400d1235() at main.cpp:53\n"
+        " (inlined by) caller_400d1235() at main.cpp:1",
+        "Decoded 0x400d1234: func_400d1234() at main.cpp:52",
+    ]
+    assert decoded_again[0] == "Decoded 0x400d1236: func_400d1236() at main.cpp:54"
+    # One process, already decoded addresses aren't decoded again
+    assert log.read_text().split() == ["start", "400d1234", "400d1235", "0", "400d1236", "0"]
+
+
+def test_process_stacktrace__lru(addr2line, caplog, monkeypatch):
+    _, log = addr2line
+    monkeypatch.setattr(platformio_api, "ADDR2LINE_CACHE_SIZE", 2)
+
+    for addr in ("400d1234", "400d1236", "400d1234", "400d1238", "400d1236"):
+        _decoded(caplog, f"PC      : 0x{addr}  PS      : 0x00060930")
+
+    assert log.read_text().split() == ["start", "400d1234", "0", "400d1236", "0", "400d1238",
+                                       "0", "400d1236", "0"]
+
+
+def test_process_stacktrace__new_firmware(addr2line, caplog):
+    elf, log = addr2line
+    _decoded(caplog, "PC      : 0x400d1234  PS      : 0x00060930")
+
+    os.utime(elf, ns=(0, 0))
+    decoded = _decoded(caplog, "PC      : 0x400d1234  PS      : 0x00060930")
+
+    assert decoded == ["Decoded 0x400d1234: func_400d1234() at main.cpp:52"]
+    assert log.read_text().split() == ["start", "400d1234", "0", "start", "400d1234", "0"]
+
+
+@pytest.fixture
+def symbols(monkeypatch):
+    """The symbol index of the firmware ELF, and the list of the ELF files read."""
+    reads = []
+    index = SymbolIndex([Symbol(0x40007000, 0x20, "rom_func", None),
+                         Symbol(0x400d1200, 0x40, "_ZN7esphome4loopEv", ".flash.text"),
+                         Symbol(0x400d1300, 0x10, "app_main", ".flash.text")])
+    monkeypatch.setattr(elf_symbols, "symbol_index", lambda path: reads.append(path) or index)
+    monkeypatch.setattr(platformio_api, "_ADDR2LINE", None)
+    return reads
+
+
+def test_process_stacktrace__symbols_without_addr2line(addr2line, symbols, caplog, monkeypatch):
+    elf, _ = addr2line
+    # Only the IDE data of the ELF, the toolchain isn't installed
+    monkeypatch.setattr(platformio_api, "IDE_DATA", platformio_api.IDEData({
+        "prog_path": str(elf), "cc_path": "/missing/xtensa-esp32-elf-gcc"}))
+
+    decoded = _decoded(caplog, "Backtrace: 0x400d1234:0x3ffb1f00 0x400d1280:0x3ffb1f20 "
+                               "0x400d1304:0x3ffb1f40")
+
+    assert decoded == ["Decoded 0x400d1234: _ZN7esphome4loopEv+0x34",
+                       "Decoded 0x400d1304: app_main+0x4"]
+    assert symbols == [str(elf)] * 3
+    assert platformio_api._ADDR2LINE is None
+
+
+def test_process_stacktrace__rom_symbols(addr2line, symbols, caplog):
+    elf, _ = addr2line
+
+    decoded = _decoded(caplog, "Backtrace: 0x40007010:0x3ffb1f00 0x400d1234:0x3ffb1f20 "
+                               "0x40008000:0x3ffb1f40")
+
+    # addr2line can't place the absolute symbol of the ROM, the symbol index can
+    assert decoded == ["Decoded 0x40007010: rom_func+0x10",
+                       "Decoded 0x400d1234: func_400d1234() at main.cpp:52"]
+    assert symbols == [str(elf)] * 2
+    assert platformio_api._ADDR2LINE is not None
+
+
+def test_process_stacktrace__addr2line_timeout(addr2line, symbols, caplog, monkeypatch):
+    elf, _ = addr2line
+    # An addr2line that never answers
+    (elf.parent / "xtensa-esp32-elf-addr2line").write_text(
+        f"#!{sys.executable}\nimport sys, time\nsys.stdin.readline()\ntime.sleep(60)\n")
+    monkeypatch.setattr(platformio_api, "ADDR2LINE_TIMEOUT", 0.5)
+    start = time.monotonic()
+
+    decoded = _decoded(caplog, "Backtrace: 0x400d1234:0x3ffb1f00 0x400d1304:0x3ffb1f20")
+    decoded_again = _decoded(caplog, "PC      : 0x400d1234  PS      : 0x00060930")
+
+    assert decoded == ["Decoded 0x400d1234: _ZN7esphome4loopEv+0x34",
+                       "Decoded 0x400d1304: app_main+0x4"]
+    assert decoded_again == ["Decoded 0x400d1234: _ZN7esphome4loopEv+0x34"]
+    # The process is killed after the first timeout and not started again
+    assert time.monotonic() - start < 5
+    assert platformio_api._ADDR2LINE._process is None
+
+
+def test_addr2line__context_manager(addr2line):
+    elf, _ = addr2line
+    path = str(elf.parent / "xtensa-esp32-elf-addr2line")
+
+    with platformio_api.Addr2Line(path, str(elf)) as decoder:
+        decoded = decoder.decode(["400d1234"])
+        process = decoder._process
+
+    assert decoded == {"400d1234": "0x400d1234: func_400d1234() at main.cpp:52"}
+    assert process.returncode is not None
+    assert decoder._process is None
+
+
+def test_process_stacktrace__symbols_without_platformio(build, symbols, caplog, monkeypatch):
+    def run_platformio_cli_run(config, verbose, *args, **kwargs):
+        raise ImportError("No module named 'platformio'")
+
+    monkeypatch.setattr(platformio_api, "run_platformio_cli_run", run_platformio_cli_run)
+    monkeypatch.setattr(platformio_api, "_platformio_version", lambda: None)
+
+    decoded = _decoded(caplog, "PC      : 0x400d1304  PS      : 0x00060930")
+
+    # The ELF in the build directory
+    assert decoded == ["Decoded 0x400d1304: app_main+0x4"]
+    assert symbols == [CORE.firmware_elf]
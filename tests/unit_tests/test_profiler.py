@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+from esphome import profiler
+from esphome.core import CORE
+
+
+@pytest.fixture
+def core_profiler(tmp_path):
+    CORE.config_path = str(tmp_path / "test.yaml")
+    CORE.profiler = profiler.Profiler("compile")
+    yield CORE.profiler
+    CORE.profiler = None
+    CORE.reset()
+
+
+def test_profiler__phases(core_profiler):
+    with profiler.profile_phase("read_config"):
+        with profiler.profile_phase("load_yaml"):
+            pass
+        with profiler.profile_component("validation", "sensor.template"):
+            pass
+    with pytest.raises(ValueError):
+        with profiler.profile_phase("compile"):
+            raise ValueError
+
+    report = core_profiler.report(exit_code=0)
+
+    assert [phase["name"] for phase in report["phases"]] == ["read_config", "compile"]
+    assert [phase["name"] for phase in report["phases"][0]["phases"]] == ["load_yaml"]
+    assert "phases" not in report["phases"][1]
+    assert set(report["phases"][0]) == {"name", "wall", "cpu", "phases"}
+    assert list(report["components"]) == ["sensor.template"]
+    assert set(report["components"]["sensor.template"]["validation"]) == {"wall", "cpu"}
+
+
+def test_profiler__tasks(core_profiler):
+    def to_code():
+        yield
+        yield
+
+    def other():
+        yield
+
+    task = CORE.add_job(to_code)
+    core_profiler.add_task(task, "logger")
+    CORE.add_job(other)
+
+    CORE.flush_tasks()
+
+    assert list(core_profiler.report()["components"]) == ["logger"]
+    assert set(core_profiler.report()["components"]["logger"]) == {"to_code"}
+
+
+def test_profiler__save(core_profiler, tmp_path):
+    with profiler.profile_phase("read_config"):
+        pass
+
+    core_profiler.save(exit_code=1)
+
+    path = tmp_path / ".esphome" / "test.yaml.profile.json"
+    assert profiler.profile_path() == str(path)
+    assert profiler.ext_profile_path(str(tmp_path), "test.yaml") == str(path)
+    report = profiler.load_profile(str(path))
+    assert report["command"] == "compile"
+    assert report["exit_code"] == 1
+    assert report["phases"][0]["name"] == "read_config"
+
+    path.write_text(json.dumps({**report, "profile_version": 0}))
+    assert profiler.load_profile(str(path)) is None
+    assert profiler.load_profile(str(tmp_path / "missing.json")) is None
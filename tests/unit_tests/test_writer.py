@@ -0,0 +1,217 @@
+import os
+import tracemalloc
+
+import pytest
+
+from esphome import __main__ as esphome_main
+from esphome import config
+from esphome import cpp_generator as cg
+from esphome import writer
+from esphome.core import CORE
+from esphome.helpers import indent
+
+
+@pytest.fixture
+def main_cpp(tmp_path, monkeypatch):
+    monkeypatch.setattr(writer, "copy_src_tree", lambda manifest: None)
+    CORE.config_path = str(tmp_path / "test.yaml")
+    CORE.build_path = str(tmp_path)
+    yield tmp_path / "src" / "main.cpp"
+    CORE.reset()
+
+
+def _expected(code_format=writer.CPP_BASE_FORMAT):
+    """main.cpp as it was built before it was streamed."""
+    global_s = '#include "esphome.h"\n' + CORE.cpp_global_section
+    code_s = indent(CORE.cpp_main_section)
+    return (code_format[0] + writer.CPP_INCLUDE_BEGIN + "\n" + global_s + writer.CPP_INCLUDE_END
+            + code_format[1] + writer.CPP_AUTO_GENERATE_BEGIN + "\n" + code_s
+            + writer.CPP_AUTO_GENERATE_END + code_format[2])
+
+
+@pytest.mark.parametrize("global_statements, main_statements", (
+    ([], []),
+    (["int a;"], ["a = 1;"]),
+    (["int a;", "", "int b;  "], ["", "if (a) {\n  b = 1;\n}\n", "\n\nb = 2;", ""]),
+))
+def test_write_cpp__same_as_joined(main_cpp, global_statements, main_statements):
+    for text in global_statements:
+        CORE.add_global(cg.RawStatement(text))
+    for text in main_statements:
+        CORE.add(cg.RawStatement(text))
+
+    writer.write_cpp()
+
+    assert main_cpp.read_text() == _expected()
+
+
+def test_write_cpp__keeps_user_code(main_cpp):
+    CORE.add(cg.RawStatement("a = 1;"))
+    writer.write_cpp()
+    main_cpp.write_text(main_cpp.read_text().replace("void setup() {", "// user\nvoid setup() {"))
+    CORE.add(cg.RawStatement("b = 2;"))
+
+    writer.write_cpp()
+
+    text = main_cpp.read_text()
+    assert "// user\nvoid setup() {" in text
+    assert "  a = 1;\n  b = 2;\n" in text
+
+
+def test_write_cpp__unchanged_not_replaced(main_cpp):
+    CORE.add(cg.RawStatement("a = 1;"))
+    writer.write_cpp()
+    inode = main_cpp.stat().st_ino
+
+    writer.write_cpp()
+
+    assert main_cpp.stat().st_ino == inode
+
+
+def test_write_cpp__peak_memory(main_cpp):
+    count = 2000
+    for i in range(count):
+        CORE.add(cg.RawStatement(f"// {i:05}\n" + "x" * 1000))
+
+    tracemalloc.start()
+    try:
+        writer.write_cpp()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    size = main_cpp.stat().st_size
+    assert size > count * 1000
+    # Joining the code needs several copies of the whole file, streaming only a few statements
+    assert peak < size / 10
+
+
+class _Component:
+    def __init__(self, source_files):
+        self.source_files = source_files
+
+
+@pytest.fixture
+def src_tree(tmp_path, monkeypatch):
+    """Source files of a fake component and the function copying them to the build directory."""
+    sources = tmp_path / "sources"
+    sources.mkdir()
+    for name in ("defines.h", "a.h", "a.cpp", "b.cpp"):
+        (sources / name).write_text(f"// {name}\n")
+    source_files = {
+        writer.DEFINES_H_TARGET: str(sources / "defines.h"),
+        "esphome/components/a/a.h": str(sources / "a.h"),
+        "esphome/components/a/a.cpp": str(sources / "a.cpp"),
+        "esphome/components/a/b.cpp": str(sources / "b.cpp"),
+    }
+    monkeypatch.setattr(writer, "iter_components",
+                        lambda config: [("a", _Component(source_files), {})])
+    CORE.config_path = str(tmp_path / "test.yaml")
+    CORE.build_path = str(tmp_path / "build")
+
+    def copy_src_tree():
+        manifest = writer.SourceManifest(writer._src_manifest_path())
+        writer.copy_src_tree(manifest)
+        manifest.save()
+
+    yield sources, tmp_path / "build" / "src", source_files, copy_src_tree
+    CORE.reset()
+
+
+def _mtimes(directory):
+    return {str(path.relative_to(directory)): path.stat().st_mtime_ns
+            for path in directory.rglob("*") if path.is_file()}
+
+
+def test_copy_src_tree__unchanged_not_read(src_tree, monkeypatch):
+    sources, src, _, copy_src_tree = src_tree
+    copy_src_tree()
+    assert (src / "esphome" / "components" / "a" / "a.cpp").read_text() == "// a.cpp\n"
+    assert '#include "esphome/components/a/a.h"' in (src / "esphome.h").read_text()
+    mtimes = _mtimes(src)
+
+    monkeypatch.setattr(writer, "file_hash", None)
+    monkeypatch.setattr(writer, "copy_file_if_changed", None)
+    monkeypatch.setattr(writer, "write_file_if_changed", None)
+    copy_src_tree()
+
+    assert _mtimes(src) == mtimes
+
+
+def test_copy_src_tree__changed_sources(src_tree):
+    sources, src, source_files, copy_src_tree = src_tree
+    copy_src_tree()
+    mtimes = _mtimes(src)
+    # Only the mtime of a.h changes, the contents of a.cpp and the list of sources
+    os.utime(sources / "a.h", ns=(0, 0))
+    (sources / "a.cpp").write_text("// changed\n")
+    del source_files["esphome/components/a/b.cpp"]
+
+    copy_src_tree()
+
+    component = src / "esphome" / "components" / "a"
+    assert (component / "a.cpp").read_text() == "// changed\n"
+    assert (component / "a.h").stat().st_mtime_ns == mtimes["esphome/components/a/a.h"]
+    assert not (component / "b.cpp").exists()
+    assert (src / "esphome.h").stat().st_mtime_ns == mtimes["esphome.h"]
+
+
+def test_copy_src_tree__build_directory_changed(src_tree):
+    _, src, _, copy_src_tree = src_tree
+    copy_src_tree()
+    target = src / "esphome" / "components" / "a" / "a.cpp"
+    target.write_text("// edited\n")
+    (src / "esphome.h").unlink()
+
+    copy_src_tree()
+
+    assert target.read_text() == "// a.cpp\n"
+    assert (src / "esphome.h").is_file()
+
+
+REPRODUCIBLE_CONFIG = """
+esphome:
+  name: test
+  platform: ESP8266
+  board: nodemcuv2
+
+sensor:
+  - platform: template
+    name: Sensor
+    lambda: return {};
+"""
+
+
+@pytest.fixture
+def generate_reproducible():
+    """Generate the sources of a config in a directory with --reproducible, return them."""
+    def generate(directory, value=1.0):
+        directory.mkdir(exist_ok=True)
+        path = directory / "test.yaml"
+        path.write_text(REPRODUCIBLE_CONFIG.format(value))
+        CORE.reset()
+        CORE.reproducible = True
+        CORE.config_path = str(path)
+        CORE.config = config.read_config({})
+        esphome_main.write_cpp(CORE.config)
+        build = directory / "test"
+        return {str(file.relative_to(build)): file.read_bytes() for file in build.rglob("*")
+                if file.is_file() and file.suffix != ".json"}
+
+    yield generate
+    CORE.reproducible = False
+    CORE.reset()
+
+
+def test_write_cpp__reproducible(generate_reproducible, tmp_path):
+    first = generate_reproducible(tmp_path / "a")
+    second = generate_reproducible(tmp_path / "b")
+    changed = generate_reproducible(tmp_path / "a", value=2.0)
+
+    assert first == second
+    main_cpp = first["src/main.cpp"].decode()
+    assert "__DATE__" not in main_cpp
+    assert 'App.pre_setup("test", ESPHOME_BUILD_ID);' in main_cpp
+    build_id = main_cpp.split("#define ESPHOME_BUILD_ID ")[1].split("\n")[0]
+    assert build_id not in changed["src/main.cpp"].decode()
+    assert changed["src/esphome/core/application.h"] == first["src/esphome/core/application.h"]
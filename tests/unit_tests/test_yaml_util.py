@@ -0,0 +1,320 @@
+import pytest
+
+from esphome import yaml_util
+from esphome.core import EsphomeError, Lambda
+from esphome.helpers import read_file
+
+
+def _load_with(loader_type, path):
+    path = str(path)
+    return yaml_util._load_yaml_internal_with_type(loader_type, path, read_file(path))
+
+
+def _flatten(value, path=()):
+    """Yield (path, type, value, source range) for every node of a loaded document."""
+    doc_range = None
+    if isinstance(value, yaml_util.ESPHomeDataBase) and value.esp_range is not None:
+        start, end = value.esp_range.start_mark, value.esp_range.end_mark
+        doc_range = (start.document, start.line, start.column, end.line, end.column)
+    if isinstance(value, dict):
+        yield path, type(value), None, doc_range
+        for key, item in value.items():
+            yield from _flatten(item, path + (key,))
+    elif isinstance(value, list):
+        yield path, type(value), None, doc_range
+        for i, item in enumerate(value):
+            yield from _flatten(item, path + (i,))
+    else:
+        yield path, type(value), str(value), doc_range
+
+
+def _ranges(value, path=()):
+    """Yield (path, source range) for every node of a loaded document, in any location mode."""
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, list):
+        items = enumerate(value)
+    else:
+        return
+    for key, item in items:
+        doc_range = yaml_util.get_document_range(value, key)
+        if doc_range is not None:
+            start, end = doc_range.start_mark, doc_range.end_mark
+            doc_range = (start.document, start.line, start.column, end.line, end.column)
+        yield path + (key,), doc_range
+        yield from _ranges(item, path + (key,))
+
+
+@pytest.fixture
+def yaml_path(fixture_path):
+    return fixture_path / "yaml_util"
+
+
+def test_loader__custom_tags(yaml_path, monkeypatch):
+    monkeypatch.setenv("ESPHOME_YAML_UTIL_TEST_VAR", "from env")
+
+    actual = yaml_util.load_yaml(str(yaml_path / "tags.yaml"))
+
+    assert actual["merged"] == {"name": "base", "value": 2}
+    assert actual["merged_list"] == {"a": 1, "b": 3}
+    assert isinstance(actual["lambda"], Lambda)
+    assert actual["lambda"].value == "return 42;"
+    assert isinstance(actual["forced"], yaml_util.ESPForceValue)
+    assert actual["env"] == "from env"
+    assert actual["password"] == "hunter2"
+    assert yaml_util.is_secret("hunter2") == "wifi_password"
+    assert actual["included"] == {"key": "value", "nested": ["one", "two"]}
+    assert actual["named"] == {"included": actual["included"]}
+    assert actual["list"] == [1, 1.5, "text"]
+
+
+@pytest.mark.parametrize("filename", ("tags.yaml", "../../../test1.yaml"))
+def test_loader__c_and_python_loader_identical(yaml_path, filename):
+    path = yaml_path / filename
+
+    fast = _load_with(yaml_util.ESPHomeLoader, path)
+    pure = _load_with(yaml_util.ESPHomePurePythonLoader, path)
+
+    assert list(_flatten(fast)) == list(_flatten(pure))
+
+
+def test_loader__esp_range(yaml_path):
+    path = str(yaml_path / "tags.yaml")
+
+    actual = yaml_util.load_yaml(path)
+
+    doc_range = actual["merged"]["value"].esp_range
+    assert doc_range.start_mark.document == path
+    assert (doc_range.start_mark.line, doc_range.start_mark.column) == (5, 9)
+    included = actual["included"]["key"].esp_range
+    assert included.start_mark.document == str(yaml_path / "includes" / "included.yaml")
+
+
+def test_loader__duplicate_key(yaml_path):
+    with pytest.raises(EsphomeError, match='Duplicate key "key"'):
+        yaml_util.load_yaml(str(yaml_path / "duplicate.yaml"))
+
+
+@pytest.fixture
+def cached_yaml_path(yaml_path, tmp_path):
+    import shutil
+
+    target = tmp_path / "config"
+    shutil.copytree(str(yaml_path), str(target))
+    return target
+
+
+def _load_cached(path, cache_dir, caplog):
+    caplog.clear()
+    with caplog.at_level("DEBUG", logger="esphome.yaml_util"):
+        value = yaml_util.load_yaml(str(path), cache_dir=str(cache_dir))
+    return value, [r.getMessage() for r in caplog.records if "YAML cache:" in r.getMessage()]
+
+
+def test_yaml_cache__hit(cached_yaml_path, tmp_path, caplog, monkeypatch):
+    monkeypatch.setenv("ESPHOME_YAML_UTIL_TEST_VAR", "from env")
+    path = cached_yaml_path / "tags.yaml"
+    cache_dir = tmp_path / "cache"
+
+    first, stats = _load_cached(path, cache_dir, caplog)
+    # included.yaml is loaded twice, the second load is already served from the cache
+    assert stats == ["YAML cache: 1 hits, 3 misses"]
+    second, stats = _load_cached(path, cache_dir, caplog)
+    assert stats == ["YAML cache: 1 hits, 0 misses"]
+
+    assert list(_flatten(first)) == list(_flatten(second))
+    assert yaml_util.is_secret("hunter2") == "wifi_password"
+    assert isinstance(second["forced"], yaml_util.ESPForceValue)
+    assert second["lambda"].value == "return 42;"
+
+
+@pytest.mark.parametrize("change", ("include", "secret", "env_var", "directory"))
+def test_yaml_cache__invalidated(cached_yaml_path, tmp_path, caplog, monkeypatch, change):
+    monkeypatch.setenv("ESPHOME_YAML_UTIL_TEST_VAR", "from env")
+    path = cached_yaml_path / "tags.yaml"
+    cache_dir = tmp_path / "cache"
+    _load_cached(path, cache_dir, caplog)
+
+    if change == "include":
+        (cached_yaml_path / "includes" / "included.yaml").write_text("key: changed\n")
+    elif change == "secret":
+        (cached_yaml_path / "secrets.yaml").write_text("wifi_password: correct horse\n")
+    elif change == "env_var":
+        monkeypatch.setenv("ESPHOME_YAML_UTIL_TEST_VAR", "changed")
+    else:
+        (cached_yaml_path / "includes" / "other.yaml").write_text("other: 1\n")
+
+    actual, stats = _load_cached(path, cache_dir, caplog)
+
+    assert "0 misses" not in stats[0]
+    expected = yaml_util.load_yaml(str(path))
+    assert list(_flatten(actual)) == list(_flatten(expected))
+
+
+def test_secrets__directory_chain(yaml_path):
+    actual = yaml_util.load_yaml(str(yaml_path / "chain.yaml"))
+
+    assert actual["sub"] == {"password": "hunter2", "api_key": "sub-key"}
+    assert yaml_util.is_secret("hunter2") == "wifi_password"
+    assert yaml_util.is_secret("sub-key") == "api_key"
+
+
+def test_secrets__file_parsed_once(tmp_path, monkeypatch):
+    (tmp_path / "secrets.yaml").write_text("".join(f"secret_{i}: value {i}\n" for i in range(20)))
+    (tmp_path / "main.yaml").write_text("".join(f"key_{i}: !secret secret_{i}\n" for i in range(20)))
+    loaded = []
+    original = yaml_util._load_yaml_internal
+
+    def load(fname):
+        loaded.append(fname)
+        return original(fname)
+
+    monkeypatch.setattr(yaml_util, "_load_yaml_internal", load)
+
+    actual = yaml_util.load_yaml(str(tmp_path / "main.yaml"))
+
+    assert actual["key_19"] == "value 19"
+    assert loaded == [str(tmp_path / "main.yaml"), str(tmp_path / "secrets.yaml")]
+    assert yaml_util.is_secret("value 7") == "secret_7"
+
+
+def test_secrets__not_defined(tmp_path):
+    (tmp_path / "main.yaml").write_text("key: !secret missing\n")
+
+    with pytest.raises(EsphomeError, match="Secret 'missing' not defined"):
+        yaml_util.load_yaml(str(tmp_path / "main.yaml"))
+
+
+def test_yaml_cache__new_secrets_file(tmp_path, caplog):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "secrets.yaml").write_text("password: root\n")
+    (tmp_path / "sub" / "sub.yaml").write_text("password: !secret password\n")
+    (tmp_path / "main.yaml").write_text("sub: !include sub/sub.yaml\n")
+    path = tmp_path / "main.yaml"
+    cache_dir = tmp_path / "cache"
+    first, _ = _load_cached(path, cache_dir, caplog)
+
+    (tmp_path / "sub" / "secrets.yaml").write_text("password: sub\n")
+    second, stats = _load_cached(path, cache_dir, caplog)
+
+    assert first["sub"]["password"] == "root"
+    assert second["sub"]["password"] == "sub"
+    assert "0 misses" not in stats[0]
+
+
+def test_yaml_cache__shared_include(tmp_path, caplog):
+    for name, password in (("a", "AAA"), ("b", "BBB")):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "secrets.yaml").write_text(f"wifi_password: {password}\n")
+        (tmp_path / name / "node.yaml").write_text("wifi: !include ../common/wifi.yaml\n")
+    (tmp_path / "common").mkdir()
+    (tmp_path / "common" / "wifi.yaml").write_text("password: !secret wifi_password\n")
+    cache_dir = tmp_path / "cache"
+
+    first, _ = _load_cached(tmp_path / "a" / "node.yaml", cache_dir, caplog)
+    second, _ = _load_cached(tmp_path / "b" / "node.yaml", cache_dir, caplog)
+    again, stats = _load_cached(tmp_path / "b" / "node.yaml", cache_dir, caplog)
+
+    # The secrets of the include are looked up in the directory of each config
+    assert first["wifi"]["password"] == "AAA"
+    assert second["wifi"]["password"] == "BBB"
+    assert again["wifi"]["password"] == "BBB"
+    assert stats == ["YAML cache: 1 hits, 0 misses"]
+
+
+@pytest.mark.parametrize("filename", ("tags.yaml", "../../../test1.yaml"))
+def test_compact_locations__same_ranges(yaml_path, filename):
+    path = str(yaml_path / filename)
+
+    default = yaml_util.load_yaml(path)
+    expected = list(_ranges(default))
+    compact = yaml_util.load_yaml(path, compact_locations=True)
+
+    actual = list(_ranges(compact))
+
+    assert [p for p, _ in actual] == [p for p, _ in expected]
+    # Compact locations also cover values that can't be subclassed, like booleans
+    assert all(e_range is None or a_range == e_range
+               for (_, a_range), (_, e_range) in zip(actual, expected))
+    assert all(a_range is not None for _, a_range in actual)
+    assert [(p, v) for p, _, v, _ in _flatten(compact)] == \
+        [(p, v) for p, _, v, _ in _flatten(default)]
+
+
+def test_compact_locations__plain_values(yaml_path):
+    actual = yaml_util.load_yaml(str(yaml_path / "tags.yaml"), compact_locations=True)
+
+    assert type(actual["merged"]["name"]) is str
+    assert type(actual["list"][0]) is int
+    assert type(actual["list"]) is list
+    assert isinstance(actual["forced"], yaml_util.ESPForceValue)
+    assert not isinstance(actual["forced"], yaml_util.ESPHomeDataBase)
+
+
+def test_compact_locations__cached(cached_yaml_path, tmp_path, caplog, monkeypatch):
+    monkeypatch.setenv("ESPHOME_YAML_UTIL_TEST_VAR", "from env")
+    path = str(cached_yaml_path / "tags.yaml")
+    cache_dir = str(tmp_path / "cache")
+    expected = list(_ranges(yaml_util.load_yaml(path, compact_locations=True)))
+
+    yaml_util.load_yaml(path, cache_dir=cache_dir, compact_locations=True)
+    caplog.clear()
+    with caplog.at_level("DEBUG", logger="esphome.yaml_util"):
+        actual = yaml_util.load_yaml(path, cache_dir=cache_dir, compact_locations=True)
+
+    assert "YAML cache: 1 hits, 0 misses" in caplog.text
+    assert list(_ranges(actual)) == expected
+    assert type(actual["merged"]["name"]) is str
+
+
+def _not_dumped(value):
+    raise AssertionError(f"{value} dumped again")
+
+
+def test_dump_cache__reused(cached_yaml_path, tmp_path, monkeypatch):
+    monkeypatch.setenv("ESPHOME_YAML_UTIL_TEST_VAR", "from env")
+    config = yaml_util.load_yaml(str(cached_yaml_path / "tags.yaml"))
+    values = [config, config["merged"], config["list"]]
+    expected = [yaml_util.dump(value) for value in values]
+    path = str(tmp_path / "dumps.bin")
+    cache = yaml_util.DumpCache(path)
+    assert [cache.dump(value) for value in values] == expected
+    cache.save()
+
+    monkeypatch.setattr(yaml_util, "dump", _not_dumped)
+    cache = yaml_util.DumpCache(path)
+
+    assert [cache.dump(value) for value in values] == expected
+    assert "password: !secret 'wifi_password'" in expected[0]
+
+
+def test_dump_cache__reloaded(cached_yaml_path, tmp_path, monkeypatch):
+    monkeypatch.setenv("ESPHOME_YAML_UTIL_TEST_VAR", "from env")
+    config = yaml_util.load_yaml(str(cached_yaml_path / "tags.yaml"))
+    expected = yaml_util.dump(config)
+    path = str(tmp_path / "dumps.bin")
+    cache = yaml_util.DumpCache(path)
+    cache.dump(config)
+    cache.save()
+
+    monkeypatch.setattr(yaml_util, "dump", _not_dumped)
+    cache = yaml_util.DumpCache(path)
+
+    # Equal values that aren't the same objects
+    assert cache.dump(yaml_util.load_yaml(str(cached_yaml_path / "tags.yaml"))) == expected
+
+
+def test_dump_cache__secrets_changed(tmp_path, monkeypatch):
+    (tmp_path / "secrets.yaml").write_text("wifi_password: hunter2\n")
+    (tmp_path / "main.yaml").write_text("password: !secret wifi_password\n")
+    config = yaml_util.load_yaml(str(tmp_path / "main.yaml"))
+    path = str(tmp_path / "dumps.bin")
+    cache = yaml_util.DumpCache(path)
+    assert cache.dump(config) == "password: !secret 'wifi_password'\n"
+    cache.save()
+
+    # The same value isn't a secret anymore
+    monkeypatch.delitem(yaml_util._SECRET_VALUES, "hunter2")
+    cache = yaml_util.DumpCache(path)
+
+    assert cache.dump(config) == "password: hunter2\n"